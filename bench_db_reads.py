@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк смешанной нагрузки: чтение каталога из потоков во время продаж.
+
+Сравнивает прежний режим (соединение на каждый вызов, журнал DELETE) с пулом
+соединений только для чтения и WAL, а также с хранилищем в памяти (STORAGE_BACKEND=memory).
+
+Запуск: python bench_db_reads.py [секунд_на_замер] [потоков_чтения]
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import threading
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.database import Database
+from database.memory import MemoryDatabase
+
+LOTS = 20
+
+
+def read_catalog(db):
+    for account_id, _, _ in db.get_available_accounts():
+        db.count_available_credentials(account_id)
+        db.get_queue_size(account_id)
+
+
+def run_mixed(db, lot_ids, seconds, readers):
+    stop = threading.Event()
+    reads = [0] * readers
+    writes = [0]
+    errors = []
+
+    def reader(n):
+        while not stop.is_set():
+            try:
+                read_catalog(db)
+                reads[n] += 1
+            except sqlite3.Error as e:
+                errors.append(e)
+
+    def writer():
+        i = 0
+        while not stop.is_set():
+            account_id = lot_ids[i % len(lot_ids)]
+            db.add_credential(account_id, f"bench{i}:pass")
+            db.mark_account_sold(account_id, 1000 + i, 1.0)
+            writes[0] += 2
+            i += 1
+
+    threads = [threading.Thread(target=reader, args=(n,)) for n in range(readers)]
+    threads.append(threading.Thread(target=writer))
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sum(reads) / seconds, writes[0] / seconds, len(errors)
+
+
+def prepare(db):
+    lot_ids = [db.add_account(f"Bench lot {n}", 1.0) for n in range(LOTS)]
+    for account_id in lot_ids:
+        for i in range(10):
+            db.add_credential(account_id, f"seed{i}:pass")
+    return lot_ids
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3
+    readers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    print(f"📊 {readers} потоков чтения каталога ({LOTS} лотов) + 1 поток продаж, {seconds:.0f} с на замер\n")
+
+    db_file = 'bench_db_reads.db'
+    db = Database(db_file, read_pool_size=0)
+    conn = sqlite3.connect(db_file)
+    conn.execute('PRAGMA journal_mode = DELETE')
+    conn.close()
+    try:
+        lot_ids = prepare(db)
+        catalogs, writes, errors = run_mixed(db, lot_ids, seconds, readers)
+        print(f"Соединение на вызов, журнал DELETE: {catalogs:7.0f} каталогов/с, {writes:6.0f} записей/с, ошибок {errors}")
+    finally:
+        db.close()
+        os.remove(db_file)
+
+    db = Database(db_file, read_pool_size=readers)
+    try:
+        lot_ids = prepare(db)
+        catalogs, writes, errors = run_mixed(db, lot_ids, seconds, readers)
+        print(f"Пул чтения query_only, WAL:         {catalogs:7.0f} каталогов/с, {writes:6.0f} записей/с, ошибок {errors}")
+    finally:
+        db.close()
+        os.remove(db_file)
+
+    db = MemoryDatabase()
+    lot_ids = prepare(db)
+    catalogs, writes, errors = run_mixed(db, lot_ids, seconds, readers)
+    print(f"Хранилище в памяти:                 {catalogs:7.0f} каталогов/с, {writes:6.0f} записей/с, ошибок {errors}")
+
+
+if __name__ == "__main__":
+    main()
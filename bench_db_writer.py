@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк скорости записи в БД: отдельный коммит на запись против группового коммита.
+
+Запуск: python bench_db_writer.py [количество_записей] [одновременных_клиентов]
+"""
+
+import os
+import sys
+import time
+import asyncio
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.database import Database
+from services.db_writer import DatabaseWriter
+
+
+def bench_direct(db, account_id, writes):
+    started = time.perf_counter()
+    for i in range(writes):
+        db.add_credential(account_id, f"direct{i}:pass")
+    return writes / (time.perf_counter() - started)
+
+
+async def bench_writer(db, account_id, writes, clients, max_batch):
+    writer = DatabaseWriter(db, max_batch=max_batch)
+    writer.start()
+
+    async def client(n):
+        for i in range(writes // clients):
+            await writer.add_credential(account_id, f"writer{n}_{i}:pass")
+
+    started = time.perf_counter()
+    await asyncio.gather(*[client(n) for n in range(clients)])
+    elapsed = time.perf_counter() - started
+    stats = writer.stats()
+    await writer.stop()
+    return stats['writes'] / elapsed, stats['writes_per_commit']
+
+
+def main():
+    writes = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    db_file = 'bench_db_writer.db'
+    db = Database(db_file)
+    try:
+        account_id = db.add_account("Benchmark lot", 1.0)
+        print(f"📊 {writes} записей, {clients} одновременных клиентов\n")
+
+        rate = bench_direct(db, account_id, writes)
+        print(f"Отдельное соединение и коммит на запись: {rate:8.0f} записей/с")
+
+        rate, per_commit = asyncio.run(bench_writer(db, account_id, writes, clients, max_batch=1))
+        print(f"Писатель без группировки:               {rate:8.0f} записей/с ({per_commit:.1f} на коммит)")
+
+        rate, per_commit = asyncio.run(bench_writer(db, account_id, writes, clients, max_batch=256))
+        print(f"Писатель с групповым коммитом:          {rate:8.0f} записей/с ({per_commit:.1f} на коммит)")
+    finally:
+        os.remove(db_file)
+
+
+if __name__ == "__main__":
+    main()
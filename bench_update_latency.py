@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк задержки «обновление → ответ» в режимах polling и webhook.
+
+Поднимает локальный фейковый Bot API (aiohttp), подключает к нему Application
+с простым обработчиком и измеряет время от появления обновления до получения
+фейковым API вызова sendMessage.
+
+Запуск: python bench_update_latency.py [количество_обновлений]
+"""
+
+import sys
+import time
+import asyncio
+import statistics
+
+from aiohttp import web, ClientSession
+from telegram import Update
+from telegram.ext import Application, MessageHandler, ContextTypes, filters
+
+TOKEN = "123456:BENCH"
+API_PORT = 18081
+WEBHOOK_PORT = 18082
+WEBHOOK_PATH = "hook"
+SECRET = "bench-secret"
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
+
+
+class FakeBotApi:
+    """Минимальная реализация Bot API: getMe, getUpdates, setWebhook, deleteWebhook, sendMessage"""
+
+    def __init__(self):
+        self.updates = []
+        self.new_update = asyncio.Event()
+        self.replies = {}
+        self.reply_waiters = {}
+
+    def make_update(self, update_id: int) -> dict:
+        return {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": 100, "type": "private"},
+                "from": {"id": 100, "is_bot": False, "first_name": "Bench"},
+                "text": f"ping {update_id}",
+            },
+        }
+
+    def push_update(self, update: dict) -> None:
+        self.updates.append(update)
+        self.new_update.set()
+
+    def wait_reply(self, update_id: int) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self.reply_waiters[update_id] = future
+        return future
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = dict(await request.post())
+
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        elif method in ("setWebhook", "deleteWebhook"):
+            result = True
+        elif method == "getUpdates":
+            offset = int(params.get("offset") or 0)
+            timeout = float(params.get("timeout") or 0)
+            self.updates = [u for u in self.updates if u["update_id"] >= offset]
+            if not self.updates and timeout:
+                self.new_update.clear()
+                try:
+                    await asyncio.wait_for(self.new_update.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            result = [u for u in self.updates if u["update_id"] >= offset]
+        elif method == "sendMessage":
+            text = params.get("text", "")
+            update_id = int(text.split()[-1])
+            future = self.reply_waiters.pop(update_id, None)
+            if future and not future.done():
+                future.set_result(time.perf_counter())
+            result = {
+                "message_id": update_id + 1000000,
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 100)), "type": "private"},
+                "text": text,
+            }
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+
+async def echo(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text(f"pong {update.update_id}")
+
+
+def build_application() -> Application:
+    application = (
+        Application.builder()
+        .token(TOKEN)
+        .base_url(f"http://127.0.0.1:{API_PORT}/bot")
+        .base_file_url(f"http://127.0.0.1:{API_PORT}/file/bot")
+        .build()
+    )
+    application.add_handler(MessageHandler(filters.TEXT, echo))
+    return application
+
+
+async def measure(mode: str, api: FakeBotApi, count: int, first_id: int) -> list:
+    application = build_application()
+    await application.initialize()
+    await application.start()
+    if mode == "polling":
+        await application.updater.start_polling(poll_interval=0.0, timeout=10, allowed_updates=ALLOWED_UPDATES)
+    else:
+        await application.updater.start_webhook(
+            listen="127.0.0.1",
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"http://127.0.0.1:{WEBHOOK_PORT}/{WEBHOOK_PATH}",
+            secret_token=SECRET,
+            allowed_updates=ALLOWED_UPDATES,
+        )
+
+    latencies = []
+    async with ClientSession() as session:
+        for update_id in range(first_id, first_id + count):
+            update = api.make_update(update_id)
+            reply = api.wait_reply(update_id)
+            started = time.perf_counter()
+            if mode == "polling":
+                api.push_update(update)
+            else:
+                async with session.post(
+                    f"http://127.0.0.1:{WEBHOOK_PORT}/{WEBHOOK_PATH}",
+                    json=update,
+                    headers={"X-Telegram-Bot-Api-Secret-Token": SECRET},
+                ) as resp:
+                    assert resp.status == 200, resp.status
+            finished = await asyncio.wait_for(reply, 10)
+            latencies.append((finished - started) * 1000)
+
+    await application.updater.stop()
+    await application.stop()
+    await application.shutdown()
+    return latencies
+
+
+def report(mode: str, latencies: list) -> None:
+    ordered = sorted(latencies)
+    p95 = ordered[int(len(ordered) * 0.95) - 1]
+    print(
+        f"{mode:8s} n={len(ordered)}  mean={statistics.mean(ordered):.2f} ms  "
+        f"p50={statistics.median(ordered):.2f} ms  p95={p95:.2f} ms  max={ordered[-1]:.2f} ms"
+    )
+
+
+async def main(count: int):
+    api = FakeBotApi()
+    app = web.Application()
+    app.router.add_route("*", "/bot{token}/{method}", api.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", API_PORT).start()
+
+    try:
+        print(f"⏱ Задержка обновление → ответ, {count} обновлений на режим\n")
+        report("polling", await measure("polling", api, count, first_id=1))
+        report("webhook", await measure("webhook", api, count, first_id=count + 1))
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
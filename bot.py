@@ -1,12 +1,34 @@
 import os
 import json
 import ssl
+import asyncio
+import hashlib
 import logging
+import tempfile
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton, InputFile
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, filters
+from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, TypeHandler, ContextTypes, filters
+from telegram.error import BadRequest
+from telegram.helpers import escape_markdown
 from dotenv import load_dotenv
-from database.database import Database
+from database.storage import create_storage
 from payments.cryptobot import CryptoBot
+from services.state_store import StateStore, ScopedState
+from services.concurrency import KeyedUpdateProcessor
+from services.dispatcher import OutboundDispatcher, PRIORITY_DELIVERY, PRIORITY_NOTIFICATION
+from services.delivery_sender import DeliverySender
+from services.fulfilment import RefillCoalescer
+from services.media import MediaRegistry
+from services.tiktok_links import extract_tiktok_link, normalize_tiktok_link, link_hash
+from services.link_verifier import LinkVerifier
+from services.activity import ActivityTracker
+from services.broadcast import BroadcastRunner
+from services.reports import ReportCancelled, ReportRunner
+from services.alerts import (
+    AlertAggregator, ALERT_DEPLETED, ALERT_QUEUE_GROWTH, ALERT_GIFT_REQUEST, ALERT_QUEUE_PROCESSED
+)
 
 # Enable logging
 logging.basicConfig(
@@ -22,8 +44,88 @@ ADMIN_USERNAME = os.getenv('ADMIN_USERNAME')
 ADMIN_USER_ID = os.getenv('ADMIN_USER_ID')  # optional numeric user id as string
 PAYMENT_CONTACT = '@eqtexw'
 
-# Initialize database
-db = Database('accounts.db')
+# Хранилище: SQLite (по умолчанию) или всё в памяти с периодическими снимками на диск
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'sqlite').strip().lower()
+STORAGE_SNAPSHOT_PATH = os.getenv('STORAGE_SNAPSHOT_PATH', 'accounts.snapshot')
+# Снимок сериализуется под блокировкой хранилища: все обработчики ждут его
+# (порядка секунды на миллион строк), поэтому для больших хранилищ интервал стоит увеличить
+STORAGE_SNAPSHOT_INTERVAL = float(os.getenv('STORAGE_SNAPSHOT_INTERVAL', '60'))
+db = create_storage(
+    STORAGE_BACKEND,
+    'accounts.db',
+    read_pool_size=int(os.getenv('DB_READ_POOL_SIZE', '4')),
+    snapshot_path=STORAGE_SNAPSHOT_PATH
+)
+
+# Записи горячего пути идут через одно соединение и группируются в общие транзакции
+# (в памяти группировать нечего — записи применяются сразу)
+db_writer = db.create_writer(max_batch=int(os.getenv('DB_WRITE_BATCH', '256')))
+
+# Эфемерное состояние: неоплаченные заказы и шаги диалогов (с TTL и лимитом размера)
+pending_payments = StateStore(
+    'payments',
+    max_entries=int(os.getenv('PAYMENT_STATE_MAX_ENTRIES', '20000')),
+    default_ttl=float(os.getenv('PAYMENT_STATE_TTL', '86400'))
+)
+user_flows = StateStore(
+    'user_flows',
+    max_entries=int(os.getenv('FLOW_STATE_MAX_ENTRIES', '20000')),
+    default_ttl=float(os.getenv('FLOW_STATE_TTL', '3600'))
+)
+STATE_SWEEP_INTERVAL = float(os.getenv('STATE_SWEEP_INTERVAL', '300'))
+
+# Заявки на подарок: у пользователя может быть только одна ожидающая заявка,
+# повторные отправки ограничены по частоте — обе проверки без обращения к БД
+pending_gift_users = set(db.get_pending_gift_user_ids())
+gift_submit_cooldown = StateStore(
+    'gift_cooldown',
+    max_entries=int(os.getenv('FLOW_STATE_MAX_ENTRIES', '20000')),
+    default_ttl=float(os.getenv('GIFT_SUBMIT_COOLDOWN', '60'))
+)
+
+# Учёт пользователей: активность копится в памяти и пишется в БД пачками
+activity = ActivityTracker(db, flush_interval=float(os.getenv('ACTIVITY_FLUSH_SECONDS', '5')))
+
+# Режим получения обновлений: polling (по умолчанию) или webhook
+BOT_MODE = os.getenv('BOT_MODE', 'polling').strip().lower()
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '').rstrip('/')  # Публичный адрес, например https://app.up.railway.app
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT') or os.getenv('PORT') or '8080')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '').strip('/')  # По умолчанию выводится из токена
+WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN')
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+
+# Бот обрабатывает только сообщения и нажатия inline-кнопок
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
+
+# Параллельная обработка обновлений разных пользователей
+UPDATE_WORKERS = int(os.getenv('UPDATE_WORKERS', '16'))
+
+# Все исходящие сообщения идут через общую очередь с учётом лимитов Telegram
+outbound = OutboundDispatcher(
+    global_rate=float(os.getenv('OUTBOUND_GLOBAL_RATE', '25')),
+    per_chat_rate=float(os.getenv('OUTBOUND_PER_CHAT_RATE', '1')),
+    per_chat_burst=float(os.getenv('OUTBOUND_PER_CHAT_BURST', '3'))
+)
+
+# Автоматическая проверка ссылок в заявках на подарки
+LINK_CHECK_ENABLED = os.getenv('LINK_CHECK_ENABLED', 'true').lower() == 'true'
+link_verifier = LinkVerifier(
+    max_concurrency=int(os.getenv('LINK_CHECK_CONCURRENCY', '5')),
+    per_host_rate=float(os.getenv('LINK_CHECK_HOST_RATE', '2'))
+)
+
+# Картинки из pic/ загружаются один раз, дальше отправляются по file_id
+media = MediaRegistry(db, outbound, os.path.join(os.path.dirname(__file__), 'pic'))
+
+# Тяжёлые отчёты строятся в отдельных процессах с доступом к БД только на чтение
+# (для хранилища в памяти — в потоках по копии строк)
+reports = ReportRunner(
+    db.db_file,
+    max_workers=int(os.getenv('REPORT_WORKERS', '1')),
+    timeout=float(os.getenv('REPORT_TIMEOUT', '300')),
+    storage=db
+)
 
 # Constants for CryptoBot
 CRYPTO_BOT_USERNAME = "@CryptoBot"
@@ -92,6 +194,24 @@ def _set_admin_user_id(user_id: int) -> None:
     except Exception as e:
         logger.error(f"Failed to persist ADMIN_USER_ID: {e}")
 
+def _update_order_key(update: object):
+    """Ключ упорядочивания: обновления одного пользователя обрабатываются строго по очереди.
+
+    Все админы делят один ключ, чтобы многошаговые админ-диалоги (пополнение,
+    подтверждение оплаты) не перемешивались между собой.
+    """
+    user = getattr(update, 'effective_user', None)
+    if user is None:
+        chat = getattr(update, 'effective_chat', None)
+        return chat.id if chat else None
+    if _is_admin(user):
+        return 'admin'
+    return user.id
+
+def _flow(update: Update) -> ScopedState:
+    """Флаги многошаговых диалогов текущего пользователя"""
+    return user_flows.scope(update.effective_user.id)
+
 def render_delivery_message(account_id: int, details: str, price: float) -> str:
     try:
         return DELIVERY_TEMPLATE.format(
@@ -110,49 +230,99 @@ def render_delivery_message(account_id: int, details: str, price: float) -> str:
             f"Спасибо за покупку! 🎉"
         )
 
-async def notify_admin_about_depletion(context: ContextTypes.DEFAULT_TYPE, account_id: int):
-    """Уведомление админа о закончившихся аккаунтах в лоте"""
+def render_outbox_message(delivery: dict) -> str:
+    """Текст выдачи для записи из delivery_outbox"""
+    payload = delivery['payload']
+    if delivery['kind'] == 'rub':
+        return (
+            f"✅ Оплата в рублях подтверждена!\n\n"
+            f"🎮 Лот #{delivery['account_id']}\n"
+            f"📝 Данные для входа: {delivery['details']}\n"
+            f"💵 Оплачено: {payload.get('price_rub')} ₽\n\n"
+            f"Спасибо за покупку! 🎉"
+        )
+    return render_delivery_message(delivery['account_id'], delivery['details'], payload.get('price'))
+
+# Фоновая отправка проданных логов из delivery_outbox
+delivery_sender = DeliverySender(
+    db, outbound, render_outbox_message,
+    batch_size=int(os.getenv('DELIVERY_BATCH_SIZE', '50')),
+    poll_interval=float(os.getenv('DELIVERY_POLL_INTERVAL', '30')),
+    max_attempts=int(os.getenv('DELIVERY_MAX_ATTEMPTS', '10'))
+)
+
+async def send_admin_alert(text: str):
+    """Отправка уведомления админу через общую очередь исходящих"""
     if not ADMIN_USER_ID:
         return
+    await outbound.send_message(
+        int(ADMIN_USER_ID),
+        text,
+        parse_mode='Markdown',
+        priority=PRIORITY_NOTIFICATION,
+        wait=False
+    )
+
+def render_critical_alert(kind: str, account_id: int, data: dict) -> str:
+    """Срочное уведомление: оплативший покупатель ждёт в очереди пустого лота"""
+    account = db.get_account(account_id)
+    # Название лота и имена пользователей могут содержать _ и * — экранируем для Markdown
+    lot_name = escape_markdown(account[1]) if account else "Unknown"
+    price = account[2] if account else 0
+    queue_size = db.get_queue_size(account_id)
+    return (
+        f"⚠️ **АККАУНТЫ ЗАКОНЧИЛИСЬ!**\n\n"
+        f"🎮 **Лот:** {lot_name}\n"
+        f"🔢 **ID:** #{account_id}\n"
+        f"💰 **Цена:** {price} {CRYPTO_ASSET}\n\n"
+        f"📦 **Осталось логов:** 0\n"
+        f"👥 **В очереди:** {queue_size} человек\n\n"
+        f"🚀 **НУЖНО ПОПОЛНИТЬ ЛОТ!**\n"
+        f"⏳ Покупатели ждут выдачи"
+    )
+
+def render_alert_digest(batch: dict) -> str:
+    """Сводка накопленных уведомлений: по одному блоку на лот, затем заявки на подарки"""
+    lines = ["🔔 **Сводка уведомлений**"]
     
-    try:
+    for account_id in sorted(lot for lot in batch if lot is not None):
+        events = batch[account_id]
         account = db.get_account(account_id)
-        if not account:
-            return
-        
-        queue_size = db.get_queue_size(account_id)
-        
-        if queue_size > 0:
-            notification_text = (
-                f"⚠️ **АККАУНТЫ ЗАКОНЧИЛИСЬ!**\n\n"
-                f"🎮 **Лот:** {account[1]}\n"
-                f"🔢 **ID:** #{account_id}\n"
-                f"💰 **Цена:** {account[2]} {CRYPTO_ASSET}\n\n"
-                f"📦 **Осталось логов:** 0\n"
-                f"👥 **В очереди:** {queue_size} человек\n\n"
-                f"🚀 **НУЖНО ПОПОЛНИТЬ ЛОТ!**\n"
-                f"⏳ Покупатели ждут выдачи"
-            )
-        else:
-            notification_text = (
-                f"📦 **Лот опустошен**\n\n"
-                f"🎮 **Лот:** {account[1]}\n"
-                f"🔢 **ID:** #{account_id}\n"
-                f"💰 **Цена:** {account[2]} {CRYPTO_ASSET}\n\n"
-                f"📦 **Осталось логов:** 0\n"
-                f"👥 **В очереди:** {queue_size} человек"
-            )
-        
-        await context.bot.send_message(
-            int(ADMIN_USER_ID), 
-            notification_text, 
-            parse_mode='Markdown'
+        lot_name = escape_markdown(account[1]) if account else "Unknown"
+        lines.append(f"\n🎮 **Лот:** {lot_name} (#{account_id})")
+        if events.get(ALERT_DEPLETED):
+            lines.append("📦 Аккаунты закончились")
+        if events.get(ALERT_QUEUE_GROWTH):
+            lines.append(f"👥 Новых оплативших в очереди: {len(events[ALERT_QUEUE_GROWTH])}")
+        if events.get(ALERT_QUEUE_PROCESSED):
+            delivered = sum(e.get('delivered', 0) for e in events[ALERT_QUEUE_PROCESSED])
+            lines.append(f"✅ Выдано из очереди: {delivered}")
+        lines.append(
+            f"📊 Осталось логов: {db.count_available_credentials(account_id)} | "
+            f"В очереди: {db.get_queue_size(account_id)}"
         )
-        
-    except Exception as e:
-        logger.error(f"Failed to notify admin about depletion: {e}")
+    
+    gift_requests = batch.get(None, {}).get(ALERT_GIFT_REQUEST, [])
+    if gift_requests:
+        lines.append(f"\n🎁 **Новые заявки на подарок:** {len(gift_requests)}")
+        for request in gift_requests[:10]:
+            username = escape_markdown(str(request['username']))
+            lines.append(f"• #{request['request_id']} от @{username} ({request['links']} ссылок)")
+        if len(gift_requests) > 10:
+            lines.append(f"… и ещё {len(gift_requests) - 10}")
+        lines.append("📮 Проверьте в меню: Проверка заявок")
+    
+    return "\n".join(lines)
+
+# Уведомления админу копятся и отправляются сводкой; срочные — сразу
+alerts = AlertAggregator(
+    send_admin_alert,
+    render_alert_digest,
+    render_critical_alert,
+    window=float(os.getenv('ALERT_DIGEST_SECONDS', '60'))
+)
 
-async def process_purchase_queue(context: ContextTypes.DEFAULT_TYPE, account_id: int):
+async def process_purchase_queue(account_id: int):
     """Обработка очереди при пополнении лота"""
     try:
         queue_entries = db.process_queue_for_lot(account_id)
@@ -175,54 +345,46 @@ async def process_purchase_queue(context: ContextTypes.DEFAULT_TYPE, account_id:
                 continue
             
             # Пытаемся выдать аккаунт
-            success, delivered_details, accounts_depleted = db.mark_account_sold(account_id, user_id, price_usdt)
+            success, delivered_details, accounts_depleted = await db_writer.mark_account_sold(
+                account_id, user_id, price_usdt,
+                delivery_kind="queue", delivery_payload={"price": price_usdt},
+                payment_type=payment_type
+            )
             
             if success:
                 # Отмечаем запись в очереди как выполненную
                 db.mark_queue_entry_fulfilled(queue_id)
                 
-                # Отправляем аккаунт пользователю
-                delivery_message = render_delivery_message(account_id, delivered_details, price_usdt)
-                await context.bot.send_message(user_id, delivery_message)
+                # Аккаунт будет отправлен пользователю из delivery_outbox
+                delivery_sender.kick()
                 
                 processed_count += 1
                 
-                # Удаляем запись о платеже из bot_data
-                for key in list(context.bot_data.keys()):
-                    if (key.startswith(f"payment_{user_id}_{account_id}") or 
-                        key.startswith(f"rub_order_{user_id}_{account_id}")):
-                        context.bot_data.pop(key, None)
+                # Удаляем запись о платеже
+                pending_payments.pop(f"payment_{user_id}_{account_id}")
+                pending_payments.pop(f"rub_order_{user_id}_{account_id}")
                 
                 # Проверяем, не закончились ли снова аккаунты
                 if accounts_depleted:
-                    await notify_admin_about_depletion(context, account_id)
+                    alerts.record(ALERT_DEPLETED, account_id)
                     break
             else:
                 # Нет больше логов - прекращаем обработку
                 break
         
-        # Уведомляем админа о результатах
-        if processed_count > 0 and ADMIN_USER_ID:
-            remaining_queue = db.get_queue_size(account_id)
-            remaining_accounts = db.count_available_credentials(account_id)
-            
-            notification = (
-                f"✅ **ОЧЕРЕДЬ ОБРАБОТАНА!**\n\n"
-                f"🎮 **Лот:** {account[1]} (#{account_id})\n"
-                f"✅ **Выдано:** {processed_count} аккаунтов\n"
-                f"📦 **Осталось логов:** {remaining_accounts}\n"
-                f"👥 **Осталось в очереди:** {remaining_queue}"
-            )
-            
-            await context.bot.send_message(
-                int(ADMIN_USER_ID),
-                notification,
-                parse_mode='Markdown'
-            )
+        # Уведомляем админа о результатах (попадёт в сводку)
+        if processed_count > 0:
+            alerts.record(ALERT_QUEUE_PROCESSED, account_id, delivered=processed_count)
         
     except Exception as e:
         logger.error(f"Error processing purchase queue: {e}")
 
+# Выдача очереди после пополнения лота выполняется в фоне
+refill_worker = RefillCoalescer(
+    process_purchase_queue,
+    window=float(os.getenv('REFILL_COALESCE_SECONDS', '2'))
+)
+
 # Статусы заказов
 PENDING_PAYMENT = "pending"
 PAID = "paid"
@@ -274,14 +436,13 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Пытаемся отправить фотографию с текстом
     try:
-        photo_path = os.path.join(os.path.dirname(__file__), 'pic', '2.png')
-        if os.path.exists(photo_path):
-            with open(photo_path, 'rb') as photo:
-                await update.message.reply_photo(
-                    photo=photo,
-                    caption=welcome_text,
-                    reply_markup=get_main_keyboard(is_admin)
-                )
+        if media.exists('2.png'):
+            await media.send_photo(
+                update.effective_chat.id,
+                '2.png',
+                caption=welcome_text,
+                reply_markup=get_main_keyboard(is_admin)
+            )
         else:
             # Если фото не найдено, отправляем только текст
             await update.message.reply_text(
@@ -309,6 +470,13 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "❌ Удалить лот - удалить лот\n"
             "📈 Статистика - подробная статистика по лотам\n"
             "💵 Подтвердить оплату - подтверждение рублевых платежей\n"
+            "/stats today|24h|7d|30d - продажи за период\n"
+            "/export - выгрузка заказов, логов или очереди в CSV\n"
+            "/report - полные отчёты по лотам и ссылкам\n"
+            "/metrics - метрики внутреннего состояния бота\n"
+            "/deliveries - зависшие выдачи логов\n"
+            "/giftbulk - одобрить/отклонить заявки на подарки пачкой\n"
+            "/broadcast - рассылка сообщения пользователям\n"
         )
     else:
         help_text = (
@@ -320,11 +488,49 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "💳 Оплата:\n"
             f"• {CRYPTO_BOT_USERNAME} (USDT) - мгновенно\n"
             f"• Рубли (1 USDT = {USDT_TO_RUB_RATE}₽) - через менеджера\n\n"
+            "🧾 /myorders - ваши покупки и выданные данные\n\n"
             "📞 Поддержка: 24/7"
         )
     
     await update.message.reply_text(help_text)
 
+def _truncate(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[:limit] + "…"
+
+# Количество заказов на одной странице /myorders
+ORDERS_PAGE_SIZE = 5
+
+async def my_orders(update: Update, context: ContextTypes.DEFAULT_TYPE, before_order_id: int = None):
+    """История покупок пользователя с данными выданных логов"""
+    query = update.callback_query
+    reply = query.edit_message_text if query else update.message.reply_text
+    
+    orders, has_more = db.get_user_orders_page(
+        update.effective_user.id, before_order_id=before_order_id, limit=ORDERS_PAGE_SIZE
+    )
+    if not orders:
+        await reply("🧾 У вас пока нет покупок.")
+        return
+    
+    lines = ["🧾 Ваши покупки:\n"]
+    for order_id, lot_name, price, timestamp, details in orders:
+        lines.append(
+            f"#{order_id} | {timestamp}\n"
+            f"🎮 {lot_name or 'Лот удалён'} — {price} {CRYPTO_ASSET}\n"
+            f"🔐 {_truncate(details, 500) if details else 'данные недоступны'}\n"
+        )
+    
+    navigation = []
+    if before_order_id is not None:
+        navigation.append(InlineKeyboardButton("⏮ В начало", callback_data="myorders_start"))
+    if has_more:
+        navigation.append(InlineKeyboardButton("Ранее ➡️", callback_data=f"myorders_{orders[-1][0]}"))
+    
+    await reply(
+        "\n".join(lines),
+        reply_markup=InlineKeyboardMarkup([navigation]) if navigation else None
+    )
+
 async def whoami(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     await update.message.reply_text(
@@ -378,7 +584,7 @@ async def test_purchase(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         
         # Симулируем покупку
-        success, delivered_details = db.mark_account_sold(lot_id, user_id, account[2])
+        success, delivered_details, _ = await db_writer.mark_account_sold(lot_id, user_id, account[2])
         
         if success:
             # Отправляем сообщение о выдаче
@@ -410,9 +616,17 @@ async def make_me_admin(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         await update.message.reply_text("⛔️ Недостаточно прав для назначения администратора.")
 
+def _load_catalog() -> List[Tuple[int, str, float, int, int]]:
+    """Лоты с остатком логов и размером очереди: (id, название, цена, остаток, очередь)"""
+    return [
+        (account_id, details, price, db.count_available_credentials(account_id), db.get_queue_size(account_id))
+        for account_id, details, price in db.get_available_accounts()
+    ]
+
 async def show_accounts(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показать доступные лоты"""
-    accounts = db.get_available_accounts()
+    # Чтение идёт через пул соединений в рабочем потоке и не блокирует обработку продаж
+    accounts = await asyncio.to_thread(_load_catalog)
     
     if not accounts:
         message_text = "😔 Сейчас нет доступных лотов."
@@ -426,10 +640,7 @@ async def show_accounts(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message_lines = ["🛍️ **ДОСТУПНЫЕ ЛОТЫ** 🛍️\n"]
     keyboard_buttons = []
     
-    for account in accounts:
-        account_id, details, price = account
-        available_count = db.count_available_credentials(account_id)
-        queue_size = db.get_queue_size(account_id)
+    for account_id, details, price, available_count, queue_size in accounts:
         rub_price = int(price * USDT_TO_RUB_RATE)
         
         if available_count > 0:
@@ -490,12 +701,12 @@ async def add_logs_to_existing_lot(update: Update, context: ContextTypes.DEFAULT
         
         lots_text += "\n🔢 Например: 1"
         
-        context.user_data["awaiting_lot_refill"] = True
+        _flow(update)["awaiting_lot_refill"] = True
         await update.message.reply_text(lots_text)
         return
     
     # Обработка ввода ID лота
-    if context.user_data.get("awaiting_lot_refill") and msg.isdigit():
+    if _flow(update).get("awaiting_lot_refill") and msg.isdigit():
         lot_id = int(msg)
         account = db.get_account(lot_id)
         
@@ -503,8 +714,8 @@ async def add_logs_to_existing_lot(update: Update, context: ContextTypes.DEFAULT
             await update.message.reply_text("❌ Лот не найден. Попробуйте снова.")
             return
         
-        context.user_data["awaiting_lot_refill"] = False
-        context.user_data["current_account_id"] = lot_id
+        _flow(update)["awaiting_lot_refill"] = False
+        _flow(update)["current_account_id"] = lot_id
         
         available_count = db.count_available_credentials(lot_id)
         await update.message.reply_text(
@@ -518,12 +729,12 @@ async def add_logs_to_existing_lot(update: Update, context: ContextTypes.DEFAULT
         return
     
         # Добавление логов к существующему лоту
-    if context.user_data.get("current_account_id") and msg and msg.lower() != "готово":
-        account_id = context.user_data["current_account_id"]
-        db.add_credential(account_id, msg.strip())
+    if _flow(update).get("current_account_id") and msg and msg.lower() != "готово":
+        account_id = _flow(update)["current_account_id"]
+        await db_writer.add_credential(account_id, msg.strip())
         
-        # Обрабатываем очередь при добавлении нового лога
-        await process_purchase_queue(context, account_id)
+        # Очередь обработается в фоне (серия добавлений объединяется в один проход)
+        refill_worker.signal(account_id)
         
         left = db.count_available_credentials(account_id)
         account_info = db.get_account(account_id)
@@ -540,8 +751,8 @@ async def add_logs_to_existing_lot(update: Update, context: ContextTypes.DEFAULT
         )
         return
     
-    if msg.lower() == "готово" and context.user_data.get("current_account_id"):
-        account_id = context.user_data.pop("current_account_id")
+    if msg.lower() == "готово" and _flow(update).get("current_account_id"):
+        account_id = _flow(update).pop("current_account_id")
         total = db.count_available_credentials(account_id)
         account_info = db.get_account(account_id)
         lot_name = account_info[1] if account_info else "Unknown"
@@ -563,7 +774,7 @@ async def add_account(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     msg = update.message.text
     if msg == "➕ Добавить лот":
-        context.user_data["awaiting_lot_data"] = True
+        _flow(update)["awaiting_lot_data"] = True
         await update.message.reply_text(
             "🆕 Создание нового лота:\n\n"
             "📝 Отправьте данные в формате:\n"
@@ -576,12 +787,12 @@ async def add_account(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     try:
-        if context.user_data.get("awaiting_lot_data") and "|" in msg:
+        if _flow(update).get("awaiting_lot_data") and "|" in msg:
             lot_name, price = msg.split("|")
             price = float(price)
             account_id = db.add_account(lot_name.strip(), price)
-            context.user_data["awaiting_lot_data"] = False
-            context.user_data["current_account_id"] = account_id
+            _flow(update)["awaiting_lot_data"] = False
+            _flow(update)["current_account_id"] = account_id
             await update.message.reply_text(
                 f"✅ Лот #{account_id} создан: {lot_name} ({price} {CRYPTO_ASSET})\n\n"
                 f"📋 Теперь добавьте логи для этого лота:\n"
@@ -595,12 +806,12 @@ async def add_account(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         
         # Добавление данных для входа в текущий лот
-        if context.user_data.get("current_account_id") and msg and msg.lower() != "готово":
-            account_id = context.user_data["current_account_id"]
-            db.add_credential(account_id, msg.strip())
+        if _flow(update).get("current_account_id") and msg and msg.lower() != "готово":
+            account_id = _flow(update)["current_account_id"]
+            await db_writer.add_credential(account_id, msg.strip())
             
-            # Обрабатываем очередь при добавлении лога
-            await process_purchase_queue(context, account_id)
+            # Очередь обработается в фоне (серия добавлений объединяется в один проход)
+            refill_worker.signal(account_id)
             
             left = db.count_available_credentials(account_id)
             account_info = db.get_account(account_id)
@@ -617,8 +828,8 @@ async def add_account(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return
         
-        if msg.lower() == "готово" and context.user_data.get("current_account_id"):
-            account_id = context.user_data.pop("current_account_id")
+        if msg.lower() == "готово" and _flow(update).get("current_account_id"):
+            account_id = _flow(update).pop("current_account_id")
             total = db.count_available_credentials(account_id)
             account_info = db.get_account(account_id)
             lot_name = account_info[1] if account_info else "Unknown"
@@ -647,7 +858,7 @@ async def update_price(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     msg = update.message.text
     if msg == "✏️ Изменить цену":
-        context.user_data["awaiting_price_update"] = True
+        _flow(update)["awaiting_price_update"] = True
         await update.message.reply_text(
             "📝 Отправьте данные в формате:\n"
             "ID|новая_цена\n\n"
@@ -681,7 +892,7 @@ async def confirm_rub_payment(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     msg = update.message.text
     if msg == "💵 Подтвердить оплату":
-        context.user_data["awaiting_payment_confirm"] = True
+        _flow(update)["awaiting_payment_confirm"] = True
         await update.message.reply_text(
             "💵 Подтверждение рублевой оплаты\n\n"
             "📝 Отправьте данные в формате:\n"
@@ -692,26 +903,36 @@ async def confirm_rub_payment(update: Update, context: ContextTypes.DEFAULT_TYPE
         )
         return
     
-    if context.user_data.get("awaiting_payment_confirm") and "|" in msg:
+    if _flow(update).get("awaiting_payment_confirm") and "|" in msg:
         try:
             lot_id, username = msg.split("|")
             lot_id = int(lot_id.strip())
             username = username.strip().lstrip('@')
             
-            # Поиск заказа в bot_data
+            # Поиск заказа среди ожидающих оплаты: по известному пользователю сразу по ключу
             order_found = False
             order_key = None
             order_data = None
             
-            for key, data in context.bot_data.items():
-                if (key.startswith("rub_order_") and 
-                    isinstance(data, dict) and 
-                    data.get("account_id") == lot_id and 
-                    data.get("username", "").lower() == username.lower()):
+            buyer_id = activity.find_user_id(username)
+            if buyer_id is not None:
+                data = pending_payments.get(f"rub_order_{buyer_id}_{lot_id}")
+                if isinstance(data, dict):
                     order_found = True
-                    order_key = key
+                    order_key = f"rub_order_{buyer_id}_{lot_id}"
                     order_data = data
-                    break
+            
+            if not order_found:
+                # Покупатель ещё не записан в users — ищем перебором
+                for key, data in pending_payments.items(prefix="rub_order_"):
+                    if (key.startswith("rub_order_") and 
+                        isinstance(data, dict) and 
+                        data.get("account_id") == lot_id and 
+                        data.get("username", "").lower() == username.lower()):
+                        order_found = True
+                        order_key = key
+                        order_data = data
+                        break
             
             if not order_found:
                 await update.message.reply_text(
@@ -732,25 +953,23 @@ async def confirm_rub_payment(update: Update, context: ContextTypes.DEFAULT_TYPE
             # Обновляем статус в очереди, если есть queue_id
             queue_id = order_data.get("queue_id")
             if queue_id:
-                db.update_queue_payment_status(user_id, lot_id, "", "paid")
+                await db_writer.update_queue_payment_status(user_id, lot_id, "", "paid")
             
             # Выдаем лог
-            success, delivered_details, accounts_depleted = db.mark_account_sold(lot_id, user_id, order_data["price_usdt"])
+            success, delivered_details, accounts_depleted = await db_writer.mark_account_sold(
+                lot_id, user_id, order_data["price_usdt"],
+                delivery_kind="rub",
+                delivery_payload={"price": order_data["price_usdt"], "price_rub": order_data["price_rub"]},
+                payment_type="rub"
+            )
             
             if success:
                 # Отмечаем запись в очереди как выполненную
                 if queue_id:
                     db.mark_queue_entry_fulfilled(queue_id)
                 
-                # Отправляем лог покупателю
-                delivery_message = (
-                    f"✅ Оплата в рублях подтверждена!\n\n"
-                    f"🎮 Лот #{lot_id}\n"
-                    f"📝 Данные для входа: {delivered_details}\n"
-                    f"💵 Оплачено: {order_data['price_rub']} ₽\n\n"
-                    f"Спасибо за покупку! 🎉"
-                )
-                await context.bot.send_message(user_id, delivery_message)
+                # Лог будет отправлен покупателю из delivery_outbox
+                delivery_sender.kick()
                 
                 # Уведомляем админа
                 await update.message.reply_text(
@@ -763,17 +982,17 @@ async def confirm_rub_payment(update: Update, context: ContextTypes.DEFAULT_TYPE
                 
                 # Уведомляем об истощении лота
                 if accounts_depleted:
-                    await notify_admin_about_depletion(context, lot_id)
+                    alerts.record(ALERT_DEPLETED, lot_id)
                 
                 # Удаляем заказ из очереди
-                context.bot_data.pop(order_key, None)
-                context.user_data["awaiting_payment_confirm"] = False
+                pending_payments.pop(order_key)
+                _flow(update)["awaiting_payment_confirm"] = False
                 
             else:
                 # Нет доступных логов - добавляем в очередь или обновляем статус
                 if not queue_id:
                     # Добавляем в очередь
-                    queue_id = db.add_to_purchase_queue(
+                    queue_id = await db_writer.add_to_purchase_queue(
                         user_id=user_id,
                         account_id=lot_id,
                         payment_type="rub",
@@ -782,16 +1001,17 @@ async def confirm_rub_payment(update: Update, context: ContextTypes.DEFAULT_TYPE
                         username=username,
                         payment_status="paid"
                     )
-                    # Обновляем заказ в bot_data
-                    context.bot_data[order_key]["queue_id"] = queue_id
+                    # Обновляем заказ
+                    order_data["queue_id"] = queue_id
+                    pending_payments.set(order_key, order_data)
                 else:
                     # Обновляем статус в очереди
-                    db.update_queue_payment_status(user_id, lot_id, "", "paid")
+                    await db_writer.update_queue_payment_status(user_id, lot_id, "", "paid")
                 
                 queue_size = db.get_queue_size(lot_id)
                 
                 # Отправляем сообщение пользователю
-                await context.bot.send_message(
+                await outbound.send_message(
                     user_id,
                     f"✅ Оплата получена!\n\n"
                     f"📦 Лот #{lot_id} сейчас пуст\n"
@@ -810,9 +1030,9 @@ async def confirm_rub_payment(update: Update, context: ContextTypes.DEFAULT_TYPE
                 )
                 
                 # Уведомляем о необходимости пополнения
-                await notify_admin_about_depletion(context, lot_id)
+                alerts.record(ALERT_QUEUE_GROWTH, lot_id, critical=True)
                 
-                context.user_data["awaiting_payment_confirm"] = False
+                _flow(update)["awaiting_payment_confirm"] = False
                 await update.message.reply_text("❌ Нет доступных логов в этом лоте.")
                 
         except ValueError:
@@ -820,13 +1040,89 @@ async def confirm_rub_payment(update: Update, context: ContextTypes.DEFAULT_TYPE
         except Exception as e:
             await update.message.reply_text(f"❌ Ошибка: {str(e)}")
 
+# Периоды /stats: (подпись, сдвиг начала от текущего времени, почасовые агрегаты)
+SALES_PERIODS = {
+    'today': ("сегодня", None, False),
+    '24h': ("за 24 часа", timedelta(hours=23), True),
+    '7d': ("за 7 дней", timedelta(days=6), False),
+    '30d': ("за 30 дней", timedelta(days=29), False),
+}
+PAYMENT_TYPE_NAMES = {'crypto': "💎 Крипта", 'rub': "💵 Рубли", 'unknown': "❔ Прочее"}
+
+async def show_sales_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/stats today|24h|7d|30d — продажи за период из предагрегированных таблиц"""
+    if not _is_admin(update.effective_user):
+        await update.message.reply_text("⛔️ Только для администраторов.")
+        return
+    
+    period = context.args[0] if context.args else 'today'
+    if period not in SALES_PERIODS:
+        await update.message.reply_text("Использование: /stats today|24h|7d|30d")
+        return
+    label, offset, hourly = SALES_PERIODS[period]
+    
+    # Досчитываем заказы после последнего прохода фоновой задачи
+    await asyncio.to_thread(db.refresh_sales_rollups)
+    now = datetime.now(timezone.utc)
+    start = now - offset if offset else now
+    since = start.strftime('%Y-%m-%d %H:00:00') if hourly else start.strftime('%Y-%m-%d')
+    summary = db.get_sales_summary(since, hourly=hourly)
+    
+    lines = [
+        f"📈 Продажи {label} (UTC)\n",
+        f"🧾 Заказов: {summary['orders']}",
+        f"📦 Выдано логов: {summary['units']}",
+        f"💰 Выручка: {summary['revenue']:.2f} {CRYPTO_ASSET}",
+    ]
+    if summary['by_payment']:
+        lines.append("")
+        for payment_type, totals in summary['by_payment'].items():
+            lines.append(
+                f"{PAYMENT_TYPE_NAMES.get(payment_type, payment_type)}: "
+                f"{totals['orders']} заказов, {totals['revenue']:.2f} {CRYPTO_ASSET}"
+            )
+    if summary['by_lot']:
+        lines.append("\n🎮 По лотам:")
+        for lot in summary['by_lot'][:15]:
+            lines.append(
+                f"#{lot['account_id']} {lot['name'] or 'Лот удалён'}: "
+                f"{lot['orders']} шт., {lot['revenue']:.2f} {CRYPTO_ASSET}"
+            )
+    await update.message.reply_text("\n".join(lines))
+
+async def run_schema_backfills():
+    """Дозаполнение данных после миграций порциями, не задерживая запуск бота"""
+    try:
+        while await asyncio.to_thread(db.run_backfills, 500, 10):
+            await asyncio.sleep(0.1)
+    except Exception as e:
+        logger.error(f"Schema backfill failed: {e}")
+
+async def snapshot_storage_periodically(interval: float):
+    """Фоновое сохранение снимка хранилища в памяти на диск"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(db.snapshot)
+        except Exception as e:
+            logger.error(f"Error writing storage snapshot: {e}")
+
+async def refresh_sales_rollups_periodically(interval: float):
+    """Фоновое обновление агрегатов продаж"""
+    while True:
+        try:
+            await asyncio.to_thread(db.refresh_sales_rollups)
+        except Exception as e:
+            logger.error(f"Error refreshing sales rollups: {e}")
+        await asyncio.sleep(interval)
+
 async def show_statistics(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show lots statistics"""
     if not _is_admin(update.effective_user):
         await update.message.reply_text("⛔️ Только для администраторов.")
         return
     
-    statistics = db.get_all_lots_statistics()
+    statistics = await asyncio.to_thread(db.get_all_lots_statistics)
     
     if not statistics:
         await update.message.reply_text("📈 Нет данных для статистики.")
@@ -865,7 +1161,7 @@ async def show_statistics(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(lot_msg)
     
     if len(statistics) > 10:
-        await update.message.reply_text(f"… и ещё {len(statistics) - 10} лотов")
+        await update.message.reply_text(f"… и ещё {len(statistics) - 10} лотов. Полный список: /report lots")
 
 async def delete_account(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Delete account handler"""
@@ -877,7 +1173,7 @@ async def delete_account(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     msg = update.message.text
     if msg == "❌ Удалить лот":
-        context.user_data["awaiting_account_delete"] = True
+        _flow(update)["awaiting_account_delete"] = True
         await update.message.reply_text(
             "🗑 Отправьте ID лота для удаления\n"
             "Например: 1"
@@ -900,6 +1196,14 @@ async def handle_gift_request(update: Update, context: ContextTypes.DEFAULT_TYPE
     text = update.message.text
     user = update.effective_user
     
+    if user.id in pending_gift_users:
+        _flow(update)["awaiting_gift_links"] = False
+        await update.message.reply_text(
+            "⏳ Ваша заявка на подарок уже на проверке.\n"
+            "Дождитесь решения администратора, прежде чем отправлять новую."
+        )
+        return
+    
     if text == "🎁 Получить подарок":
         instructions = (
             f"🎁 Бесплатный аккаунт VEO3 за комментарии.\n\n"
@@ -910,17 +1214,16 @@ async def handle_gift_request(update: Update, context: ContextTypes.DEFAULT_TYPE
             f"После проверки вы получите данные от аккаунта VEO3 бесплатно."
         )
         
-        context.user_data["awaiting_gift_links"] = True
+        _flow(update)["awaiting_gift_links"] = True
         
         # Пытаемся отправить фотографию с текстом
         try:
-            photo_path = os.path.join(os.path.dirname(__file__), 'pic', '1.jpeg')
-            if os.path.exists(photo_path):
-                with open(photo_path, 'rb') as photo:
-                    await update.message.reply_photo(
-                        photo=photo,
-                        caption=instructions
-                    )
+            if media.exists('1.jpeg'):
+                await media.send_photo(
+                    update.effective_chat.id,
+                    '1.jpeg',
+                    caption=instructions
+                )
             else:
                 # Если фото не найдено, отправляем только текст
                 await update.message.reply_text(instructions)
@@ -931,25 +1234,53 @@ async def handle_gift_request(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
     
     # Обработка полученных ссылок
-    if context.user_data.get("awaiting_gift_links"):
-        # Проверяем количество ссылок
-        links = text.split('\n')
-        tiktok_links = [link.strip() for link in links if 'tiktok.com' in link.lower() or 'vm.tiktok.com' in link.lower()]
+    if _flow(update).get("awaiting_gift_links"):
+        # Проверяем количество ссылок (одинаковые ссылки в разной записи считаются одной)
+        normalized_links = {}
+        for line in text.split('\n'):
+            link = extract_tiktok_link(line)
+            if link:
+                normalized_links.setdefault(link_hash(normalize_tiktok_link(link)), link)
+        tiktok_links = list(normalized_links.values())
         
         if len(tiktok_links) < 10:
             await update.message.reply_text(
                 f"❌ **Недостаточно ссылок!**\n\n"
-                f"🔍 Найдено: {len(tiktok_links)} ссылок TikTok\n"
+                f"🔍 Найдено: {len(tiktok_links)} разных ссылок TikTok\n"
                 f"🎯 Нужно: 10 ссылок\n\n"
                 f"📝 Пожалуйста, отправьте все 10 ссылок одним сообщением.",
                 parse_mode='Markdown'
             )
             return
         
-        # Создаем заявку
+        if user.id in gift_submit_cooldown:
+            await update.message.reply_text("⏳ Слишком частые заявки. Попробуйте через минуту.")
+            return
+        
+        # Создаем заявку, если ссылки ещё не отправлялись
         username = user.username or f"id{user.id}"
-        request_id = db.create_gift_request(user.id, username, text)
-        context.user_data["awaiting_gift_links"] = False
+        request_id, used_links = await db_writer.create_gift_request_with_links(
+            user.id, username, text, list(normalized_links.items())
+        )
+        if request_id is None and not used_links:
+            # Заявка уже ожидает проверки (например, отправлена с другого устройства)
+            pending_gift_users.add(user.id)
+            _flow(update)["awaiting_gift_links"] = False
+            await update.message.reply_text("⏳ Ваша заявка на подарок уже на проверке.")
+            return
+        if request_id is None:
+            used_list = "\n".join(used_links[:10])
+            await update.message.reply_text(
+                f"❌ Эти ссылки уже отправлялись в другой заявке:\n\n"
+                f"{used_list}\n\n"
+                f"📝 Оставьте новые комментарии и отправьте ссылки на них.",
+                disable_web_page_preview=True
+            )
+            return
+        # Ограничение частоты только для созданных заявок: отклонённую можно сразу исправить
+        gift_submit_cooldown.set(user.id, True)
+        pending_gift_users.add(user.id)
+        _flow(update)["awaiting_gift_links"] = False
         
         await update.message.reply_text(
             f"✅ **Заявка принята на проверку!**\n\n"
@@ -959,32 +1290,48 @@ async def handle_gift_request(update: Update, context: ContextTypes.DEFAULT_TYPE
             parse_mode='Markdown'
         )
         
-        # Уведомляем админов о новой заявке
-        admin_notification = (
-            f"🔔 **Новая заявка на подарок!**\n\n"
-            f"🔢 ID: {request_id}\n"
-            f"👤 От: @{username}\n"
-            f"🔍 Количество ссылок: {len(tiktok_links)}\n\n"
-            f"📮 Проверьте в меню: Проверка заявок"
-        )
+        # Проверяем ссылки в фоне, результат появится на экране проверки
+        if LINK_CHECK_ENABLED:
+            context.application.create_task(verify_gift_links(request_id))
         
-        # Отправляем уведомление админам
-        if ADMIN_USER_ID:
-            try:
-                await context.bot.send_message(int(ADMIN_USER_ID), admin_notification, parse_mode='Markdown')
-            except:
-                pass
+        # Уведомляем админов о новой заявке (попадёт в сводку)
+        alerts.record(ALERT_GIFT_REQUEST, None, request_id=request_id, username=username,
+                      links=len(tiktok_links))
 
-async def show_gift_requests(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показ списка заявок на подарки"""
+async def verify_gift_links(request_id: int):
+    """Автоматическая проверка ссылок заявки: формат, перенаправления, доступность"""
+    try:
+        link_rows = db.get_gift_links(request_id)
+        results = await link_verifier.check_many([row[1] for row in link_rows])
+        db.save_gift_link_checks([
+            (row[0], 'ok' if result['ok'] else 'failed', result['detail'], result['final_url'])
+            for row, result in zip(link_rows, results)
+        ])
+    except Exception as e:
+        logger.error(f"Error verifying links of gift request {request_id}: {e}")
+
+# Количество заявок на одной странице списка
+GIFT_REQUESTS_PAGE_SIZE = 10
+
+async def show_gift_requests(update: Update, context: ContextTypes.DEFAULT_TYPE,
+                             after_id: int = None, before_id: int = None):
+    """Показ списка заявок на подарки (постранично)"""
+    query = update.callback_query
+    reply = query.edit_message_text if query else update.message.reply_text
     if not _is_admin(update.effective_user):
-        await update.message.reply_text("⛔️ Только для администраторов.")
+        await reply("⛔️ Только для администраторов.")
         return
     
-    pending_requests = db.get_pending_gift_requests()
+    total = db.count_pending_gift_requests()
+    requests, has_prev, has_next = db.get_pending_gift_requests_page(
+        after_id=after_id, before_id=before_id, limit=GIFT_REQUESTS_PAGE_SIZE
+    )
+    if not requests and total:
+        # Заявки на этой странице уже обработаны — показываем первую
+        requests, has_prev, has_next = db.get_pending_gift_requests_page(limit=GIFT_REQUESTS_PAGE_SIZE)
     
-    if not pending_requests:
-        await update.message.reply_text(
+    if not requests:
+        await reply(
             f"📮 **Проверка заявок**\n\n"
             f"✅ Нет ожидающих заявок!\n\n"
             f"🎉 Все заявки обработаны.",
@@ -993,18 +1340,28 @@ async def show_gift_requests(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
     
     keyboard = []
-    for request in pending_requests:
-        request_id, user_id, username, links, created_at = request
-        links_count = len([link for link in links.split('\n') if 'tiktok.com' in link.lower()])
-        
+    for request_id, username, links_count in requests:
         keyboard.append([InlineKeyboardButton(
             f"📮 Заявка от @{username} ({links_count} ссылок)",
             callback_data=f"gift_request_{request_id}"
         )])
     
-    await update.message.reply_text(
+    navigation = []
+    if has_prev:
+        navigation.append(InlineKeyboardButton("⬅️ Назад", callback_data=f"gift_page_prev_{requests[0][0]}"))
+    if has_next:
+        navigation.append(InlineKeyboardButton("Далее ➡️", callback_data=f"gift_page_next_{requests[-1][0]}"))
+    if navigation:
+        keyboard.append(navigation)
+    page_range = f"{requests[0][0]}_{requests[-1][0]}"
+    keyboard.append([
+        InlineKeyboardButton("✅ Одобрить страницу", callback_data=f"gift_bulk_approve_{page_range}"),
+        InlineKeyboardButton("❌ Отклонить страницу", callback_data=f"gift_bulk_reject_{page_range}")
+    ])
+    
+    await reply(
         f"📮 **Проверка заявок**\n\n"
-        f"📄 Ожидает проверки: **{len(pending_requests)}** заявок\n\n"
+        f"📄 Ожидает проверки: **{total}** заявок\n\n"
         f"👇 Нажмите на заявку для проверки:",
         reply_markup=InlineKeyboardMarkup(keyboard),
         parse_mode='Markdown'
@@ -1021,19 +1378,37 @@ async def handle_gift_request_review(update: Update, context: ContextTypes.DEFAU
         return
     
     request_id, user_id, username, links, created_at = request
-    tiktok_links = [link.strip() for link in links.split('\n') if 'tiktok.com' in link.lower() or 'vm.tiktok.com' in link.lower()]
+    link_rows = db.get_gift_links(request_id)
+    if not link_rows:
+        # Заявки, созданные до учёта ссылок в gift_links, не проверялись автоматически
+        link_rows = [(None, link, None, None, 0)
+                     for link in map(extract_tiktok_link, links.split('\n')) if link]
+    reuse_count = sum(row[4] for row in link_rows)
+    passed = sum(1 for row in link_rows if row[2] == 'ok')
+    if any(row[2] is None for row in link_rows):
+        check_summary = "⏳ выполняется" if link_rows[0][0] is not None else "—"
+    else:
+        check_summary = f"{passed}/{len(link_rows)} ссылок доступны"
     
     request_text = (
         f"📮 **Заявка #{request_id}**\n\n"
         f"👤 **Пользователь:** @{username}\n"
         f"🔢 **User ID:** {user_id}\n"
         f"📅 **Дата:** {created_at}\n"
-        f"🔍 **Количество ссылок:** {len(tiktok_links)}\n\n"
+        f"🔍 **Количество ссылок:** {len(link_rows)}\n"
+        f"🤖 **Автопроверка:** {check_summary}\n"
+        f"♻️ **Попыток повторно использовать ссылки:** {reuse_count}\n\n"
         f"🔗 **Ссылки:**\n"
     )
     
-    for i, link in enumerate(tiktok_links[:10], 1):
-        request_text += f"{i}. {link}\n"
+    check_icons = {'ok': "✅", 'failed': "❌", None: "⏳"}
+    for i, (_, link, check_status, check_detail, _) in enumerate(link_rows[:10], 1):
+        if link_rows[0][0] is None:
+            request_text += f"{i}. {link}\n"
+        elif check_status == 'failed':
+            request_text += f"{i}. {check_icons[check_status]} {link} ({check_detail})\n"
+        else:
+            request_text += f"{i}. {check_icons[check_status]} {link}\n"
     
     keyboard = [
         [InlineKeyboardButton("✅ Одобрить", callback_data=f"approve_gift_{request_id}")],
@@ -1047,6 +1422,23 @@ async def handle_gift_request_review(update: Update, context: ContextTypes.DEFAU
         parse_mode='Markdown'
     )
 
+# Сообщения пользователю о решении по заявке
+GIFT_APPROVED_TEXT = (
+    "🎉 **Поздравляем!**\n\n"
+    "✅ Ваша заявка на подарок одобрена!\n"
+    "🎁 Спасибо за продвижение нашего бота!\n\n"
+    "👇 **Ваш подарок:**"
+)
+GIFT_REJECTED_TEXT = (
+    "😔 **Отказ в подарке**\n\n"
+    "❌ Ваша заявка не прошла проверку.\n\n"
+    "📝 **Возможные причины:**\n"
+    "• Недостаточно комментариев (10 шт.)\n"
+    "• Отсутствие упоминания @web4go_bot\n"
+    "• Некорректные ссылки\n\n"
+    "🔄 Можете попробовать снова!"
+)
+
 async def process_gift_request_decision(update: Update, context: ContextTypes.DEFAULT_TYPE, request_id: int, action: str):
     """Обработка решения по заявке"""
     query = update.callback_query
@@ -1063,9 +1455,10 @@ async def process_gift_request_decision(update: Update, context: ContextTypes.DE
     if action == "approve":
         # Одобряем заявку
         success = db.process_gift_request(request_id, "approved", admin_id)
+        pending_gift_users.discard(user_id)
         if success:
-            # Отправляем подарок пользователю
-            await send_gift_to_user(context, user_id)
+            # Уведомляем пользователя и отправляем подарок
+            await send_approved_gift(user_id, db.get_current_gift())
             
             await query.edit_message_text(
                 f"✅ **Заявка одобрена!**\n\n"
@@ -1073,22 +1466,13 @@ async def process_gift_request_decision(update: Update, context: ContextTypes.DE
                 f"🎁 Подарок отправлен!",
                 parse_mode='Markdown'
             )
-            
-            # Уведомляем пользователя
-            await context.bot.send_message(
-                user_id,
-                f"🎉 **Поздравляем!**\n\n"
-                f"✅ Ваша заявка на подарок одобрена!\n"
-                f"🎁 Спасибо за продвижение нашего бота!\n\n"
-                f"👇 **Ваш подарок:**",
-                parse_mode='Markdown'
-            )
         else:
             await query.edit_message_text("❌ Ошибка при обработке заявки.")
     
     elif action == "reject":
         # Отклоняем заявку
         success = db.process_gift_request(request_id, "rejected", admin_id)
+        pending_gift_users.discard(user_id)
         if success:
             await query.edit_message_text(
                 f"❌ **Заявка отклонена**\n\n"
@@ -1098,26 +1482,16 @@ async def process_gift_request_decision(update: Update, context: ContextTypes.DE
             )
             
             # Уведомляем пользователя
-            await context.bot.send_message(
-                user_id,
-                f"😔 **Отказ в подарке**\n\n"
-                f"❌ Ваша заявка не прошла проверку.\n\n"
-                f"📝 **Возможные причины:**\n"
-                f"• Недостаточно комментариев (10 шт.)\n"
-                f"• Отсутствие упоминания @web4go_bot\n"
-                f"• Некорректные ссылки\n\n"
-                f"🔄 Можете попробовать снова!",
-                parse_mode='Markdown'
-            )
+            await outbound.send_message(user_id, GIFT_REJECTED_TEXT, parse_mode='Markdown')
         else:
             await query.edit_message_text("❌ Ошибка при обработке заявки.")
 
-async def send_gift_to_user(context: ContextTypes.DEFAULT_TYPE, user_id: int):
-    """Отправка подарка пользователю"""
-    gift = db.get_current_gift()
+async def send_approved_gift(user_id: int, gift: Optional[Tuple]):
+    """Уведомление об одобрении, затем сам подарок — одинаково для одной заявки и для пачки"""
+    await outbound.send_message(user_id, GIFT_APPROVED_TEXT, parse_mode='Markdown')
     
     if not gift:
-        await context.bot.send_message(
+        await outbound.send_message(
             user_id,
             f"❌ **Подарок не настроен**\n\n"
             f"🛠 Администратор еще не установил подарок.\n"
@@ -1126,18 +1500,109 @@ async def send_gift_to_user(context: ContextTypes.DEFAULT_TYPE, user_id: int):
         )
         return
     
-    gift_type, content, file_id = gift
+    await _send_gift(user_id, gift)
+
+async def _send_gift(user_id: int, gift: Tuple):
+    """Отправка уже прочитанного подарка: копия исходного сообщения админа"""
+    gift_type, content, file_id, source_chat_id, source_message_id = gift
     
+    if source_message_id:
+        try:
+            await outbound.copy_message(user_id, source_chat_id, source_message_id, priority=PRIORITY_DELIVERY)
+            return
+        except BadRequest as e:
+            # Исходное сообщение удалено — отправляем по сохранённому file_id
+            logger.warning(f"Gift message copy failed, sending by file_id: {e}")
+    
+    caption = content if content else None
     if gift_type == 'text':
-        await context.bot.send_message(user_id, content)
+        await outbound.send_message(user_id, content, priority=PRIORITY_DELIVERY)
     elif gift_type == 'photo':
-        await context.bot.send_photo(user_id, file_id, caption=content if content else None)
+        await outbound.send_photo(user_id, file_id, caption=caption, priority=PRIORITY_DELIVERY)
     elif gift_type == 'document':
-        await context.bot.send_document(user_id, file_id, caption=content if content else None)
+        await outbound.send_document(user_id, file_id, caption=caption, priority=PRIORITY_DELIVERY)
     elif gift_type == 'video':
-        await context.bot.send_video(user_id, file_id, caption=content if content else None)
+        await outbound.send_video(user_id, file_id, caption=caption, priority=PRIORITY_DELIVERY)
     elif gift_type == 'audio':
-        await context.bot.send_audio(user_id, file_id, caption=content if content else None)
+        await outbound.send_audio(user_id, file_id, caption=caption, priority=PRIORITY_DELIVERY)
+
+async def process_gift_requests_bulk(update: Update, context: ContextTypes.DEFAULT_TYPE, action: str, **criteria):
+    """Одобрение/отклонение всех подходящих заявок одним действием"""
+    query = update.callback_query
+    reply = query.edit_message_text if query else update.message.reply_text
+    back_keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("🔙 К списку", callback_data="back_to_gift_requests")]])
+    
+    gift = None
+    if action == "approve":
+        # Подарок читается один раз на всю пачку
+        gift = db.get_current_gift()
+        if not gift:
+            await reply("❌ Подарок не настроен. Сначала установите его: /setgift")
+            return
+    
+    status = "approved" if action == "approve" else "rejected"
+    requests = db.process_gift_requests_bulk(status, update.effective_user.id, **criteria)
+    pending_gift_users.difference_update(user_id for _, user_id, _ in requests)
+    if not requests:
+        await reply("📭 Нет подходящих заявок.", reply_markup=back_keyboard)
+        return
+    
+    verb = "Одобрено" if action == "approve" else "Отклонено"
+    await reply(
+        f"⏳ {verb} заявок: {len(requests)}\n"
+        f"📤 Уведомления отправляются, итог придёт отдельным сообщением.",
+        reply_markup=back_keyboard
+    )
+    # Рассылка идёт в фоне через очередь исходящих, не задерживая админа
+    context.application.create_task(
+        _notify_gift_decisions(update.effective_chat.id, requests, action, gift)
+    )
+
+async def _notify_gift_decisions(admin_chat_id: int, requests: List[Tuple], action: str, gift: Optional[Tuple]):
+    """Уведомление пользователей о решении по пачке заявок и итог для админа"""
+    async def notify(user_id: int):
+        if action == "approve":
+            await send_approved_gift(user_id, gift)
+        else:
+            await outbound.send_message(user_id, GIFT_REJECTED_TEXT, parse_mode='Markdown')
+    
+    results = await asyncio.gather(*(notify(user_id) for _, user_id, _ in requests), return_exceptions=True)
+    failed = sum(isinstance(result, Exception) for result in results)
+    verb = "Одобрено" if action == "approve" else "Отклонено"
+    await outbound.send_message(
+        admin_chat_id,
+        f"✅ {verb} заявок: {len(requests)}\n"
+        f"📨 Уведомлено: {len(requests) - failed}\n"
+        f"❌ Не доставлено: {failed}"
+    )
+
+async def gift_bulk_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/giftbulk approve|reject [all|>=N|<=N] — решение по всем подходящим заявкам"""
+    if not _is_admin(update.effective_user):
+        await update.message.reply_text("⛔️ Только для администраторов.")
+        return
+    
+    args = context.args or []
+    action = args[0] if args else None
+    condition = args[1] if len(args) > 1 else "all"
+    criteria = {}
+    if condition.startswith(">=") and condition[2:].isdigit():
+        criteria['min_links'] = int(condition[2:])
+    elif condition.startswith("<=") and condition[2:].isdigit():
+        criteria['max_links'] = int(condition[2:])
+    elif condition != "all":
+        action = None
+    
+    if action not in ("approve", "reject"):
+        await update.message.reply_text(
+            "Использование:\n"
+            "/giftbulk approve all - одобрить все ожидающие заявки\n"
+            "/giftbulk approve >=10 - одобрить заявки с 10+ ссылками\n"
+            "/giftbulk reject <=9 - отклонить заявки с 9 и меньше ссылками"
+        )
+        return
+    
+    await process_gift_requests_bulk(update, context, action, **criteria)
 
 async def set_gift(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда для установки подарка"""
@@ -1145,7 +1610,7 @@ async def set_gift(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⛔️ Только для администраторов.")
         return
     
-    context.user_data["awaiting_gift_setup"] = True
+    _flow(update)["awaiting_gift_setup"] = True
     await update.message.reply_text(
         f"🎁 **Настройка подарка**\n\n"
         f"📝 Отправьте подарок (текст или файл):\n\n"
@@ -1161,14 +1626,16 @@ async def set_gift(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def handle_gift_setup(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка установки подарка"""
-    if not context.user_data.get("awaiting_gift_setup"):
+    if not _flow(update).get("awaiting_gift_setup"):
         return
     
-    context.user_data["awaiting_gift_setup"] = False
+    _flow(update)["awaiting_gift_setup"] = False
+    # Подарок доставляется копией этого сообщения
+    source = {'source_chat_id': update.effective_chat.id, 'source_message_id': update.message.message_id}
     
     if update.message.text:
         # Текстовый подарок
-        db.save_gift('text', update.message.text)
+        db.save_gift('text', update.message.text, **source)
         await update.message.reply_text(
             f"✅ **Подарок сохранен!**\n\n"
             f"📝 Тип: Текст\n"
@@ -1180,7 +1647,7 @@ async def handle_gift_setup(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Фото
         file_id = update.message.photo[-1].file_id
         caption = update.message.caption or ''
-        db.save_gift('photo', caption, file_id)
+        db.save_gift('photo', caption, file_id, **source)
         await update.message.reply_text(
             f"✅ **Подарок сохранен!**\n\n"
             f"📝 Тип: Фото\n"
@@ -1192,7 +1659,7 @@ async def handle_gift_setup(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Документ
         file_id = update.message.document.file_id
         caption = update.message.caption or ''
-        db.save_gift('document', caption, file_id)
+        db.save_gift('document', caption, file_id, **source)
         await update.message.reply_text(
             f"✅ **Подарок сохранен!**\n\n"
             f"📝 Тип: Документ\n"
@@ -1205,7 +1672,7 @@ async def handle_gift_setup(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Видео
         file_id = update.message.video.file_id
         caption = update.message.caption or ''
-        db.save_gift('video', caption, file_id)
+        db.save_gift('video', caption, file_id, **source)
         await update.message.reply_text(
             f"✅ **Подарок сохранен!**\n\n"
             f"📝 Тип: Видео\n"
@@ -1217,7 +1684,7 @@ async def handle_gift_setup(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Аудио
         file_id = update.message.audio.file_id
         caption = update.message.caption or ''
-        db.save_gift('audio', caption, file_id)
+        db.save_gift('audio', caption, file_id, **source)
         await update.message.reply_text(
             f"✅ **Подарок сохранен!**\n\n"
             f"📝 Тип: Аудио\n"
@@ -1239,9 +1706,9 @@ async def finish_adding_logs(update: Update, context: ContextTypes.DEFAULT_TYPE,
     await query.answer()
     
     # Очищаем контекст
-    context.user_data.pop("current_account_id", None)
+    _flow(update).pop("current_account_id", None)
     if mode == "adding":
-        context.user_data.pop("awaiting_lot_data", None)
+        _flow(update).pop("awaiting_lot_data", None)
     
     total = db.count_available_credentials(account_id)
     account_info = db.get_account(account_id)
@@ -1296,7 +1763,7 @@ async def handle_crypto_purchase(update: Update, context: ContextTypes.DEFAULT_T
                 
                 if invoice_id:
                     # Добавляем в очередь с информацией о платеже
-                    queue_id = db.add_to_purchase_queue(
+                    queue_id = await db_writer.add_to_purchase_queue(
                         user_id=user_id,
                         account_id=account_id,
                         payment_type="crypto",
@@ -1306,11 +1773,11 @@ async def handle_crypto_purchase(update: Update, context: ContextTypes.DEFAULT_T
                         payment_status="pending"
                     )
                     
-                    context.bot_data[f"payment_{user_id}_{account_id}"] = {
+                    pending_payments.set(f"payment_{user_id}_{account_id}", {
                         "invoice_id": str(invoice_id),
                         "payment_type": "crypto",
                         "queue_id": queue_id
-                    }
+                    })
                     
                     queue_size = db.get_queue_size(account_id)
                     
@@ -1363,10 +1830,10 @@ async def handle_crypto_purchase(update: Update, context: ContextTypes.DEFAULT_T
             payment_url = result.get("pay_url")
             invoice_id = result.get("invoice_id") or result.get("id")
             if invoice_id:
-                context.bot_data[f"payment_{user_id}_{account_id}"] = {
+                pending_payments.set(f"payment_{user_id}_{account_id}", {
                     "invoice_id": str(invoice_id),
                     "payment_type": "crypto"
-                }
+                })
             payment_text = (
                 f"📎 Покупка лота #{account_id}\n"
                 f"💰 Сумма: {account[2]} {CRYPTO_ASSET}\n\n"
@@ -1411,7 +1878,7 @@ async def handle_rub_purchase(update: Update, context: ContextTypes.DEFAULT_TYPE
     # Если аккаунтов нет, добавляем в очередь
     if available_count == 0:
         # Добавляем в очередь для рублевых платежей
-        queue_id = db.add_to_purchase_queue(
+        queue_id = await db_writer.add_to_purchase_queue(
             user_id=user_id,
             account_id=account_id,
             payment_type="rub",
@@ -1421,7 +1888,7 @@ async def handle_rub_purchase(update: Update, context: ContextTypes.DEFAULT_TYPE
             payment_status="pending"
         )
         
-        context.bot_data[f"rub_order_{user_id}_{account_id}"] = {
+        pending_payments.set(f"rub_order_{user_id}_{account_id}", {
             "account_id": account_id,
             "user_id": user_id,
             "username": username,
@@ -1429,7 +1896,7 @@ async def handle_rub_purchase(update: Update, context: ContextTypes.DEFAULT_TYPE
             "price_rub": rub_price,
             "payment_type": "rub",
             "queue_id": queue_id
-        }
+        })
         
         queue_size = db.get_queue_size(account_id)
         
@@ -1464,14 +1931,14 @@ async def handle_rub_purchase(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
     
     # Сохраняем информацию о заказе для ручной проверки
-    context.bot_data[f"rub_order_{user_id}_{account_id}"] = {
+    pending_payments.set(f"rub_order_{user_id}_{account_id}", {
         "account_id": account_id,
         "user_id": user_id,
         "username": username,
         "price_usdt": account[2],
         "price_rub": rub_price,
         "payment_type": "rub"
-    }
+    })
     
     payment_text = (
         f"💵 Покупка лота #{account_id} за рубли\n\n"
@@ -1627,6 +2094,26 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if query.data == "back_to_gift_requests":
         await show_gift_requests(update, context)
         return
+    
+    if query.data.startswith("myorders_"):
+        cursor = query.data.split("_")[1]
+        await my_orders(update, context, before_order_id=None if cursor == "start" else int(cursor))
+        return
+    
+    if query.data.startswith("gift_bulk_"):
+        if not _is_admin(update.effective_user):
+            return
+        _, _, action, first_id, last_id = query.data.split("_")
+        await process_gift_requests_bulk(update, context, action, first_id=int(first_id), last_id=int(last_id))
+        return
+    
+    if query.data.startswith("gift_page_"):
+        _, _, direction, request_id = query.data.split("_")
+        if direction == "next":
+            await show_gift_requests(update, context, after_id=int(request_id))
+        else:
+            await show_gift_requests(update, context, before_id=int(request_id))
+        return
 
     # Legacy/unused branches removed: crypto_select_ and pay_
 
@@ -1643,7 +2130,7 @@ async def check_payment_status(update: Update, context: ContextTypes.DEFAULT_TYP
     
     try:
         crypto_bot = CryptoBot(CRYPTO_BOT_TOKEN)
-        payment = context.bot_data.get(f"payment_{user_id}_{account_id}")
+        payment = pending_payments.get(f"payment_{user_id}_{account_id}")
         
         if not payment:
             await query.edit_message_text(
@@ -1664,33 +2151,43 @@ async def check_payment_status(update: Update, context: ContextTypes.DEFAULT_TYP
             status = None
         
         if status == 'paid':
-            payment_data = context.bot_data.get(f"payment_{user_id}_{account_id}", {})
+            payment_data = pending_payments.get(f"payment_{user_id}_{account_id}", {})
             queue_id = payment_data.get("queue_id")
             
             # Обновляем статус в очереди, если это платеж из очереди
             if queue_id:
-                db.update_queue_payment_status(user_id, account_id, payment['invoice_id'], 'paid')
+                await db_writer.update_queue_payment_status(user_id, account_id, payment['invoice_id'], 'paid')
             
-            success, delivered_details, accounts_depleted = db.mark_account_sold(account_id, user_id, account[2])
+            success, delivered_details, accounts_depleted = await db_writer.mark_account_sold(
+                account_id, user_id, account[2],
+                delivery_kind="crypto", delivery_payload={"price": account[2]},
+                payment_type="crypto"
+            )
             if success:
                 # Моркнуть запись в очереди как выполненную
                 if queue_id:
                     db.mark_queue_entry_fulfilled(queue_id)
                 
+                # Данные отправляются отдельным сообщением из delivery_outbox,
+                # чтобы они не пропали при редактировании этого сообщения
+                delivery_sender.kick()
                 await query.edit_message_text(
-                    render_delivery_message(account_id, delivered_details or account[1], account[2])
+                    f"✅ Оплата получена!\n\n"
+                    f"🎮 Аккаунт #{account_id}\n"
+                    f"📨 Данные для входа отправлены отдельным сообщением.\n\n"
+                    f"Спасибо за покупку! 🎉"
                 )
-                context.bot_data.pop(f"payment_{user_id}_{account_id}", None)
+                pending_payments.pop(f"payment_{user_id}_{account_id}")
                 
                 # Уведомляем админа, если аккаунты закончились
                 if accounts_depleted:
-                    await notify_admin_about_depletion(context, account_id)
+                    alerts.record(ALERT_DEPLETED, account_id)
             else:
                 # Нет доступных логов - требуется очередь
                 if not queue_id:
                     # Покупатель не был в очереди, добавляем
                     username = update.effective_user.username or f"id{user_id}"
-                    db.add_to_purchase_queue(
+                    await db_writer.add_to_purchase_queue(
                         user_id=user_id,
                         account_id=account_id,
                         payment_type="crypto",
@@ -1708,10 +2205,10 @@ async def check_payment_status(update: Update, context: ContextTypes.DEFAULT_TYP
                         f"вы автоматически получите аккаунт!"
                     )
                     # Уведомляем админа о новом покупателе в очереди
-                    await notify_admin_about_depletion(context, account_id)
+                    alerts.record(ALERT_QUEUE_GROWTH, account_id, critical=True)
                 else:
                     # Покупатель уже в очереди, обновляем статус
-                    db.update_queue_payment_status(user_id, account_id, payment['invoice_id'], 'paid')
+                    await db_writer.update_queue_payment_status(user_id, account_id, payment['invoice_id'], 'paid')
                     queue_size = db.get_queue_size(account_id)
                     await query.edit_message_text(
                         f"✅ Оплата получена!\n\n"
@@ -1769,35 +2266,35 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Обработка ввода данных администратором
     elif is_admin:
         # Обработка создания лота
-        if context.user_data.get("awaiting_lot_data"):
+        if _flow(update).get("awaiting_lot_data"):
             await add_account(update, context)
         # Обработка добавления логов к лоту
-        elif context.user_data.get("current_account_id"):
+        elif _flow(update).get("current_account_id"):
             # Проверяем, какой режим активен
-            if context.user_data.get("awaiting_lot_data"):
+            if _flow(update).get("awaiting_lot_data"):
                 await add_account(update, context)
             else:
                 await add_logs_to_existing_lot(update, context)
         # Обработка пополнения лота
-        elif context.user_data.get("awaiting_lot_refill"):
+        elif _flow(update).get("awaiting_lot_refill"):
             await add_logs_to_existing_lot(update, context)
         # Обработка обновления цены
-        elif context.user_data.get("awaiting_price_update") and "|" in text:
+        elif _flow(update).get("awaiting_price_update") and "|" in text:
             await update_price(update, context)
-            context.user_data["awaiting_price_update"] = False
+            _flow(update)["awaiting_price_update"] = False
         # Обработка удаления аккаунта
-        elif text.isdigit() and context.user_data.get("awaiting_account_delete"):
+        elif text.isdigit() and _flow(update).get("awaiting_account_delete"):
             await delete_account(update, context)
-            context.user_data["awaiting_account_delete"] = False
+            _flow(update)["awaiting_account_delete"] = False
         # Обработка подтверждения платежа
-        elif context.user_data.get("awaiting_payment_confirm") and "|" in text:
+        elif _flow(update).get("awaiting_payment_confirm") and "|" in text:
             await confirm_rub_payment(update, context)
         # Обработка настройки подарка
-        elif context.user_data.get("awaiting_gift_setup"):
+        elif _flow(update).get("awaiting_gift_setup"):
             await handle_gift_setup(update, context)
     
     # Обработка заявок на подарки от обычных пользователей
-    elif context.user_data.get("awaiting_gift_links"):
+    elif _flow(update).get("awaiting_gift_links"):
         await handle_gift_request(update, context)
 
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1829,13 +2326,16 @@ async def handle_webhook(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 account = db.get_account(account_id)
                 
                 if account and account[3]:  # account[3] is available status
-                    success, delivered_details = db.mark_account_sold(account_id, user_id, account[2])
+                    success, delivered_details, accounts_depleted = await db_writer.mark_account_sold(
+                        account_id, user_id, account[2],
+                        delivery_kind="crypto", delivery_payload={"price": account[2]},
+                        payment_type="crypto"
+                    )
                     if success:
-                        await context.bot.send_message(
-                            user_id,
-                            render_delivery_message(account_id, delivered_details or account[1], account[2])
-                        )
-                        context.bot_data.pop(f"payment_{user_id}_{account_id}", None)
+                        delivery_sender.kick()
+                        pending_payments.pop(f"payment_{user_id}_{account_id}")
+                        if accounts_depleted:
+                            alerts.record(ALERT_DEPLETED, account_id)
                     else:
                         logger.error(f"Failed to mark account {account_id} as sold")
                 else:
@@ -1846,17 +2346,373 @@ async def handle_webhook(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception as e:
         logger.error(f"Webhook error: {e}")
 
+# Лимит Telegram на размер файла, отправляемого ботом
+EXPORT_MAX_BYTES = 50 * 1024 * 1024
+
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/export orders|credentials|queue [lot=ID] [from=ГГГГ-ММ-ДД] [to=ГГГГ-ММ-ДД] — выгрузка CSV.gz"""
+    if not _is_admin(update.effective_user):
+        await update.message.reply_text("⛔️ Только для администраторов.")
+        return
+    
+    args = context.args or []
+    kind = args[0] if args else None
+    filters_ = {}
+    valid = kind in ("orders", "credentials", "queue")
+    for arg in args[1:]:
+        name, _, value = arg.partition("=")
+        if name == "lot" and value.isdigit():
+            filters_['account_id'] = int(value)
+        elif name in ("from", "to") and len(value) == 10:
+            try:
+                datetime.strptime(value, '%Y-%m-%d')
+            except ValueError:
+                valid = False
+            filters_['date_from' if name == "from" else 'date_to'] = value
+        else:
+            valid = False
+    if not valid:
+        await update.message.reply_text(
+            "Использование:\n"
+            "/export orders|credentials|queue [lot=ID] [from=2024-01-01] [to=2024-01-31]\n\n"
+            "Даты в UTC, включительно. Для credentials фильтр по дате продажи."
+        )
+        return
+    
+    # Отчёт строится в фоне, чтобы команда отмены не ждала его завершения
+    context.application.create_task(_deliver_report(update.effective_chat.id, 'export', kind, kind=kind, **filters_))
+
+async def _deliver_report(chat_id: int, name: str, title: str, **params):
+    """Построение отчёта в пуле процессов и отправка файла админу"""
+    fd, path = tempfile.mkstemp(suffix='.csv.gz')
+    os.close(fd)
+    try:
+        job_id = reports.submit(name, path, **params)
+        await outbound.send_message(chat_id, f"⏳ Отчёт #{job_id} ({title}) готовится. Отменить: /report cancel {job_id}")
+        try:
+            count = await reports.wait(job_id)
+        except ReportCancelled as e:
+            reason = "превышено время ожидания" if str(e) == 'timeout' else "отменён"
+            await outbound.send_message(chat_id, f"❌ Отчёт #{job_id}: {reason}.")
+            return
+        except Exception as e:
+            logger.error(f"Report #{job_id} ({name}) failed: {e}")
+            await outbound.send_message(chat_id, f"❌ Отчёт #{job_id} не удалось построить.")
+            return
+        if os.path.getsize(path) > EXPORT_MAX_BYTES:
+            await outbound.send_message(chat_id, "❌ Файл больше 50 МБ. Сузьте период или выберите лот.")
+            return
+        filename = f"{title}_{datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')}.csv.gz"
+        await outbound.send_document(
+            chat_id,
+            Path(path),
+            filename=filename,
+            caption=f"📤 {title}: {count} строк"
+        )
+    finally:
+        os.remove(path)
+
+async def report_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/report lots|links — полные отчёты, /report cancel N — отмена, /report — текущие"""
+    if not _is_admin(update.effective_user):
+        await update.message.reply_text("⛔️ Только для администраторов.")
+        return
+    
+    args = context.args or []
+    if args and args[0] in ("lots", "links"):
+        title = "lots" if args[0] == "lots" else "link_reuse"
+        context.application.create_task(_deliver_report(update.effective_chat.id, args[0], title))
+        return
+    if len(args) == 2 and args[0] == "cancel" and args[1].isdigit():
+        if reports.cancel(int(args[1])):
+            await update.message.reply_text(f"🛑 Отчёт #{args[1]} отменяется.")
+        else:
+            await update.message.reply_text(f"❌ Отчёт #{args[1]} не найден или уже готов.")
+        return
+    
+    jobs = reports.jobs()
+    lines = ["Использование:", "/report lots - статистика по всем лотам",
+             "/report links - повторно отправленные ссылки на подарки",
+             "/report cancel N - отменить отчёт", "/export - выгрузка заказов, логов или очереди"]
+    if jobs:
+        lines.append("\n⏳ Строятся:")
+        for job in jobs:
+            lines.append(f"#{job['id']} {job['name']}")
+    await update.message.reply_text("\n".join(lines))
+
+async def show_metrics(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Метрики внутреннего состояния бота (только для админа)"""
+    if not _is_admin(update.effective_user):
+        await update.message.reply_text("⛔️ Только для администраторов.")
+        return
+    
+    lines = ["📊 Метрики бота\n"]
+    for store in (pending_payments, user_flows, gift_submit_cooldown):
+        stats = store.stats()
+        lines.append(
+            f"🗂 {stats['name']}: {stats['size']}/{stats['max_entries']} записей, "
+            f"~{stats['approx_bytes'] // 1024} КБ\n"
+            f"   истекло: {stats['expired']}, вытеснено: {stats['evicted']}, "
+            f"попаданий: {stats['hits']}, промахов: {stats['misses']}"
+        )
+    stats = outbound.stats()
+    by_priority = ", ".join(f"{name}: {count}" for name, count in stats['sent_by_priority'].items())
+    lines.append(
+        f"📤 Исходящие: в очереди {stats['queued']}, отправляется {stats['in_flight']}, "
+        f"отправлено {stats['sent']} ({by_priority})\n"
+        f"   ошибок: {stats['failed']}, повторов: {stats['retried']}, flood wait: {stats['flood_waits']}, "
+        f"средняя задержка: {stats['avg_latency_ms']:.0f} мс"
+    )
+    stats = refill_worker.stats()
+    lines.append(
+        f"🔄 Пополнения: сигналов {stats['signals']}, проходов по очереди {stats['passes']}, "
+        f"ожидают: {stats['pending_lots']} лотов"
+    )
+    stats = media.stats()
+    lines.append(
+        f"🖼 Картинки: загрузок {stats['uploads']}, отправлено по file_id {stats['cached_sends']}"
+    )
+    total_users, active_users = db.count_users()
+    stats = activity.stats()
+    lines.append(
+        f"👤 Пользователи: всего {total_users}, активны за сутки {active_users}, "
+        f"ожидают записи: {stats['buffered']}"
+    )
+    lines.append(f"🎁 Пользователей с ожидающей заявкой: {len(pending_gift_users)}")
+    running = db.get_broadcasts(status='running')
+    lines.append(
+        f"📣 Рассылки: идёт {len(running)}, отправлено с запуска {broadcasts.stats()['sent']}"
+    )
+    stats = link_verifier.stats()
+    lines.append(
+        f"🔗 Проверка ссылок: запросов {stats['requests']}, из кэша {stats['cache_hits']}"
+    )
+    stats = db_writer.stats()
+    lines.append(
+        f"💾 Запись в БД: {stats['writes']} записей за {stats['commits']} транзакций "
+        f"(до {stats['largest_batch']} в одной), в очереди: {stats['queued']}, "
+        f"повторов из-за блокировки: {stats['retried']}"
+    )
+    stats = db.stats()
+    if stats['backend'] == 'memory':
+        lines.append(
+            f"🧠 Хранилище в памяти: строк {stats['rows']}, снимков {stats['snapshots']}, "
+            f"последний: {stats['last_snapshot_at'] or 'ещё не было'}"
+        )
+    else:
+        lines.append(
+            f"📖 Чтение из БД: открыто соединений {stats['opened']}, повторных использований {stats['reused']}"
+        )
+    stats = reports.stats()
+    lines.append(
+        f"📄 Отчёты: строятся {stats['running']}, готово {stats['completed']}, "
+        f"отменено {stats['cancelled']}, ошибок {stats['failed']}"
+    )
+    stats = alerts.stats()
+    lines.append(
+        f"🔔 Уведомления: записано {stats['recorded']}, сводок {stats['digests_sent']}, "
+        f"срочных {stats['critical_sent']}"
+    )
+    processor = context.application.update_processor
+    if isinstance(processor, KeyedUpdateProcessor):
+        stats = processor.stats()
+        lines.append(
+            f"⚙️ Обработка обновлений: {stats['active']}/{stats['workers']} воркеров заняты, "
+            f"в ожидании: {stats['waiting']}, обработано: {stats['processed']}"
+        )
+    await update.message.reply_text("\n".join(lines))
+
+async def show_stuck_deliveries(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Зависшие выдачи из delivery_outbox (только для админа)"""
+    if not _is_admin(update.effective_user):
+        await update.message.reply_text("⛔️ Только для администраторов.")
+        return
+    
+    if context.args and context.args[0] == "retry":
+        count = db.retry_failed_deliveries()
+        delivery_sender.kick()
+        await update.message.reply_text(f"🔄 Повторная отправка запущена для {count} выдач.")
+        return
+    
+    counts = db.count_deliveries_by_status()
+    stuck = db.get_stuck_deliveries()
+    lines = [
+        f"📨 Выдачи: доставлено {counts.get('delivered', 0)}, "
+        f"в очереди {counts.get('pending', 0)}, ошибок {counts.get('failed', 0)}\n"
+    ]
+    if not stuck:
+        lines.append("✅ Зависших выдач нет.")
+    for delivery in stuck:
+        status_emoji = "❌" if delivery['status'] == 'failed' else "⏳"
+        lines.append(
+            f"{status_emoji} #{delivery['id']} | лот #{delivery['account_id']} → {delivery['user_id']}\n"
+            f"   попыток: {delivery['attempts']}, создана: {delivery['created_at']}\n"
+            f"   ошибка: {delivery['last_error'] or '—'}"
+        )
+    if counts.get('failed'):
+        lines.append("\n🔄 Повторить неудачные: /deliveries retry")
+    await update.message.reply_text("\n".join(lines))
+
+# Названия сегментов рассылки
+BROADCAST_SEGMENT_NAMES = {
+    'all': "все пользователи",
+    'buyers': "покупатели лота",
+    'queue': "очередь лота",
+}
+BROADCAST_STATUS_NAMES = {
+    'running': "⏳ идёт",
+    'paused': "⏸ на паузе",
+    'done': "✅ завершена",
+    'cancelled': "🛑 отменена",
+}
+
+def render_broadcast_status(job: dict) -> str:
+    """Текст прогресса рассылки"""
+    segment = BROADCAST_SEGMENT_NAMES.get(job['segment'], job['segment'])
+    if job['account_id']:
+        segment += f" #{job['account_id']}"
+    return (
+        f"📣 Рассылка #{job['id']} ({segment})\n"
+        f"Статус: {BROADCAST_STATUS_NAMES.get(job['status'], job['status'])}\n"
+        f"📨 Отправлено: {job['sent']}/{job['total']}\n"
+        f"❌ Ошибок: {job['failed']}, 🚫 заблокировали бота: {job['blocked']}"
+    )
+
+async def report_broadcast_progress(job: dict):
+    """Обновление сообщения с прогрессом рассылки у админа"""
+    if job['progress_message_id']:
+        await outbound.edit_message_text(
+            job['progress_chat_id'],
+            job['progress_message_id'],
+            render_broadcast_status(job),
+            priority=PRIORITY_NOTIFICATION
+        )
+
+broadcasts = BroadcastRunner(
+    db,
+    outbound,
+    on_progress=report_broadcast_progress,
+    batch_size=int(os.getenv('BROADCAST_BATCH_SIZE', '50'))
+)
+
+async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/broadcast — рассылка сообщения сегменту пользователей (только для админа)"""
+    if not _is_admin(update.effective_user):
+        await update.message.reply_text("⛔️ Только для администраторов.")
+        return
+    
+    args = context.args or []
+    command = args[0] if args else None
+    
+    if command in ("cancel", "pause", "resume") and len(args) > 1 and args[1].isdigit():
+        job_id = int(args[1])
+        status = {'cancel': 'cancelled', 'pause': 'paused', 'resume': 'running'}[command]
+        if not db.set_broadcast_status(job_id, status):
+            await update.message.reply_text(f"❌ Рассылка #{job_id} не найдена или уже завершена.")
+            return
+        if status == 'running':
+            broadcasts.kick()
+        await update.message.reply_text(render_broadcast_status(db.get_broadcast(job_id)))
+        return
+    
+    segment = command
+    account_id = None
+    if segment in ("buyers", "queue"):
+        if len(args) < 2 or not args[1].isdigit():
+            segment = None
+        else:
+            account_id = int(args[1])
+    source = update.message.reply_to_message
+    
+    if segment not in BROADCAST_SEGMENT_NAMES or source is None:
+        lines = [
+            "📣 Рассылка: ответьте командой на сообщение, которое нужно разослать.\n",
+            "/broadcast all - всем пользователям",
+            "/broadcast buyers ID - покупателям лота",
+            "/broadcast queue ID - ожидающим в очереди лота",
+            "/broadcast pause|resume|cancel N - управление рассылкой",
+        ]
+        jobs = db.get_broadcasts(limit=5)
+        if jobs:
+            lines.append("\n🗂 Последние рассылки:")
+            lines.extend(f"\n{render_broadcast_status(job)}" for job in jobs)
+        await update.message.reply_text("\n".join(lines))
+        return
+    
+    job_id = db.create_broadcast(segment, account_id, update.effective_chat.id, source.message_id,
+                                 update.effective_user.id)
+    progress = await update.message.reply_text(render_broadcast_status(db.get_broadcast(job_id)))
+    db.set_broadcast_progress_message(job_id, progress.chat_id, progress.message_id)
+    broadcasts.kick()
+
+async def track_activity(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отметка активности пользователя для каждого обновления"""
+    activity.touch(update.effective_user)
+
+# Фоновые задачи, запускаемые вместе с ботом
+_background_tasks = []
+
+async def post_init(application: Application):
+    """Запуск фоновых задач после инициализации бота"""
+    outbound.start(application.bot)
+    db_writer.start()
+    loop = asyncio.get_running_loop()
+    for store in (pending_payments, user_flows, gift_submit_cooldown):
+        _background_tasks.append(loop.create_task(store.run_sweeper(STATE_SWEEP_INTERVAL)))
+    _background_tasks.append(loop.create_task(delivery_sender.run()))
+    _background_tasks.append(loop.create_task(refill_worker.run()))
+    _background_tasks.append(loop.create_task(alerts.run()))
+    _background_tasks.append(loop.create_task(activity.run()))
+    _background_tasks.append(loop.create_task(broadcasts.run()))
+    _background_tasks.append(loop.create_task(run_schema_backfills()))
+    if db.snapshot_path:
+        _background_tasks.append(loop.create_task(snapshot_storage_periodically(STORAGE_SNAPSHOT_INTERVAL)))
+    _background_tasks.append(loop.create_task(
+        refresh_sales_rollups_periodically(float(os.getenv('ROLLUP_INTERVAL', '60')))
+    ))
+
+async def post_stop(application: Application):
+    """Остановка фоновых задач"""
+    for task in _background_tasks:
+        task.cancel()
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+    _background_tasks.clear()
+    activity.flush()
+    # Отправляем накопленную сводку до остановки очереди исходящих
+    await alerts.flush()
+    await outbound.stop()
+    await link_verifier.close()
+    reports.close()
+    await db_writer.stop()
+    db.close()
+
 def main():
     """Start the bot"""
-    application = Application.builder().token(BOT_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .concurrent_updates(KeyedUpdateProcessor(UPDATE_WORKERS, _update_order_key))
+        .build()
+    )
 
     # Add handlers
+    application.add_handler(TypeHandler(Update, track_activity), group=-1)
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(CommandHandler("whoami", whoami))
+    application.add_handler(CommandHandler("myorders", my_orders))
     application.add_handler(CommandHandler("make_me_admin", make_me_admin))
     application.add_handler(CommandHandler("test_purchase", test_purchase))
     application.add_handler(CommandHandler("setgift", set_gift))
+    application.add_handler(CommandHandler("stats", show_sales_stats))
+    application.add_handler(CommandHandler("metrics", show_metrics))
+    application.add_handler(CommandHandler("export", export_command))
+    application.add_handler(CommandHandler("report", report_command))
+    application.add_handler(CommandHandler("deliveries", show_stuck_deliveries))
+    application.add_handler(CommandHandler("giftbulk", gift_bulk_command))
+    application.add_handler(CommandHandler("broadcast", broadcast_command))
     application.add_handler(CallbackQueryHandler(button_callback))
     
     # Handle text messages
@@ -1875,8 +2731,33 @@ def main():
     application.add_error_handler(error_handler)
 
     # Start the bot
-    print("🚀 Бот запущен...")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if BOT_MODE == 'webhook':
+        run_webhook(application)
+    else:
+        print("🚀 Бот запущен (polling)...")
+        application.run_polling(allowed_updates=ALLOWED_UPDATES)
+
+def _webhook_path() -> str:
+    """Секретный путь вебхука: WEBHOOK_PATH или производный от токена"""
+    if WEBHOOK_PATH:
+        return WEBHOOK_PATH
+    return hashlib.sha256(BOT_TOKEN.encode()).hexdigest()[:32]
+
+def run_webhook(application: Application):
+    """Запуск бота в режиме вебхука (за балансировщиком/прокси Railway)"""
+    if not WEBHOOK_URL:
+        raise RuntimeError("BOT_MODE=webhook требует переменную WEBHOOK_URL")
+    url_path = _webhook_path()
+    print(f"🚀 Бот запущен (webhook) на {WEBHOOK_LISTEN}:{WEBHOOK_PORT}...")
+    application.run_webhook(
+        listen=WEBHOOK_LISTEN,
+        port=WEBHOOK_PORT,
+        url_path=url_path,
+        webhook_url=f"{WEBHOOK_URL}/{url_path}",
+        secret_token=WEBHOOK_SECRET_TOKEN,
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+        allowed_updates=ALLOWED_UPDATES
+    )
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,29 @@
+"""Opening SQLite connections to database files and to shared in-memory databases."""
+
+import sqlite3
+from urllib.parse import parse_qsl
+
+
+def is_memory_uri(db_file: str) -> bool:
+    """True for shared in-memory URIs: file::memory:?cache=shared or file:name?mode=memory&cache=shared.
+
+    An in-memory database without cache=shared (including plain ':memory:') belongs to the
+    one connection that opened it, so the read pool, the writer and the migrations would each
+    see an empty database of their own: such names raise ValueError.
+    """
+    if db_file == ':memory:':
+        raise ValueError("':memory:' is private to one connection; use file::memory:?cache=shared")
+    if not db_file.startswith('file:'):
+        return False
+    path, _, query = db_file[len('file:'):].partition('#')[0].partition('?')
+    params = dict(parse_qsl(query))
+    if path != ':memory:' and params.get('mode') != 'memory':
+        return False
+    if params.get('cache') != 'shared':
+        raise ValueError(f"In-memory database {db_file} is private to one connection; add cache=shared")
+    return True
+
+
+def connect(db_file: str, **kwargs) -> sqlite3.Connection:
+    # Only names starting with file: are parsed as URIs, plain paths open as before
+    return sqlite3.connect(db_file, uri=True, **kwargs)
@@ -1,98 +1,152 @@
+import json
 import sqlite3
-from typing import List, Tuple
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from database.connection import connect, is_memory_uri
+from database.migrations import apply_migrations, count_links, run_backfills
+
+# Marker for a cache that has not been read from the database yet
+_NOT_LOADED = object()
+
+
+class ReadPool:
+    """Reusable read-only connections (mode=ro, query_only) for read methods.
+
+    acquire() hands out an idle connection or opens a new one, so concurrent readers on
+    worker threads never wait for each other; release() keeps up to `size` connections
+    for reuse; read methods use connection(), which pairs the two in a with block. With WAL,
+    these readers run in parallel with the writer. size=0 opens and closes a connection per
+    call.
+    """
+
+    def __init__(self, db_file: str, size: int = 4):
+        if is_memory_uri(db_file):
+            # mode=ro cannot be combined with mode=memory; query_only still rejects writes
+            self.uri = db_file
+        else:
+            self.uri = Path(db_file).absolute().as_uri() + '?mode=ro'
+        self.size = size
+        self._idle = deque()
+        self.opened = 0
+        self.reused = 0
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            conn = self._idle.pop()
+            self.reused += 1
+            return conn
+        except IndexError:
+            pass
+        conn = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+        conn.execute('PRAGMA query_only = ON')
+        self.opened += 1
+        return conn
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        if conn.in_transaction:
+            # An open transaction would pin an old snapshot for the next reader
+            conn.rollback()
+        if len(self._idle) < self.size:
+            self._idle.append(conn)
+        else:
+            conn.close()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """acquire() for a with block: the connection is released even if a query fails"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self) -> None:
+        while self._idle:
+            self._idle.pop().close()
+
+    def stats(self) -> dict:
+        return {'idle': len(self._idle), 'opened': self.opened, 'reused': self.reused}
+
 
 class Database:
-    def __init__(self, db_file: str):
+    """SQLite storage in db_file.
+
+    db_file may also be a shared in-memory URI (file::memory:?cache=shared, or
+    file:<name>?mode=memory&cache=shared for a database of its own): nothing is written to
+    disk, which makes test runs fast. Such a database exists while a connection to it is
+    open, so an anchor connection is held until close(). Shared cache uses table-level
+    locks: a reader on another thread fails with "database table is locked" while a write
+    is in progress, so this mode is meant for tests and benchmarks, not for the bot.
+    """
+
+    def __init__(self, db_file: str, read_only: bool = False, read_pool_size: int = 4):
         self.db_file = db_file
-        self.init_db()
+        # Every commit is already on disk, so there is nothing to snapshot
+        self.snapshot_path = None
+        self._anchor = connect(db_file, check_same_thread=False) if is_memory_uri(db_file) else None
+        # Read-only instances (report workers) never create or migrate the schema
+        self.read_only = read_only
+        # Polled by SQLite while report queries run; returning True aborts the query
+        self.interrupt: Optional[Callable[[], bool]] = None
+        self._gift_cache = _NOT_LOADED
+        if not read_only:
+            self.init_db()
+        self._read_pool = ReadPool(db_file, read_pool_size)
+    
+    def close(self) -> None:
+        """Close pooled read connections.
+        
+        Read-only connections cannot checkpoint, so a read-write connection is opened and
+        closed last: when it is the only one left, SQLite folds and removes the WAL files.
+        """
+        self._read_pool.close()
+        if self._anchor is not None:
+            # Usually the last connection: the in-memory database is discarded with it
+            self._anchor.close()
+            self._anchor = None
+        elif not self.read_only:
+            conn = connect(self.db_file)
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            conn.close()
+    
+    def read_pool_stats(self) -> dict:
+        return self._read_pool.stats()
+    
+    def stats(self) -> dict:
+        return {'backend': 'sqlite', **self.read_pool_stats()}
+    
+    def snapshot(self, path: str = None) -> int:
+        """No-op: SQLite persists every commit; returns 0 bytes written"""
+        return 0
+    
+    def create_writer(self, max_batch: int = 256):
+        """DatabaseWriter that groups hot-path writes into shared transactions"""
+        from services.db_writer import DatabaseWriter
+        return DatabaseWriter(self, max_batch=max_batch)
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Connection for report queries, opened with mode=ro on read-only instances"""
+        if self.read_only and not is_memory_uri(self.db_file):
+            conn = sqlite3.connect(Path(self.db_file).absolute().as_uri() + '?mode=ro', uri=True)
+        else:
+            conn = connect(self.db_file)
+        if self.interrupt is not None:
+            conn.set_progress_handler(self.interrupt, 10000)
+        return conn
 
     def init_db(self):
-        conn = sqlite3.connect(self.db_file)
-        c = conn.cursor()
-        
-        # Create accounts table
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS accounts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                details TEXT NOT NULL,
-                price REAL NOT NULL,
-                available BOOLEAN DEFAULT TRUE
-            )
-        ''')
-        # Create credentials table (multiple credentials per account/lot)
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS credentials (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                account_id INTEGER NOT NULL,
-                details TEXT NOT NULL,
-                sold BOOLEAN DEFAULT FALSE,
-                sold_at DATETIME,
-                sold_to INTEGER,
-                FOREIGN KEY (account_id) REFERENCES accounts (id)
-            )
-        ''')
-        
-        # Create orders table
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS orders (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                account_id INTEGER NOT NULL,
-                credential_id INTEGER,
-                price REAL NOT NULL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (account_id) REFERENCES accounts (id),
-                FOREIGN KEY (credential_id) REFERENCES credentials (id)
-            )
-        ''')
-        
-        # Create gift_requests table
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS gift_requests (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                username TEXT,
-                links TEXT NOT NULL,
-                status TEXT DEFAULT 'pending',
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                processed_at DATETIME,
-                processed_by INTEGER
-            )
-        ''')
-        
-        # Create gifts table
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS gifts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                gift_type TEXT NOT NULL,
-                content TEXT NOT NULL,
-                file_id TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Create purchase_queue table
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS purchase_queue (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                account_id INTEGER NOT NULL,
-                payment_type TEXT NOT NULL,
-                price_usdt REAL NOT NULL,
-                price_rub INTEGER,
-                username TEXT,
-                invoice_id TEXT,
-                payment_status TEXT DEFAULT 'pending',
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (account_id) REFERENCES accounts (id)
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
+        """Bring the schema up to date (a single PRAGMA read when it already is)"""
+        apply_migrations(self.db_file)
+    
+    def run_backfills(self, chunk_size: int = 500, max_chunks: int = None) -> bool:
+        """Continue data backfills left by migrations; True while work remains"""
+        return run_backfills(self.db_file, chunk_size, max_chunks)
 
     def add_account(self, details: str, price: float) -> int:
-        conn = sqlite3.connect(self.db_file)
+        conn = connect(self.db_file)
         c = conn.cursor()
         c.execute('INSERT INTO accounts (details, price) VALUES (?, ?)', (details, price))
         account_id = c.lastrowid
@@ -101,43 +155,47 @@ class Database:
         return account_id
 
     def get_available_accounts(self) -> List[Tuple[int, str, float]]:
-        conn = sqlite3.connect(self.db_file)
-        c = conn.cursor()
-        c.execute('SELECT id, details, price FROM accounts WHERE available = TRUE')
-        accounts = c.fetchall()
-        conn.close()
+        with self._read_pool.connection() as conn:
+            c = conn.cursor()
+            c.execute('SELECT id, details, price FROM accounts WHERE available = TRUE')
+            accounts = c.fetchall()
         return accounts
 
     def get_account(self, account_id: int) -> Tuple[int, str, float, bool]:
-        conn = sqlite3.connect(self.db_file)
-        c = conn.cursor()
-        c.execute('SELECT id, details, price, available FROM accounts WHERE id = ?', (account_id,))
-        account = c.fetchone()
-        conn.close()
+        with self._read_pool.connection() as conn:
+            c = conn.cursor()
+            c.execute('SELECT id, details, price, available FROM accounts WHERE id = ?', (account_id,))
+            account = c.fetchone()
         return account
 
-    def add_credential(self, account_id: int, details: str) -> int:
-        conn = sqlite3.connect(self.db_file)
-        c = conn.cursor()
+    # Hot-path writes come in pairs: _<name>_tx(c, ...) runs the statements on a cursor inside
+    # a caller-owned transaction (DatabaseWriter groups these into one commit), and the public
+    # method wraps it in its own connection and commit.
+    
+    def _add_credential_tx(self, c, account_id: int, details: str) -> int:
         c.execute('INSERT INTO credentials (account_id, details) VALUES (?, ?)', (account_id, details))
         credential_id = c.lastrowid
         # Ensure account is marked available when it has at least one unsold credential
         c.execute('UPDATE accounts SET available = TRUE WHERE id = ?', (account_id,))
+        return credential_id
+    
+    def add_credential(self, account_id: int, details: str) -> int:
+        conn = connect(self.db_file)
+        credential_id = self._add_credential_tx(conn.cursor(), account_id, details)
         conn.commit()
         conn.close()
         return credential_id
 
     def count_available_credentials(self, account_id: int) -> int:
-        conn = sqlite3.connect(self.db_file)
-        c = conn.cursor()
-        c.execute('SELECT COUNT(*) FROM credentials WHERE account_id = ? AND sold = FALSE', (account_id,))
-        (count,) = c.fetchone()
-        conn.close()
+        with self._read_pool.connection() as conn:
+            c = conn.cursor()
+            c.execute('SELECT COUNT(*) FROM credentials WHERE account_id = ? AND sold = FALSE', (account_id,))
+            (count,) = c.fetchone()
         return int(count)
 
     def pop_next_credential(self, account_id: int, user_id: int) -> Tuple[int, str]:
         """Atomically pick the next unsold credential, mark it sold, and return (credential_id, details)."""
-        conn = sqlite3.connect(self.db_file)
+        conn = connect(self.db_file)
         c = conn.cursor()
         try:
             c.execute('BEGIN IMMEDIATE')
@@ -162,7 +220,7 @@ class Database:
             conn.close()
 
     def update_account_price(self, account_id: int, new_price: float) -> bool:
-        conn = sqlite3.connect(self.db_file)
+        conn = connect(self.db_file)
         c = conn.cursor()
         c.execute('UPDATE accounts SET price = ? WHERE id = ?', (new_price, account_id))
         success = c.rowcount > 0
@@ -171,7 +229,7 @@ class Database:
         return success
 
     def delete_account(self, account_id: int) -> bool:
-        conn = sqlite3.connect(self.db_file)
+        conn = connect(self.db_file)
         c = conn.cursor()
         c.execute('DELETE FROM accounts WHERE id = ?', (account_id,))
         success = c.rowcount > 0
@@ -179,65 +237,104 @@ class Database:
         conn.close()
         return success
 
-    def mark_account_sold(self, account_id: int, user_id: int, price: float) -> Tuple[bool, str, bool]:
-        """Pick and mark one credential as sold; return (success, details, accounts_depleted)."""
-        conn = sqlite3.connect(self.db_file)
+    def mark_account_sold(self, account_id: int, user_id: int, price: float,
+                          delivery_kind: str = None, delivery_payload: dict = None,
+                          payment_type: str = None) -> Tuple[bool, str, bool]:
+        """Pick and mark one credential as sold; return (success, details, accounts_depleted).
+
+        If delivery_kind is given, a delivery_outbox row is written in the same transaction,
+        so the credential is never burned without a record that it still has to be sent.
+        """
+        conn = connect(self.db_file)
         c = conn.cursor()
         try:
             c.execute('BEGIN IMMEDIATE')
-            c.execute('SELECT id, details FROM credentials WHERE account_id = ? AND sold = FALSE ORDER BY id LIMIT 1', (account_id,))
-            row = c.fetchone()
-            if not row:
-                conn.rollback()
-                return (False, '', False)
-            credential_id, details = row
-            c.execute('UPDATE credentials SET sold = TRUE, sold_at = CURRENT_TIMESTAMP, sold_to = ? WHERE id = ?', (user_id, credential_id))
-            c.execute('INSERT INTO orders (user_id, account_id, credential_id, price) VALUES (?, ?, ?, ?)',
-                      (user_id, account_id, credential_id, price))
-            # If no more credentials left, mark account unavailable
-            c.execute('SELECT COUNT(*) FROM credentials WHERE account_id = ? AND sold = FALSE', (account_id,))
-            (remaining,) = c.fetchone()
-            accounts_depleted = False
-            if remaining == 0:
-                c.execute('UPDATE accounts SET available = FALSE WHERE id = ?', (account_id,))
-                accounts_depleted = True
+            result = self._mark_account_sold_tx(c, account_id, user_id, price, delivery_kind,
+                                                delivery_payload, payment_type)
             conn.commit()
-            return (True, details, accounts_depleted)
+            return result
         except sqlite3.Error:
             conn.rollback()
             return (False, '', False)
         finally:
             conn.close()
     
+    def _mark_account_sold_tx(self, c, account_id: int, user_id: int, price: float,
+                              delivery_kind: str = None, delivery_payload: dict = None,
+                              payment_type: str = None) -> Tuple[bool, str, bool]:
+        c.execute('SELECT id, details FROM credentials WHERE account_id = ? AND sold = FALSE ORDER BY id LIMIT 1', (account_id,))
+        row = c.fetchone()
+        if not row:
+            return (False, '', False)
+        credential_id, details = row
+        c.execute('UPDATE credentials SET sold = TRUE, sold_at = CURRENT_TIMESTAMP, sold_to = ? WHERE id = ?', (user_id, credential_id))
+        c.execute('INSERT INTO orders (user_id, account_id, credential_id, price, payment_type) VALUES (?, ?, ?, ?, ?)',
+                  (user_id, account_id, credential_id, price, payment_type))
+        if delivery_kind:
+            c.execute('''
+                INSERT INTO delivery_outbox (user_id, account_id, credential_id, order_id, kind, payload)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (user_id, account_id, credential_id, c.lastrowid, delivery_kind,
+                  json.dumps(delivery_payload or {})))
+        # If no more credentials left, mark account unavailable
+        c.execute('SELECT COUNT(*) FROM credentials WHERE account_id = ? AND sold = FALSE', (account_id,))
+        (remaining,) = c.fetchone()
+        accounts_depleted = False
+        if remaining == 0:
+            c.execute('UPDATE accounts SET available = FALSE WHERE id = ?', (account_id,))
+            accounts_depleted = True
+        return (True, details, accounts_depleted)
+    
+    def get_user_orders_page(self, user_id: int, before_order_id: int = None,
+                             limit: int = 5) -> Tuple[List[Tuple[int, str, float, str, Optional[str]]], bool]:
+        """Newest-first keyset page of a user's orders: ((id, lot, price, timestamp, details), has_more)"""
+        with self._read_pool.connection() as conn:
+            c = conn.cursor()
+            query = '''
+                SELECT o.id, a.details, o.price, o.timestamp, cr.details
+                FROM orders o
+                LEFT JOIN accounts a ON a.id = o.account_id
+                LEFT JOIN credentials cr ON cr.id = o.credential_id
+                WHERE o.user_id = ?
+            '''
+            params = [user_id]
+            if before_order_id is not None:
+                query += '''
+                  AND (o.timestamp, o.id) < (SELECT timestamp, id FROM orders WHERE id = ? AND user_id = ?)
+                '''
+                params += [before_order_id, user_id]
+            query += ' ORDER BY o.timestamp DESC, o.id DESC LIMIT ?'
+            params.append(limit + 1)
+            c.execute(query, params)
+            orders = c.fetchall()
+        return orders[:limit], len(orders) > limit
+    
     def get_lot_statistics(self, account_id: int) -> dict:
         """Get statistics for a specific lot"""
-        conn = sqlite3.connect(self.db_file)
-        c = conn.cursor()
-        
-        # Get account info
-        c.execute('SELECT id, details, price, available FROM accounts WHERE id = ?', (account_id,))
-        account = c.fetchone()
-        
-        if not account:
-            conn.close()
-            return {}
-        
-        # Count total, sold and available credentials
-        c.execute('SELECT COUNT(*) FROM credentials WHERE account_id = ?', (account_id,))
-        total_count = c.fetchone()[0]
-        
-        c.execute('SELECT COUNT(*) FROM credentials WHERE account_id = ? AND sold = TRUE', (account_id,))
-        sold_count = c.fetchone()[0]
-        
-        c.execute('SELECT COUNT(*) FROM credentials WHERE account_id = ? AND sold = FALSE', (account_id,))
-        available_count = c.fetchone()[0]
-        
-        # Get total revenue
-        c.execute('SELECT SUM(price) FROM orders WHERE account_id = ?', (account_id,))
-        revenue_result = c.fetchone()[0]
-        total_revenue = revenue_result if revenue_result else 0
-        
-        conn.close()
+        with self._read_pool.connection() as conn:
+            c = conn.cursor()
+            
+            # Get account info
+            c.execute('SELECT id, details, price, available FROM accounts WHERE id = ?', (account_id,))
+            account = c.fetchone()
+            
+            if not account:
+                return {}
+            
+            # Count total, sold and available credentials
+            c.execute('SELECT COUNT(*) FROM credentials WHERE account_id = ?', (account_id,))
+            total_count = c.fetchone()[0]
+            
+            c.execute('SELECT COUNT(*) FROM credentials WHERE account_id = ? AND sold = TRUE', (account_id,))
+            sold_count = c.fetchone()[0]
+            
+            c.execute('SELECT COUNT(*) FROM credentials WHERE account_id = ? AND sold = FALSE', (account_id,))
+            available_count = c.fetchone()[0]
+            
+            # Get total revenue
+            c.execute('SELECT SUM(price) FROM orders WHERE account_id = ?', (account_id,))
+            revenue_result = c.fetchone()[0]
+            total_revenue = revenue_result if revenue_result else 0
         
         return {
             'id': account[0],
@@ -252,12 +349,11 @@ class Database:
     
     def get_all_lots_statistics(self) -> list:
         """Get statistics for all lots"""
-        conn = sqlite3.connect(self.db_file)
-        c = conn.cursor()
-        
-        c.execute('SELECT id FROM accounts ORDER BY id')
-        account_ids = [row[0] for row in c.fetchall()]
-        conn.close()
+        with self._read_pool.connection() as conn:
+            c = conn.cursor()
+            
+            c.execute('SELECT id FROM accounts ORDER BY id')
+            account_ids = [row[0] for row in c.fetchall()]
         
         statistics = []
         for account_id in account_ids:
@@ -267,113 +363,293 @@ class Database:
         
         return statistics
     
+    @staticmethod
+    def _count_links(links: str) -> int:
+        return count_links(links)
+    
+    def _create_gift_request_tx(self, c, user_id: int, username: str, links: str) -> int:
+        c.execute('INSERT INTO gift_requests (user_id, username, links, link_count) VALUES (?, ?, ?, ?)',
+                  (user_id, username, links, self._count_links(links)))
+        return c.lastrowid
+    
     def create_gift_request(self, user_id: int, username: str, links: str) -> int:
         """Create a new gift request"""
-        conn = sqlite3.connect(self.db_file)
+        conn = connect(self.db_file)
+        request_id = self._create_gift_request_tx(conn.cursor(), user_id, username, links)
+        conn.commit()
+        conn.close()
+        return request_id
+    
+    def create_gift_request_with_links(self, user_id: int, username: str, links: str,
+                                       normalized_links: List[Tuple[str, str]]) -> Tuple[Optional[int], List[str]]:
+        """Create a gift request unless one of its (link_hash, url) pairs was already submitted.
+        
+        Returns (request_id, []) on success, (None, urls already used) when links were reused
+        (their reuse counter is incremented) or (None, []) if the user already has a pending
+        request.
+        """
+        conn = connect(self.db_file)
         c = conn.cursor()
-        c.execute('INSERT INTO gift_requests (user_id, username, links) VALUES (?, ?, ?)',
-                  (user_id, username, links))
+        try:
+            c.execute('BEGIN IMMEDIATE')
+            result = self._create_gift_request_with_links_tx(c, user_id, username, links, normalized_links)
+            conn.commit()
+            return result
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+    
+    def _create_gift_request_with_links_tx(self, c, user_id: int, username: str, links: str,
+                                           normalized_links: List[Tuple[str, str]]) -> Tuple[Optional[int], List[str]]:
+        hashes = [link_hash for link_hash, _ in normalized_links]
+        c.execute(f'SELECT link_hash, url FROM gift_links WHERE link_hash IN ({", ".join("?" * len(hashes))})',
+                  hashes)
+        used = c.fetchall()
+        if used:
+            c.executemany('UPDATE gift_links SET reuse_count = reuse_count + 1 WHERE link_hash = ?',
+                          [(link_hash,) for link_hash, _ in used])
+            return None, [url for _, url in used]
+        try:
+            c.execute('INSERT INTO gift_requests (user_id, username, links, link_count) VALUES (?, ?, ?, ?)',
+                      (user_id, username, links, len(normalized_links)))
+        except sqlite3.IntegrityError:
+            # The failed INSERT changed nothing; the user already has a pending request
+            return None, []
         request_id = c.lastrowid
+        c.executemany('INSERT INTO gift_links (request_id, user_id, link_hash, url) VALUES (?, ?, ?, ?)',
+                      [(request_id, user_id, link_hash, url) for link_hash, url in normalized_links])
+        return request_id, []
+    
+    def get_gift_links(self, request_id: int) -> List[Tuple[int, str, Optional[str], Optional[str], int]]:
+        """Links of a request: (id, url, check_status, check_detail, reuse_count)"""
+        with self._read_pool.connection() as conn:
+            c = conn.cursor()
+            c.execute('''
+                SELECT id, url, check_status, check_detail, reuse_count
+                FROM gift_links WHERE request_id = ? ORDER BY id
+            ''', (request_id,))
+            links = c.fetchall()
+        return links
+    
+    def save_gift_link_checks(self, results: List[Tuple[int, str, str, Optional[str]]]) -> None:
+        """Store link check results as (link_id, check_status, check_detail, final_url)"""
+        conn = connect(self.db_file)
+        c = conn.cursor()
+        c.executemany('''
+            UPDATE gift_links
+            SET check_status = ?, check_detail = ?, final_url = ?, checked_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', [(status, detail, final_url, link_id) for link_id, status, detail, final_url in results])
         conn.commit()
         conn.close()
-        return request_id
     
     def get_pending_gift_requests(self) -> List[Tuple]:
         """Get all pending gift requests"""
-        conn = sqlite3.connect(self.db_file)
-        c = conn.cursor()
-        c.execute('SELECT id, user_id, username, links, created_at FROM gift_requests WHERE status = "pending" ORDER BY created_at')
-        requests = c.fetchall()
-        conn.close()
+        with self._read_pool.connection() as conn:
+            c = conn.cursor()
+            c.execute('SELECT id, user_id, username, links, created_at FROM gift_requests WHERE status = "pending" ORDER BY created_at')
+            requests = c.fetchall()
         return requests
     
+    def get_pending_gift_user_ids(self) -> List[int]:
+        """Users who have a pending gift request"""
+        with self._read_pool.connection() as conn:
+            c = conn.cursor()
+            c.execute("SELECT user_id FROM gift_requests WHERE status = 'pending'")
+            user_ids = [row[0] for row in c.fetchall()]
+        return user_ids
+    
+    def get_pending_gift_requests_page(self, after_id: int = None, before_id: int = None,
+                                       limit: int = 10) -> Tuple[List[Tuple[int, str, int]], bool, bool]:
+        """Keyset page of pending gift requests: (rows of id, username, link_count), has_prev, has_next"""
+        with self._read_pool.connection() as conn:
+            c = conn.cursor()
+            if before_id is not None:
+                c.execute('''
+                    SELECT id, username, link_count FROM gift_requests
+                    WHERE status = 'pending' AND id < ?
+                    ORDER BY id DESC LIMIT ?
+                ''', (before_id, limit + 1))
+                rows = c.fetchall()
+                has_prev = len(rows) > limit
+                rows = rows[:limit][::-1]
+                has_next = self._has_pending_gift_request(c, 'id > ?', rows[-1][0] if rows else before_id - 1)
+            else:
+                c.execute('''
+                    SELECT id, username, link_count FROM gift_requests
+                    WHERE status = 'pending' AND id > ?
+                    ORDER BY id LIMIT ?
+                ''', (after_id or 0, limit + 1))
+                rows = c.fetchall()
+                has_next = len(rows) > limit
+                rows = rows[:limit]
+                has_prev = self._has_pending_gift_request(c, 'id < ?', rows[0][0] if rows else (after_id or 0) + 1)
+        return rows, has_prev, has_next
+    
+    @staticmethod
+    def _has_pending_gift_request(c, condition: str, request_id: int) -> bool:
+        c.execute(f"SELECT EXISTS (SELECT 1 FROM gift_requests WHERE status = 'pending' AND {condition})",
+                  (request_id,))
+        return bool(c.fetchone()[0])
+    
+    def count_pending_gift_requests(self) -> int:
+        """Number of pending gift requests"""
+        with self._read_pool.connection() as conn:
+            c = conn.cursor()
+            c.execute("SELECT COUNT(*) FROM gift_requests WHERE status = 'pending'")
+            count = c.fetchone()[0]
+        return count
+    
     def get_gift_request(self, request_id: int) -> Tuple:
         """Get specific gift request"""
-        conn = sqlite3.connect(self.db_file)
-        c = conn.cursor()
-        c.execute('SELECT id, user_id, username, links, created_at FROM gift_requests WHERE id = ?', (request_id,))
-        request = c.fetchone()
-        conn.close()
+        with self._read_pool.connection() as conn:
+            c = conn.cursor()
+            c.execute('SELECT id, user_id, username, links, created_at FROM gift_requests WHERE id = ?', (request_id,))
+            request = c.fetchone()
         return request
     
+    def _release_gift_links_tx(self, c, request_ids: List[int]) -> None:
+        """Free the links of rejected requests so the user can submit them again"""
+        c.executemany('DELETE FROM gift_links WHERE request_id = ?', [(request_id,) for request_id in request_ids])
+    
     def process_gift_request(self, request_id: int, status: str, processed_by: int) -> bool:
-        """Process gift request (approve/reject)"""
-        conn = sqlite3.connect(self.db_file)
+        """Process gift request (approve/reject); a rejected request's links can be submitted again"""
+        conn = connect(self.db_file)
         c = conn.cursor()
         c.execute('UPDATE gift_requests SET status = ?, processed_at = CURRENT_TIMESTAMP, processed_by = ? WHERE id = ?',
                   (status, processed_by, request_id))
         success = c.rowcount > 0
+        if success and status == 'rejected':
+            self._release_gift_links_tx(c, [request_id])
         conn.commit()
         conn.close()
         return success
     
-    def save_gift(self, gift_type: str, content: str, file_id: str = None) -> int:
+    def process_gift_requests_bulk(self, status: str, processed_by: int, first_id: int = None,
+                                   last_id: int = None, min_links: int = None,
+                                   max_links: int = None) -> List[Tuple[int, int, str]]:
+        """Approve/reject all pending requests matching the filter in one UPDATE statement.
+        
+        Returns (id, user_id, username) of the requests that were actually changed, by id
+        (UPDATE ... RETURNING needs SQLite 3.35+). Links of rejected requests are released.
+        """
+        conditions = ["status = 'pending'"]
+        params = []
+        if first_id is not None:
+            conditions.append('id >= ?')
+            params.append(first_id)
+        if last_id is not None:
+            conditions.append('id <= ?')
+            params.append(last_id)
+        if min_links is not None:
+            conditions.append('link_count >= ?')
+            params.append(min_links)
+        if max_links is not None:
+            conditions.append('link_count <= ?')
+            params.append(max_links)
+        
+        conn = connect(self.db_file)
+        c = conn.cursor()
+        try:
+            c.execute(f'''
+                UPDATE gift_requests SET status = ?, processed_at = CURRENT_TIMESTAMP, processed_by = ?
+                WHERE {" AND ".join(conditions)}
+                RETURNING id, user_id, username
+            ''', [status, processed_by] + params)
+            # RETURNING yields rows in no particular order
+            requests = sorted(c.fetchall())
+            if status == 'rejected':
+                self._release_gift_links_tx(c, [request[0] for request in requests])
+            conn.commit()
+            return requests
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+    
+    def save_gift(self, gift_type: str, content: str, file_id: str = None,
+                  source_chat_id: int = None, source_message_id: int = None) -> int:
         """Save gift content"""
-        conn = sqlite3.connect(self.db_file)
+        conn = connect(self.db_file)
         c = conn.cursor()
         # Delete previous gift
         c.execute('DELETE FROM gifts')
         # Save new gift
-        c.execute('INSERT INTO gifts (gift_type, content, file_id) VALUES (?, ?, ?)',
-                  (gift_type, content, file_id))
+        c.execute('''
+            INSERT INTO gifts (gift_type, content, file_id, source_chat_id, source_message_id)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (gift_type, content, file_id, source_chat_id, source_message_id))
         gift_id = c.lastrowid
         conn.commit()
         conn.close()
+        self._gift_cache = (gift_type, content, file_id, source_chat_id, source_message_id)
         return gift_id
     
     def get_current_gift(self) -> Tuple:
-        """Get current gift"""
-        conn = sqlite3.connect(self.db_file)
-        c = conn.cursor()
-        c.execute('SELECT gift_type, content, file_id FROM gifts ORDER BY created_at DESC LIMIT 1')
-        gift = c.fetchone()
-        conn.close()
+        """Get current gift: (gift_type, content, file_id, source_chat_id, source_message_id)"""
+        if self._gift_cache is not _NOT_LOADED:
+            return self._gift_cache
+        with self._read_pool.connection() as conn:
+            c = conn.cursor()
+            c.execute('''
+                SELECT gift_type, content, file_id, source_chat_id, source_message_id
+                FROM gifts ORDER BY created_at DESC LIMIT 1
+            ''')
+            gift = c.fetchone()
+        # The gift only changes through save_gift, which refreshes the cache
+        self._gift_cache = gift
         return gift
     
-    def add_to_purchase_queue(self, user_id: int, account_id: int, payment_type: str, 
-                             price_usdt: float, price_rub: int = None, username: str = None, 
-                             invoice_id: str = None, payment_status: str = 'pending') -> int:
-        """Add user to purchase queue for lot with 0 accounts"""
-        conn = sqlite3.connect(self.db_file)
-        c = conn.cursor()
+    def _add_to_purchase_queue_tx(self, c, user_id: int, account_id: int, payment_type: str,
+                                  price_usdt: float, price_rub: int = None, username: str = None,
+                                  invoice_id: str = None, payment_status: str = 'pending') -> int:
         c.execute('''
             INSERT INTO purchase_queue 
             (user_id, account_id, payment_type, price_usdt, price_rub, username, invoice_id, payment_status) 
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         ''', (user_id, account_id, payment_type, price_usdt, price_rub, username, invoice_id, payment_status))
-        queue_id = c.lastrowid
+        return c.lastrowid
+    
+    def add_to_purchase_queue(self, user_id: int, account_id: int, payment_type: str, 
+                             price_usdt: float, price_rub: int = None, username: str = None, 
+                             invoice_id: str = None, payment_status: str = 'pending') -> int:
+        """Add user to purchase queue for lot with 0 accounts"""
+        conn = connect(self.db_file)
+        queue_id = self._add_to_purchase_queue_tx(conn.cursor(), user_id, account_id, payment_type, price_usdt,
+                                                  price_rub, username, invoice_id, payment_status)
         conn.commit()
         conn.close()
         return queue_id
     
     def get_queue_size(self, account_id: int) -> int:
         """Get number of people in queue for specific lot"""
-        conn = sqlite3.connect(self.db_file)
-        c = conn.cursor()
-        c.execute('SELECT COUNT(*) FROM purchase_queue WHERE account_id = ? AND payment_status IN ("pending", "paid")', 
-                  (account_id,))
-        (count,) = c.fetchone()
-        conn.close()
+        with self._read_pool.connection() as conn:
+            c = conn.cursor()
+            c.execute('SELECT COUNT(*) FROM purchase_queue WHERE account_id = ? AND payment_status IN ("pending", "paid")', 
+                      (account_id,))
+            (count,) = c.fetchone()
         return int(count)
     
     def get_next_from_queue(self, account_id: int) -> Tuple:
         """Get next person from queue for specific lot"""
-        conn = sqlite3.connect(self.db_file)
-        c = conn.cursor()
-        c.execute('''
-            SELECT id, user_id, payment_type, price_usdt, price_rub, username, invoice_id 
-            FROM purchase_queue 
-            WHERE account_id = ? AND payment_status = "pending" 
-            ORDER BY created_at 
-            LIMIT 1
-        ''', (account_id,))
-        queue_entry = c.fetchone()
-        conn.close()
+        with self._read_pool.connection() as conn:
+            c = conn.cursor()
+            c.execute('''
+                SELECT id, user_id, payment_type, price_usdt, price_rub, username, invoice_id 
+                FROM purchase_queue 
+                WHERE account_id = ? AND payment_status = "pending" 
+                ORDER BY created_at 
+                LIMIT 1
+            ''', (account_id,))
+            queue_entry = c.fetchone()
         return queue_entry
     
     def mark_queue_entry_fulfilled(self, queue_id: int) -> bool:
         """Mark queue entry as fulfilled"""
-        conn = sqlite3.connect(self.db_file)
+        conn = connect(self.db_file)
         c = conn.cursor()
         c.execute('UPDATE purchase_queue SET payment_status = "fulfilled" WHERE id = ?', (queue_id,))
         success = c.rowcount > 0
@@ -381,23 +657,25 @@ class Database:
         conn.close()
         return success
     
-    def update_queue_payment_status(self, user_id: int, account_id: int, invoice_id: str, status: str) -> bool:
-        """Update payment status in queue"""
-        conn = sqlite3.connect(self.db_file)
-        c = conn.cursor()
+    def _update_queue_payment_status_tx(self, c, user_id: int, account_id: int, invoice_id: str, status: str) -> bool:
         c.execute('''
             UPDATE purchase_queue 
             SET payment_status = ? 
             WHERE user_id = ? AND account_id = ? AND invoice_id = ?
         ''', (status, user_id, account_id, invoice_id))
-        success = c.rowcount > 0
+        return c.rowcount > 0
+    
+    def update_queue_payment_status(self, user_id: int, account_id: int, invoice_id: str, status: str) -> bool:
+        """Update payment status in queue"""
+        conn = connect(self.db_file)
+        success = self._update_queue_payment_status_tx(conn.cursor(), user_id, account_id, invoice_id, status)
         conn.commit()
         conn.close()
         return success
     
     def process_queue_for_lot(self, account_id: int) -> List[Tuple]:
         """Process queue when new credentials are added to lot"""
-        conn = sqlite3.connect(self.db_file)
+        conn = connect(self.db_file)
         c = conn.cursor()
         
         # Get available credentials count
@@ -423,3 +701,454 @@ class Database:
         conn.close()
         
         return queue_entries
+    
+    def _delivery_rows(self, c) -> List[dict]:
+        columns = [d[0] for d in c.description]
+        rows = []
+        for row in c.fetchall():
+            item = dict(zip(columns, row))
+            item['payload'] = json.loads(item['payload']) if item.get('payload') else {}
+            rows.append(item)
+        return rows
+    
+    def claim_due_deliveries(self, limit: int = 50, lease_seconds: int = 60) -> List[dict]:
+        """Take due pending deliveries and lease them for lease_seconds (so a crash mid-send retries them)"""
+        conn = connect(self.db_file)
+        c = conn.cursor()
+        try:
+            c.execute('BEGIN IMMEDIATE')
+            c.execute('''
+                SELECT o.id, o.user_id, o.account_id, o.credential_id, o.order_id, o.kind, o.payload,
+                       o.attempts, cr.details
+                FROM delivery_outbox o
+                JOIN credentials cr ON cr.id = o.credential_id
+                WHERE o.status = 'pending' AND o.next_attempt_at <= CURRENT_TIMESTAMP
+                ORDER BY o.id
+                LIMIT ?
+            ''', (limit,))
+            rows = self._delivery_rows(c)
+            if rows:
+                c.executemany('''
+                    UPDATE delivery_outbox
+                    SET attempts = attempts + 1, next_attempt_at = datetime('now', ?)
+                    WHERE id = ?
+                ''', [(f'+{int(lease_seconds)} seconds', row['id']) for row in rows])
+            conn.commit()
+            return rows
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+    
+    def mark_delivery_sent(self, delivery_id: int) -> bool:
+        """Mark outbox row as delivered"""
+        conn = connect(self.db_file)
+        c = conn.cursor()
+        c.execute('''
+            UPDATE delivery_outbox
+            SET status = 'delivered', delivered_at = CURRENT_TIMESTAMP, last_error = NULL
+            WHERE id = ?
+        ''', (delivery_id,))
+        success = c.rowcount > 0
+        conn.commit()
+        conn.close()
+        return success
+    
+    def reschedule_delivery(self, delivery_id: int, error: str, delay_seconds: int) -> bool:
+        """Record a failed attempt and schedule the next one"""
+        conn = connect(self.db_file)
+        c = conn.cursor()
+        c.execute('''
+            UPDATE delivery_outbox
+            SET last_error = ?, next_attempt_at = datetime('now', ?)
+            WHERE id = ?
+        ''', (error, f'+{int(delay_seconds)} seconds', delivery_id))
+        success = c.rowcount > 0
+        conn.commit()
+        conn.close()
+        return success
+    
+    def mark_delivery_failed(self, delivery_id: int, error: str) -> bool:
+        """Give up on a delivery; it stays visible in the stuck deliveries view"""
+        conn = connect(self.db_file)
+        c = conn.cursor()
+        c.execute('UPDATE delivery_outbox SET status = \'failed\', last_error = ? WHERE id = ?',
+                  (error, delivery_id))
+        success = c.rowcount > 0
+        conn.commit()
+        conn.close()
+        return success
+    
+    def get_stuck_deliveries(self, older_than_seconds: int = 300, limit: int = 20) -> List[dict]:
+        """Failed deliveries and pending ones that already failed or wait longer than older_than_seconds"""
+        with self._read_pool.connection() as conn:
+            c = conn.cursor()
+            c.execute('''
+                SELECT o.id, o.user_id, o.account_id, o.credential_id, o.order_id, o.kind, o.payload,
+                       o.status, o.attempts, o.last_error, o.created_at, o.next_attempt_at
+                FROM delivery_outbox o
+                WHERE o.status = 'failed'
+                   OR (o.status = 'pending' AND (o.last_error IS NOT NULL OR o.created_at <= datetime('now', ?)))
+                ORDER BY o.id
+                LIMIT ?
+            ''', (f'-{int(older_than_seconds)} seconds', limit))
+            rows = self._delivery_rows(c)
+        return rows
+    
+    def count_deliveries_by_status(self) -> dict:
+        """Number of outbox rows per status"""
+        with self._read_pool.connection() as conn:
+            c = conn.cursor()
+            c.execute('SELECT status, COUNT(*) FROM delivery_outbox GROUP BY status')
+            counts = dict(c.fetchall())
+        return counts
+    
+    def retry_failed_deliveries(self) -> int:
+        """Put failed deliveries back into the pending queue"""
+        conn = connect(self.db_file)
+        c = conn.cursor()
+        c.execute('''
+            UPDATE delivery_outbox
+            SET status = 'pending', attempts = 0, next_attempt_at = CURRENT_TIMESTAMP
+            WHERE status = 'failed'
+        ''')
+        count = c.rowcount
+        conn.commit()
+        conn.close()
+        return count
+    
+    def get_media_file_id(self, name: str, signature: str) -> Optional[str]:
+        """Get cached file_id of a static asset if the file has not changed since upload"""
+        with self._read_pool.connection() as conn:
+            c = conn.cursor()
+            c.execute('SELECT file_id FROM media_assets WHERE name = ? AND signature = ?', (name, signature))
+            row = c.fetchone()
+        return row[0] if row else None
+    
+    def save_media_file_id(self, name: str, signature: str, file_id: str) -> None:
+        """Remember the file_id Telegram returned for an uploaded asset"""
+        conn = connect(self.db_file)
+        c = conn.cursor()
+        c.execute('''
+            INSERT INTO media_assets (name, signature, file_id) VALUES (?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET
+                signature = excluded.signature,
+                file_id = excluded.file_id,
+                uploaded_at = CURRENT_TIMESTAMP
+        ''', (name, signature, file_id))
+        conn.commit()
+        conn.close()
+    
+    def forget_media_file_id(self, name: str) -> bool:
+        """Drop a cached file_id (e.g. rejected by Telegram)"""
+        conn = connect(self.db_file)
+        c = conn.cursor()
+        c.execute('DELETE FROM media_assets WHERE name = ?', (name,))
+        success = c.rowcount > 0
+        conn.commit()
+        conn.close()
+        return success
+    
+    def upsert_users(self, users: List[Tuple[int, Optional[str], Optional[str], str, str]]) -> None:
+        """Record activity as (id, username, first_name, first_seen, last_seen) in one transaction"""
+        conn = connect(self.db_file)
+        c = conn.cursor()
+        c.executemany('''
+            INSERT INTO users (id, username, first_name, first_seen, last_seen) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET
+                username = excluded.username,
+                first_name = excluded.first_name,
+                last_seen = MAX(last_seen, excluded.last_seen),
+                blocked = 0
+        ''', users)
+        conn.commit()
+        conn.close()
+    
+    def find_user_id_by_username(self, username: str) -> Optional[int]:
+        """Find user id by username, case-insensitive"""
+        with self._read_pool.connection() as conn:
+            c = conn.cursor()
+            c.execute('SELECT id FROM users WHERE lower(username) = ?', (username.lstrip('@').lower(),))
+            row = c.fetchone()
+        return row[0] if row else None
+    
+    def count_users(self, active_within_hours: int = 24) -> Tuple[int, int]:
+        """Total users and users seen within the last active_within_hours"""
+        with self._read_pool.connection() as conn:
+            c = conn.cursor()
+            c.execute('''
+                SELECT COUNT(*), COALESCE(SUM(last_seen >= datetime('now', ?)), 0) FROM users
+            ''', (f'-{int(active_within_hours)} hours',))
+            total, active = c.fetchone()
+        return total, active
+    
+    # Broadcast segments: recipient user ids in ascending order after a cursor
+    _BROADCAST_SEGMENTS = {
+        'all': '''
+            SELECT id FROM users WHERE blocked = 0 AND id > :cursor ORDER BY id LIMIT :limit
+        ''',
+        'buyers': '''
+            SELECT DISTINCT user_id FROM orders
+            WHERE account_id = :account_id AND user_id > :cursor
+              AND user_id NOT IN (SELECT id FROM users WHERE blocked = 1)
+            ORDER BY user_id LIMIT :limit
+        ''',
+        'queue': '''
+            SELECT DISTINCT user_id FROM purchase_queue
+            WHERE account_id = :account_id AND payment_status IN ('pending', 'paid') AND user_id > :cursor
+              AND user_id NOT IN (SELECT id FROM users WHERE blocked = 1)
+            ORDER BY user_id LIMIT :limit
+        ''',
+    }
+    
+    def _broadcast_rows(self, c) -> List[dict]:
+        columns = [column[0] for column in c.description]
+        return [dict(zip(columns, row)) for row in c.fetchall()]
+    
+    def create_broadcast(self, segment: str, account_id: Optional[int], source_chat_id: int,
+                         source_message_id: int, created_by: int) -> int:
+        """Create a running broadcast job; total is the segment size at creation"""
+        if segment not in self._BROADCAST_SEGMENTS:
+            raise ValueError(f"Unknown broadcast segment: {segment}")
+        conn = connect(self.db_file)
+        c = conn.cursor()
+        c.execute(f'SELECT COUNT(*) FROM ({self._BROADCAST_SEGMENTS[segment]})',
+                  {'account_id': account_id, 'cursor': 0, 'limit': -1})
+        total = c.fetchone()[0]
+        c.execute('''
+            INSERT INTO broadcast_jobs (segment, account_id, source_chat_id, source_message_id, total, created_by)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (segment, account_id, source_chat_id, source_message_id, total, created_by))
+        job_id = c.lastrowid
+        conn.commit()
+        conn.close()
+        return job_id
+    
+    def set_broadcast_progress_message(self, job_id: int, chat_id: int, message_id: int) -> None:
+        """Remember the admin message that shows the job's progress"""
+        conn = connect(self.db_file)
+        c = conn.cursor()
+        c.execute('UPDATE broadcast_jobs SET progress_chat_id = ?, progress_message_id = ? WHERE id = ?',
+                  (chat_id, message_id, job_id))
+        conn.commit()
+        conn.close()
+    
+    def get_broadcast(self, job_id: int) -> Optional[dict]:
+        with self._read_pool.connection() as conn:
+            c = conn.cursor()
+            c.execute('SELECT * FROM broadcast_jobs WHERE id = ?', (job_id,))
+            rows = self._broadcast_rows(c)
+        return rows[0] if rows else None
+    
+    def get_broadcasts(self, status: str = None, limit: int = 10) -> List[dict]:
+        """Latest broadcast jobs, optionally only with the given status"""
+        with self._read_pool.connection() as conn:
+            c = conn.cursor()
+            if status:
+                c.execute('SELECT * FROM broadcast_jobs WHERE status = ? ORDER BY id LIMIT ?', (status, limit))
+            else:
+                c.execute('SELECT * FROM broadcast_jobs ORDER BY id DESC LIMIT ?', (limit,))
+            rows = self._broadcast_rows(c)
+        return rows
+    
+    def get_broadcast_recipients(self, job: dict, limit: int) -> List[int]:
+        """Next batch of recipients after the job's cursor"""
+        with self._read_pool.connection() as conn:
+            c = conn.cursor()
+            c.execute(self._BROADCAST_SEGMENTS[job['segment']],
+                      {'account_id': job['account_id'], 'cursor': job['cursor'], 'limit': limit})
+            user_ids = [row[0] for row in c.fetchall()]
+        return user_ids
+    
+    def checkpoint_broadcast(self, job_id: int, cursor: int, sent: int, failed: int,
+                             blocked_user_ids: List[int]) -> None:
+        """Advance the cursor past a sent batch, add its counters and prune blocked users"""
+        conn = connect(self.db_file)
+        c = conn.cursor()
+        c.execute('''
+            UPDATE broadcast_jobs
+            SET cursor = ?, sent = sent + ?, failed = failed + ?, blocked = blocked + ?
+            WHERE id = ?
+        ''', (cursor, sent, failed, len(blocked_user_ids), job_id))
+        if blocked_user_ids:
+            c.executemany('UPDATE users SET blocked = 1 WHERE id = ?', [(user_id,) for user_id in blocked_user_ids])
+        conn.commit()
+        conn.close()
+    
+    def set_broadcast_status(self, job_id: int, status: str) -> bool:
+        """Set job status; finished statuses (done/cancelled) record finished_at"""
+        conn = connect(self.db_file)
+        c = conn.cursor()
+        c.execute('''
+            UPDATE broadcast_jobs
+            SET status = ?, finished_at = CASE WHEN ? IN ('done', 'cancelled') THEN CURRENT_TIMESTAMP END
+            WHERE id = ? AND status NOT IN ('done', 'cancelled')
+        ''', (status, status, job_id))
+        success = c.rowcount > 0
+        conn.commit()
+        conn.close()
+        return success
+    
+    # Bucket expressions over orders.timestamp (UTC, as written by CURRENT_TIMESTAMP)
+    _ROLLUP_BUCKETS = {
+        'sales_rollup_hourly': "strftime('%Y-%m-%d %H:00:00', timestamp)",
+        'sales_rollup_daily': "date(timestamp)",
+    }
+    
+    def refresh_sales_rollups(self) -> int:
+        """Fold orders added since the high-water mark into the rollup tables; return their number"""
+        conn = connect(self.db_file)
+        c = conn.cursor()
+        try:
+            c.execute('BEGIN IMMEDIATE')
+            c.execute("SELECT last_order_id FROM rollup_state WHERE name = 'sales'")
+            row = c.fetchone()
+            last_order_id = row[0] if row else 0
+            c.execute('SELECT MAX(id), COUNT(*) FROM orders WHERE id > ?', (last_order_id,))
+            max_order_id, new_orders = c.fetchone()
+            if not new_orders:
+                conn.rollback()
+                return 0
+            for table, bucket in self._ROLLUP_BUCKETS.items():
+                c.execute(f'''
+                    INSERT INTO {table} (bucket, account_id, payment_type, orders, units, revenue)
+                    SELECT {bucket}, account_id, COALESCE(payment_type, 'unknown'),
+                           COUNT(*), COUNT(credential_id), SUM(price)
+                    FROM orders WHERE id > ? AND id <= ?
+                    GROUP BY 1, 2, 3
+                    ON CONFLICT (bucket, account_id, payment_type) DO UPDATE SET
+                        orders = orders + excluded.orders,
+                        units = units + excluded.units,
+                        revenue = revenue + excluded.revenue
+                ''', (last_order_id, max_order_id))
+            c.execute('''
+                INSERT INTO rollup_state (name, last_order_id) VALUES ('sales', ?)
+                ON CONFLICT (name) DO UPDATE SET last_order_id = excluded.last_order_id
+            ''', (max_order_id,))
+            conn.commit()
+            return new_orders
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+    
+    def get_sales_summary(self, since: str, hourly: bool = False) -> dict:
+        """Sales from the rollups since a UTC bucket ('YYYY-MM-DD' or 'YYYY-MM-DD HH:00:00' if hourly).
+        
+        Returns totals plus per-lot and per-payment-type breakdowns.
+        """
+        table = 'sales_rollup_hourly' if hourly else 'sales_rollup_daily'
+        with self._read_pool.connection() as conn:
+            c = conn.cursor()
+            c.execute(f'''
+                SELECT r.account_id, a.details, SUM(r.orders), SUM(r.units), SUM(r.revenue)
+                FROM {table} r LEFT JOIN accounts a ON a.id = r.account_id
+                WHERE r.bucket >= ?
+                GROUP BY r.account_id
+                ORDER BY SUM(r.revenue) DESC
+            ''', (since,))
+            by_lot = [
+                {'account_id': account_id, 'name': name, 'orders': orders, 'units': units, 'revenue': revenue}
+                for account_id, name, orders, units, revenue in c.fetchall()
+            ]
+            c.execute(f'''
+                SELECT payment_type, SUM(orders), SUM(revenue) FROM {table}
+                WHERE bucket >= ? GROUP BY payment_type ORDER BY payment_type
+            ''', (since,))
+            by_payment = {payment_type: {'orders': orders, 'revenue': revenue}
+                          for payment_type, orders, revenue in c.fetchall()}
+        return {
+            'orders': sum(lot['orders'] for lot in by_lot),
+            'units': sum(lot['units'] for lot in by_lot),
+            'revenue': sum(lot['revenue'] for lot in by_lot),
+            'by_lot': by_lot,
+            'by_payment': by_payment,
+        }
+    
+    # Export queries: (select without WHERE, table alias, date column for range filter and ordering)
+    _EXPORTS = {
+        'orders': ('''
+            SELECT o.id, o.timestamp, o.user_id, u.username, o.account_id, a.details AS lot,
+                   o.price, o.payment_type, o.credential_id
+            FROM orders o
+            LEFT JOIN users u ON u.id = o.user_id
+            LEFT JOIN accounts a ON a.id = o.account_id
+        ''', 'o', 'timestamp'),
+        'credentials': ('''
+            SELECT cr.id, cr.account_id, a.details AS lot, cr.details, cr.sold, cr.sold_at, cr.sold_to
+            FROM credentials cr
+            LEFT JOIN accounts a ON a.id = cr.account_id
+        ''', 'cr', 'sold_at'),
+        'queue': ('''
+            SELECT q.id, q.created_at, q.user_id, q.username, q.account_id, q.payment_type,
+                   q.price_usdt, q.price_rub, q.payment_status, q.invoice_id
+            FROM purchase_queue q
+        ''', 'q', 'created_at'),
+    }
+    
+    def iter_export(self, kind: str, account_id: int = None, date_from: str = None, date_to: str = None,
+                    batch_size: int = 500) -> Iterator[tuple]:
+        """Yield the column names, then matching rows fetched batch_size at a time.
+        
+        date_from/date_to are inclusive 'YYYY-MM-DD' dates; only one batch is held in memory.
+        """
+        if kind not in self._EXPORTS:
+            raise ValueError(f"Unknown export: {kind}")
+        query, alias, date_column = self._EXPORTS[kind]
+        conditions = []
+        params = []
+        if account_id is not None:
+            conditions.append(f'{alias}.account_id = ?')
+            params.append(account_id)
+        if date_from:
+            conditions.append(f'{alias}.{date_column} >= ?')
+            params.append(date_from)
+        if date_to:
+            conditions.append(f"{alias}.{date_column} < date(?, '+1 day')")
+            params.append(date_to)
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += f' ORDER BY {alias}.{date_column}, {alias}.id'
+        yield from self._iter_query(query, params, batch_size)
+    
+    def _iter_query(self, query: str, params, batch_size: int) -> Iterator[tuple]:
+        conn = self._connect()
+        try:
+            c = conn.execute(query, params)
+            yield tuple(column[0] for column in c.description)
+            while True:
+                rows = c.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            conn.close()
+    
+    def iter_lot_report(self, batch_size: int = 500) -> Iterator[tuple]:
+        """Per-lot totals for every lot (header first), computed in one pass over credentials and orders"""
+        yield from self._iter_query('''
+            SELECT a.id, a.details AS lot, a.price, a.available,
+                   COALESCE(cr.total, 0) AS total_logs, COALESCE(cr.sold, 0) AS sold_logs,
+                   COALESCE(cr.total, 0) - COALESCE(cr.sold, 0) AS available_logs,
+                   COALESCE(o.orders, 0) AS orders, COALESCE(o.revenue, 0) AS revenue,
+                   o.last_sale
+            FROM accounts a
+            LEFT JOIN (SELECT account_id, COUNT(*) AS total, SUM(sold = TRUE) AS sold
+                       FROM credentials GROUP BY account_id) cr ON cr.account_id = a.id
+            LEFT JOIN (SELECT account_id, COUNT(*) AS orders, SUM(price) AS revenue, MAX(timestamp) AS last_sale
+                       FROM orders GROUP BY account_id) o ON o.account_id = a.id
+            ORDER BY a.id
+        ''', (), batch_size)
+    
+    def iter_link_audit(self, batch_size: int = 500) -> Iterator[tuple]:
+        """Gift links submitted again after their first use (header first), most reused first"""
+        yield from self._iter_query('''
+            SELECT gl.url, gl.reuse_count, gl.request_id, gl.user_id, gr.username,
+                   gr.status, gl.created_at, gl.check_status
+            FROM gift_links gl
+            JOIN gift_requests gr ON gr.id = gl.request_id
+            WHERE gl.reuse_count > 0
+            ORDER BY gl.reuse_count DESC, gl.id
+        ''', (), batch_size)
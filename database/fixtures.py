@@ -0,0 +1,54 @@
+"""Throwaway databases and bulk test data for tests and benchmarks."""
+
+import uuid
+from typing import List
+
+from database.connection import connect
+from database.database import Database
+
+
+def memory_database(**kwargs) -> Database:
+    """Database on a shared in-memory URI of its own; close() discards it"""
+    return Database(f'file:test-{uuid.uuid4().hex}?mode=memory&cache=shared', **kwargs)
+
+
+def seed_database(db, lots: int = 1000, credentials_per_lot: int = 10, queue_per_lot: int = 0,
+                  price: float = 1.0, queue_status: str = 'pending') -> List[int]:
+    """Add lots with unsold credentials and queue entries; returns the new lot ids.
+
+    Credentials are named lot<id>-login<n>:pass and queue users are 100000 + n, so tests can
+    predict them. On SQLite everything is inserted with executemany in one transaction,
+    storages without a database file get the rows through their public methods.
+    """
+    if db.db_file is None:
+        lot_ids = []
+        for lot in range(lots):
+            account_id = db.add_account(f'Seed lot {lot}', price)
+            lot_ids.append(account_id)
+            for n in range(credentials_per_lot):
+                db.add_credential(account_id, f'lot{account_id}-login{n}:pass')
+            for n in range(queue_per_lot):
+                db.add_to_purchase_queue(100000 + n, account_id, 'crypto', price, username=f'user{n}',
+                                         invoice_id=f'inv-{account_id}-{n}', payment_status=queue_status)
+        return lot_ids
+
+    conn = connect(db.db_file)
+    try:
+        with conn:
+            (last_id,) = conn.execute('SELECT COALESCE(MAX(id), 0) FROM accounts').fetchone()
+            lot_ids = list(range(last_id + 1, last_id + 1 + lots))
+            conn.executemany('INSERT INTO accounts (id, details, price, available) VALUES (?, ?, ?, ?)',
+                             [(account_id, f'Seed lot {lot}', price, credentials_per_lot > 0)
+                              for lot, account_id in enumerate(lot_ids)])
+            conn.executemany('INSERT INTO credentials (account_id, details) VALUES (?, ?)',
+                             [(account_id, f'lot{account_id}-login{n}:pass')
+                              for account_id in lot_ids for n in range(credentials_per_lot)])
+            conn.executemany('''
+                INSERT INTO purchase_queue
+                (user_id, account_id, payment_type, price_usdt, username, invoice_id, payment_status)
+                VALUES (?, ?, 'crypto', ?, ?, ?, ?)
+            ''', [(100000 + n, account_id, price, f'user{n}', f'inv-{account_id}-{n}', queue_status)
+                  for account_id in lot_ids for n in range(queue_per_lot)])
+    finally:
+        conn.close()
+    return lot_ids
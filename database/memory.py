@@ -0,0 +1,881 @@
+"""In-memory storage engine with the same interface as the SQLite Database.
+
+Tables are dicts of row dicts keyed by id, with the column names of the SQLite schema. Indexes
+kept next to them serve the hot paths: a FIFO of unsold credential ids per lot and, per lot
+and queue status, a heap of (created_at, id) of queue entries. Nothing touches the disk except
+snapshot(), which pickles the tables to snapshot_path (the indexes are rebuilt on load), so
+data written after the last snapshot is lost on a crash. Every public method holds one lock,
+so readers on worker threads never see a half-applied write; the lock is reentrant, and the
+_<name>_tx write hooks (called with c=None by services.db_writer.DirectWriter) take it too.
+"""
+
+import functools
+import heapq
+import json
+import os
+import pickle
+import threading
+from bisect import bisect_left, bisect_right
+from collections import Counter, deque
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from database.migrations import count_links
+
+_TABLES = (
+    'accounts', 'credentials', 'orders', 'gift_requests', 'gift_links', 'gifts', 'purchase_queue',
+    'users', 'broadcast_jobs', 'delivery_outbox', 'media_assets',
+    'sales_rollup_hourly', 'sales_rollup_daily',
+)
+
+# Bump when the pickled layout changes incompatibly
+_SNAPSHOT_VERSION = 1
+
+_BROADCAST_SEGMENTS = ('all', 'buyers', 'queue')
+
+_EXPORT_COLUMNS = {
+    'orders': ('id', 'timestamp', 'user_id', 'username', 'account_id', 'lot',
+               'price', 'payment_type', 'credential_id'),
+    'credentials': ('id', 'account_id', 'lot', 'details', 'sold', 'sold_at', 'sold_to'),
+    'queue': ('id', 'created_at', 'user_id', 'username', 'account_id', 'payment_type',
+              'price_usdt', 'price_rub', 'payment_status', 'invoice_id'),
+}
+
+
+def _now(offset_seconds: float = 0) -> str:
+    """UTC time in the format SQLite's CURRENT_TIMESTAMP writes"""
+    moment = datetime.now(timezone.utc) + timedelta(seconds=offset_seconds)
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _locked(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class MemoryDatabase:
+    # No database file: report jobs read through this object instead of opening one
+    db_file = None
+
+    def __init__(self, snapshot_path: str = None):
+        self.snapshot_path = snapshot_path
+        self._lock = threading.RLock()
+        self._tables: Dict[str, Dict] = {name: {} for name in _TABLES}
+        self._next_ids: Dict[str, int] = {name: 1 for name in _TABLES}
+        self._rollup_last_order_id = 0
+        self.snapshots = 0
+        self.last_snapshot_at: Optional[str] = None
+        if snapshot_path and os.path.exists(snapshot_path):
+            with open(snapshot_path, 'rb') as f:
+                state = pickle.load(f)
+            if state.get('version') != _SNAPSHOT_VERSION:
+                raise ValueError(f"Unsupported snapshot version: {state.get('version')}")
+            self._tables = state['tables']
+            self._next_ids = state['next_ids']
+            self._rollup_last_order_id = state['rollup_last_order_id']
+        self._build_indexes()
+
+    def _build_indexes(self) -> None:
+        t = self._tables
+        self._accounts = t['accounts']
+        self._credentials = t['credentials']
+        self._orders = t['orders']
+        self._gift_requests = t['gift_requests']
+        self._gift_links = t['gift_links']
+        self._purchase_queue = t['purchase_queue']
+        self._users = t['users']
+        self._broadcasts = t['broadcast_jobs']
+        self._deliveries = t['delivery_outbox']
+        # Rows are only ever appended, so every table dict iterates in id order
+        self._credentials_by_lot: Dict[int, List[int]] = {}
+        # lot id -> unsold credential ids, oldest first (the order sales take them in)
+        self._unsold: Dict[int, deque] = {}
+        for credential in self._credentials.values():
+            self._index_credential(credential)
+        self._orders_by_user: Dict[int, List[int]] = {}
+        self._orders_by_lot: Dict[int, List[int]] = {}
+        for order in self._orders.values():
+            self._index_order(order)
+        self._queue_by_lot: Dict[int, List[int]] = {}
+        # lot id -> status -> heap of (created_at, id). A status change pushes the entry onto
+        # the heap of its new status; items whose entry has moved on are dropped when reached.
+        self._queue_heaps: Dict[int, Dict[str, list]] = {}
+        for entry in self._purchase_queue.values():
+            self._queue_by_lot.setdefault(entry['account_id'], []).append(entry['id'])
+            self._push_queue_entry(entry)
+        self._pending_gift_by_user = {request['user_id']: request['id']
+                                      for request in self._gift_requests.values()
+                                      if request['status'] == 'pending'}
+        self._links_by_hash: Dict[str, int] = {}
+        self._links_by_request: Dict[int, List[int]] = {}
+        for link in self._gift_links.values():
+            self._index_link(link)
+        self._user_by_username = {user['username'].lower(): user['id']
+                                  for user in self._users.values() if user['username']}
+        self._pending_deliveries = {delivery['id'] for delivery in self._deliveries.values()
+                                    if delivery['status'] == 'pending'}
+        gifts = list(t['gifts'].values())
+        self._gift_cache = self._gift_tuple(gifts[-1]) if gifts else None
+
+    def _insert(self, table: str, **row) -> dict:
+        row['id'] = self._next_ids[table]
+        self._next_ids[table] += 1
+        self._tables[table][row['id']] = row
+        return row
+
+    def _index_credential(self, credential: dict) -> None:
+        self._credentials_by_lot.setdefault(credential['account_id'], []).append(credential['id'])
+        unsold = self._unsold.setdefault(credential['account_id'], deque())
+        if not credential['sold']:
+            unsold.append(credential['id'])
+
+    def _index_order(self, order: dict) -> None:
+        self._orders_by_user.setdefault(order['user_id'], []).append(order['id'])
+        self._orders_by_lot.setdefault(order['account_id'], []).append(order['id'])
+
+    def _index_link(self, link: dict) -> None:
+        self._links_by_hash[link['link_hash']] = link['id']
+        self._links_by_request.setdefault(link['request_id'], []).append(link['id'])
+
+    # Snapshots
+
+    def snapshot(self, path: str = None) -> int:
+        """Write all tables to path (default snapshot_path) atomically; returns the size in bytes.
+
+        Pickling holds the lock, so the snapshot is consistent; the file is written after
+        the lock is released.
+        """
+        path = path or self.snapshot_path
+        if not path:
+            raise ValueError("No snapshot path configured")
+        with self._lock:
+            data = pickle.dumps({
+                'version': _SNAPSHOT_VERSION,
+                'tables': self._tables,
+                'next_ids': self._next_ids,
+                'rollup_last_order_id': self._rollup_last_order_id,
+            }, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        self.snapshots += 1
+        self.last_snapshot_at = _now()
+        return len(data)
+
+    def stats(self) -> dict:
+        return {
+            'backend': 'memory',
+            'snapshots': self.snapshots,
+            'last_snapshot_at': self.last_snapshot_at,
+            'rows': sum(len(rows) for rows in self._tables.values()),
+        }
+
+    def close(self) -> None:
+        """Write a final snapshot if a snapshot path is configured"""
+        if self.snapshot_path:
+            self.snapshot()
+
+    def run_backfills(self, chunk_size: int = 500, max_chunks: int = None) -> bool:
+        """Nothing to backfill: rows are always written complete"""
+        return False
+
+    def create_writer(self, max_batch: int = 256):
+        """DirectWriter: there are no transactions to group, so max_batch is ignored"""
+        from services.db_writer import DirectWriter
+        return DirectWriter(self)
+
+    # Lots and credentials
+
+    @_locked
+    def add_account(self, details: str, price: float) -> int:
+        return self._insert('accounts', details=details, price=price, available=1)['id']
+
+    @_locked
+    def get_available_accounts(self) -> List[Tuple[int, str, float]]:
+        return [(a['id'], a['details'], a['price']) for a in self._accounts.values() if a['available']]
+
+    @_locked
+    def get_account(self, account_id: int) -> Tuple[int, str, float, bool]:
+        account = self._accounts.get(account_id)
+        if account is None:
+            return None
+        return (account['id'], account['details'], account['price'], account['available'])
+
+    @_locked
+    def _add_credential_tx(self, c, account_id: int, details: str) -> int:
+        credential = self._insert('credentials', account_id=account_id, details=details,
+                                  sold=0, sold_at=None, sold_to=None)
+        self._index_credential(credential)
+        if account_id in self._accounts:
+            self._accounts[account_id]['available'] = 1
+        return credential['id']
+
+    @_locked
+    def add_credential(self, account_id: int, details: str) -> int:
+        return self._add_credential_tx(None, account_id, details)
+
+    @_locked
+    def count_available_credentials(self, account_id: int) -> int:
+        return len(self._unsold.get(account_id, ()))
+
+    def _sell_next_credential(self, account_id: int, user_id: int) -> Optional[dict]:
+        unsold = self._unsold.get(account_id)
+        if not unsold:
+            return None
+        credential = self._credentials[unsold.popleft()]
+        credential.update(sold=1, sold_at=_now(), sold_to=user_id)
+        if not unsold and account_id in self._accounts:
+            self._accounts[account_id]['available'] = 0
+        return credential
+
+    @_locked
+    def pop_next_credential(self, account_id: int, user_id: int) -> Tuple[int, str]:
+        credential = self._sell_next_credential(account_id, user_id)
+        if credential is None:
+            return (0, '')
+        return (credential['id'], credential['details'])
+
+    @_locked
+    def update_account_price(self, account_id: int, new_price: float) -> bool:
+        if account_id not in self._accounts:
+            return False
+        self._accounts[account_id]['price'] = new_price
+        return True
+
+    @_locked
+    def delete_account(self, account_id: int) -> bool:
+        # Like the SQLite engine, credentials and orders of the lot are kept
+        return self._accounts.pop(account_id, None) is not None
+
+    @_locked
+    def _mark_account_sold_tx(self, c, account_id: int, user_id: int, price: float,
+                              delivery_kind: str = None, delivery_payload: dict = None,
+                              payment_type: str = None) -> Tuple[bool, str, bool]:
+        credential = self._sell_next_credential(account_id, user_id)
+        if credential is None:
+            return (False, '', False)
+        order = self._insert('orders', user_id=user_id, account_id=account_id,
+                             credential_id=credential['id'], price=price, timestamp=_now(),
+                             payment_type=payment_type)
+        self._index_order(order)
+        if delivery_kind:
+            now = _now()
+            delivery = self._insert('delivery_outbox', user_id=user_id, account_id=account_id,
+                                    credential_id=credential['id'], order_id=order['id'],
+                                    kind=delivery_kind, payload=json.dumps(delivery_payload or {}),
+                                    status='pending', attempts=0, next_attempt_at=now, last_error=None,
+                                    created_at=now, delivered_at=None)
+            self._pending_deliveries.add(delivery['id'])
+        return (True, credential['details'], not self._unsold[account_id])
+
+    @_locked
+    def mark_account_sold(self, account_id: int, user_id: int, price: float,
+                          delivery_kind: str = None, delivery_payload: dict = None,
+                          payment_type: str = None) -> Tuple[bool, str, bool]:
+        return self._mark_account_sold_tx(None, account_id, user_id, price, delivery_kind,
+                                          delivery_payload, payment_type)
+
+    @_locked
+    def get_user_orders_page(self, user_id: int, before_order_id: int = None,
+                             limit: int = 5) -> Tuple[List[Tuple[int, str, float, str, Optional[str]]], bool]:
+        # Orders are timestamped on insert, so id order is also timestamp order
+        order_ids = self._orders_by_user.get(user_id, [])
+        end = len(order_ids)
+        if before_order_id is not None:
+            end = bisect_left(order_ids, before_order_id)
+            if end == len(order_ids) or order_ids[end] != before_order_id:
+                return [], False
+        page = order_ids[max(0, end - limit - 1):end][::-1]
+        rows = []
+        for order_id in page[:limit]:
+            order = self._orders[order_id]
+            account = self._accounts.get(order['account_id'])
+            credential = self._credentials.get(order['credential_id'])
+            rows.append((order['id'], account['details'] if account else None, order['price'],
+                         order['timestamp'], credential['details'] if credential else None))
+        return rows, len(page) > limit
+
+    @_locked
+    def get_lot_statistics(self, account_id: int) -> dict:
+        account = self._accounts.get(account_id)
+        if account is None:
+            return {}
+        total_count = len(self._credentials_by_lot.get(account_id, ()))
+        available_count = len(self._unsold.get(account_id, ()))
+        return {
+            'id': account['id'],
+            'name': account['details'],
+            'price': account['price'],
+            'available': account['available'],
+            'total_logs': total_count,
+            'sold_logs': total_count - available_count,
+            'available_logs': available_count,
+            'total_revenue': sum(self._orders[order_id]['price']
+                                 for order_id in self._orders_by_lot.get(account_id, ())),
+        }
+
+    @_locked
+    def get_all_lots_statistics(self) -> list:
+        return [self.get_lot_statistics(account_id) for account_id in sorted(self._accounts)]
+
+    # Gift requests
+
+    @staticmethod
+    def _count_links(links: str) -> int:
+        return count_links(links)
+
+    @_locked
+    def _create_gift_request_tx(self, c, user_id: int, username: str, links: str,
+                                link_count: int = None) -> int:
+        if user_id in self._pending_gift_by_user:
+            raise ValueError(f"User {user_id} already has a pending gift request")
+        request = self._insert('gift_requests', user_id=user_id, username=username, links=links,
+                               status='pending', created_at=_now(), processed_at=None, processed_by=None,
+                               link_count=self._count_links(links) if link_count is None else link_count)
+        self._pending_gift_by_user[user_id] = request['id']
+        return request['id']
+
+    @_locked
+    def create_gift_request(self, user_id: int, username: str, links: str) -> int:
+        return self._create_gift_request_tx(None, user_id, username, links)
+
+    def create_gift_request_with_links(self, user_id: int, username: str, links: str,
+                                       normalized_links: List[Tuple[str, str]]) -> Tuple[Optional[int], List[str]]:
+        return self._create_gift_request_with_links_tx(None, user_id, username, links, normalized_links)
+
+    @_locked
+    def _create_gift_request_with_links_tx(self, c, user_id: int, username: str, links: str,
+                                           normalized_links: List[Tuple[str, str]]) -> Tuple[Optional[int], List[str]]:
+        used = {self._links_by_hash[link_hash] for link_hash, _ in normalized_links
+                if link_hash in self._links_by_hash}
+        if used:
+            for link_id in sorted(used):
+                self._gift_links[link_id]['reuse_count'] += 1
+            return None, [self._gift_links[link_id]['url'] for link_id in sorted(used)]
+        if user_id in self._pending_gift_by_user:
+            return None, []
+        request_id = self._create_gift_request_tx(None, user_id, username, links, len(normalized_links))
+        for link_hash, url in normalized_links:
+            link = self._insert('gift_links', request_id=request_id, user_id=user_id, link_hash=link_hash,
+                                url=url, reuse_count=0, created_at=_now(), check_status=None,
+                                check_detail=None, final_url=None, checked_at=None)
+            self._index_link(link)
+        return request_id, []
+
+    @_locked
+    def get_gift_links(self, request_id: int) -> List[Tuple[int, str, Optional[str], Optional[str], int]]:
+        return [(link['id'], link['url'], link['check_status'], link['check_detail'], link['reuse_count'])
+                for link in map(self._gift_links.get, self._links_by_request.get(request_id, ()))]
+
+    @_locked
+    def save_gift_link_checks(self, results: List[Tuple[int, str, str, Optional[str]]]) -> None:
+        now = _now()
+        for link_id, status, detail, final_url in results:
+            link = self._gift_links.get(link_id)
+            if link is not None:
+                link.update(check_status=status, check_detail=detail, final_url=final_url, checked_at=now)
+
+    @staticmethod
+    def _gift_request_tuple(request: dict) -> Tuple:
+        return (request['id'], request['user_id'], request['username'], request['links'], request['created_at'])
+
+    @_locked
+    def get_pending_gift_requests(self) -> List[Tuple]:
+        requests = sorted(map(self._gift_requests.get, self._pending_gift_by_user.values()),
+                          key=lambda request: (request['created_at'], request['id']))
+        return [self._gift_request_tuple(request) for request in requests]
+
+    @_locked
+    def get_pending_gift_user_ids(self) -> List[int]:
+        return list(self._pending_gift_by_user)
+
+    @_locked
+    def get_pending_gift_requests_page(self, after_id: int = None, before_id: int = None,
+                                       limit: int = 10) -> Tuple[List[Tuple[int, str, int]], bool, bool]:
+        ids = sorted(self._pending_gift_by_user.values())
+        if before_id is not None:
+            end = bisect_left(ids, before_id)
+            page = ids[max(0, end - limit):end]
+            has_prev = end > limit
+            has_next = bisect_right(ids, page[-1] if page else before_id - 1) < len(ids)
+        else:
+            start = bisect_right(ids, after_id or 0)
+            page = ids[start:start + limit]
+            has_next = len(ids) > start + limit
+            has_prev = bisect_left(ids, page[0] if page else (after_id or 0) + 1) > 0
+        rows = [(request['id'], request['username'], request['link_count'])
+                for request in map(self._gift_requests.get, page)]
+        return rows, has_prev, has_next
+
+    @_locked
+    def count_pending_gift_requests(self) -> int:
+        return len(self._pending_gift_by_user)
+
+    @_locked
+    def get_gift_request(self, request_id: int) -> Tuple:
+        request = self._gift_requests.get(request_id)
+        return self._gift_request_tuple(request) if request else None
+
+    def _set_gift_request_status(self, request: dict, status: str, processed_by: int) -> None:
+        if self._pending_gift_by_user.get(request['user_id']) == request['id']:
+            del self._pending_gift_by_user[request['user_id']]
+        request.update(status=status, processed_at=_now(), processed_by=processed_by)
+        if status == 'pending':
+            self._pending_gift_by_user[request['user_id']] = request['id']
+        elif status == 'rejected':
+            # Free the links so the user can submit them again
+            for link_id in self._links_by_request.pop(request['id'], ()):
+                link = self._gift_links.pop(link_id)
+                if self._links_by_hash.get(link['link_hash']) == link_id:
+                    del self._links_by_hash[link['link_hash']]
+
+    @_locked
+    def process_gift_request(self, request_id: int, status: str, processed_by: int) -> bool:
+        request = self._gift_requests.get(request_id)
+        if request is None:
+            return False
+        self._set_gift_request_status(request, status, processed_by)
+        return True
+
+    @_locked
+    def process_gift_requests_bulk(self, status: str, processed_by: int, first_id: int = None,
+                                   last_id: int = None, min_links: int = None,
+                                   max_links: int = None) -> List[Tuple[int, int, str]]:
+        changed = []
+        for request in map(self._gift_requests.get, sorted(self._pending_gift_by_user.values())):
+            link_count = request['link_count']
+            if ((first_id is not None and request['id'] < first_id)
+                    or (last_id is not None and request['id'] > last_id)
+                    or (min_links is not None and (link_count is None or link_count < min_links))
+                    or (max_links is not None and (link_count is None or link_count > max_links))):
+                continue
+            changed.append((request['id'], request['user_id'], request['username']))
+            self._set_gift_request_status(request, status, processed_by)
+        return changed
+
+    @staticmethod
+    def _gift_tuple(gift: dict) -> Tuple:
+        return (gift['gift_type'], gift['content'], gift['file_id'],
+                gift['source_chat_id'], gift['source_message_id'])
+
+    @_locked
+    def save_gift(self, gift_type: str, content: str, file_id: str = None,
+                  source_chat_id: int = None, source_message_id: int = None) -> int:
+        self._tables['gifts'].clear()
+        gift = self._insert('gifts', gift_type=gift_type, content=content, file_id=file_id,
+                            created_at=_now(), source_chat_id=source_chat_id,
+                            source_message_id=source_message_id)
+        self._gift_cache = self._gift_tuple(gift)
+        return gift['id']
+
+    def get_current_gift(self) -> Tuple:
+        return self._gift_cache
+
+    # Purchase queue
+
+    def _push_queue_entry(self, entry: dict) -> None:
+        status = entry['payment_status']
+        if status in ('pending', 'paid'):
+            heap = self._queue_heaps.setdefault(entry['account_id'], {}).setdefault(status, [])
+            heapq.heappush(heap, (entry['created_at'], entry['id']))
+
+    def _queue_head(self, account_id: int, status: str, limit: int) -> List[dict]:
+        """First `limit` entries of a lot with the given status, oldest first"""
+        heap = self._queue_heaps.get(account_id, {}).get(status)
+        entries = []
+        taken = set()
+        while heap and len(entries) < limit:
+            item = heapq.heappop(heap)
+            entry = self._purchase_queue[item[1]]
+            if entry['payment_status'] != status or item in taken:
+                # Stale: the entry changed status after this item was pushed (or was pushed twice)
+                continue
+            entries.append(entry)
+            taken.add(item)
+        for item in taken:
+            heapq.heappush(heap, item)
+        return entries
+
+    def _set_queue_status(self, entry: dict, status: str) -> None:
+        if entry['payment_status'] != status:
+            entry['payment_status'] = status
+            self._push_queue_entry(entry)
+
+    @_locked
+    def _add_to_purchase_queue_tx(self, c, user_id: int, account_id: int, payment_type: str,
+                                  price_usdt: float, price_rub: int = None, username: str = None,
+                                  invoice_id: str = None, payment_status: str = 'pending') -> int:
+        entry = self._insert('purchase_queue', user_id=user_id, account_id=account_id,
+                             payment_type=payment_type, price_usdt=price_usdt, price_rub=price_rub,
+                             username=username, invoice_id=invoice_id, payment_status=payment_status,
+                             created_at=_now())
+        self._queue_by_lot.setdefault(account_id, []).append(entry['id'])
+        self._push_queue_entry(entry)
+        return entry['id']
+
+    @_locked
+    def add_to_purchase_queue(self, user_id: int, account_id: int, payment_type: str,
+                              price_usdt: float, price_rub: int = None, username: str = None,
+                              invoice_id: str = None, payment_status: str = 'pending') -> int:
+        return self._add_to_purchase_queue_tx(None, user_id, account_id, payment_type, price_usdt,
+                                              price_rub, username, invoice_id, payment_status)
+
+    @_locked
+    def get_queue_size(self, account_id: int) -> int:
+        return sum(1 for queue_id in self._queue_by_lot.get(account_id, ())
+                   if self._purchase_queue[queue_id]['payment_status'] in ('pending', 'paid'))
+
+    @_locked
+    def get_next_from_queue(self, account_id: int) -> Tuple:
+        head = self._queue_head(account_id, 'pending', 1)
+        if not head:
+            return None
+        entry = head[0]
+        return (entry['id'], entry['user_id'], entry['payment_type'], entry['price_usdt'],
+                entry['price_rub'], entry['username'], entry['invoice_id'])
+
+    @_locked
+    def mark_queue_entry_fulfilled(self, queue_id: int) -> bool:
+        entry = self._purchase_queue.get(queue_id)
+        if entry is None:
+            return False
+        self._set_queue_status(entry, 'fulfilled')
+        return True
+
+    @_locked
+    def _update_queue_payment_status_tx(self, c, user_id: int, account_id: int, invoice_id: str, status: str) -> bool:
+        entries = [entry for entry in map(self._purchase_queue.get, self._queue_by_lot.get(account_id, ()))
+                   if entry['user_id'] == user_id and entry['invoice_id'] == invoice_id]
+        for entry in entries:
+            self._set_queue_status(entry, status)
+        return bool(entries)
+
+    @_locked
+    def update_queue_payment_status(self, user_id: int, account_id: int, invoice_id: str, status: str) -> bool:
+        return self._update_queue_payment_status_tx(None, user_id, account_id, invoice_id, status)
+
+    @_locked
+    def process_queue_for_lot(self, account_id: int) -> List[Tuple]:
+        available_count = len(self._unsold.get(account_id, ()))
+        if available_count == 0:
+            return []
+        # Paid entries first, then pending ones, each oldest first
+        entries = self._queue_head(account_id, 'paid', available_count)
+        entries += self._queue_head(account_id, 'pending', available_count - len(entries))
+        return [(entry['id'], entry['user_id'], entry['payment_type'], entry['price_usdt'],
+                 entry['price_rub'], entry['username'], entry['invoice_id'], entry['payment_status'])
+                for entry in entries]
+
+    # Delivery outbox
+
+    @staticmethod
+    def _delivery_row(delivery: dict, columns: Tuple[str, ...]) -> dict:
+        row = {column: delivery[column] for column in columns}
+        row['payload'] = json.loads(row['payload']) if row.get('payload') else {}
+        return row
+
+    @_locked
+    def claim_due_deliveries(self, limit: int = 50, lease_seconds: int = 60) -> List[dict]:
+        now = _now()
+        lease_until = _now(int(lease_seconds))
+        rows = []
+        for delivery_id in sorted(self._pending_deliveries):
+            if len(rows) >= limit:
+                break
+            delivery = self._deliveries[delivery_id]
+            credential = self._credentials.get(delivery['credential_id'])
+            if delivery['next_attempt_at'] > now or credential is None:
+                continue
+            row = self._delivery_row(delivery, ('id', 'user_id', 'account_id', 'credential_id', 'order_id',
+                                                'kind', 'payload', 'attempts'))
+            row['details'] = credential['details']
+            rows.append(row)
+            delivery['attempts'] += 1
+            delivery['next_attempt_at'] = lease_until
+        return rows
+
+    @_locked
+    def mark_delivery_sent(self, delivery_id: int) -> bool:
+        delivery = self._deliveries.get(delivery_id)
+        if delivery is None:
+            return False
+        delivery.update(status='delivered', delivered_at=_now(), last_error=None)
+        self._pending_deliveries.discard(delivery_id)
+        return True
+
+    @_locked
+    def reschedule_delivery(self, delivery_id: int, error: str, delay_seconds: int) -> bool:
+        delivery = self._deliveries.get(delivery_id)
+        if delivery is None:
+            return False
+        delivery.update(last_error=error, next_attempt_at=_now(int(delay_seconds)))
+        return True
+
+    @_locked
+    def mark_delivery_failed(self, delivery_id: int, error: str) -> bool:
+        delivery = self._deliveries.get(delivery_id)
+        if delivery is None:
+            return False
+        delivery.update(status='failed', last_error=error)
+        self._pending_deliveries.discard(delivery_id)
+        return True
+
+    @_locked
+    def get_stuck_deliveries(self, older_than_seconds: int = 300, limit: int = 20) -> List[dict]:
+        cutoff = _now(-int(older_than_seconds))
+        rows = []
+        for delivery in self._deliveries.values():
+            if len(rows) >= limit:
+                break
+            if delivery['status'] == 'failed' or (
+                    delivery['status'] == 'pending'
+                    and (delivery['last_error'] is not None or delivery['created_at'] <= cutoff)):
+                rows.append(self._delivery_row(delivery, (
+                    'id', 'user_id', 'account_id', 'credential_id', 'order_id', 'kind', 'payload',
+                    'status', 'attempts', 'last_error', 'created_at', 'next_attempt_at')))
+        return rows
+
+    @_locked
+    def count_deliveries_by_status(self) -> dict:
+        return dict(Counter(delivery['status'] for delivery in self._deliveries.values()))
+
+    @_locked
+    def retry_failed_deliveries(self) -> int:
+        now = _now()
+        count = 0
+        for delivery in self._deliveries.values():
+            if delivery['status'] == 'failed':
+                delivery.update(status='pending', attempts=0, next_attempt_at=now)
+                self._pending_deliveries.add(delivery['id'])
+                count += 1
+        return count
+
+    # Media assets
+
+    @_locked
+    def get_media_file_id(self, name: str, signature: str) -> Optional[str]:
+        asset = self._tables['media_assets'].get(name)
+        return asset['file_id'] if asset and asset['signature'] == signature else None
+
+    @_locked
+    def save_media_file_id(self, name: str, signature: str, file_id: str) -> None:
+        self._tables['media_assets'][name] = {'name': name, 'signature': signature, 'file_id': file_id,
+                                              'uploaded_at': _now()}
+
+    @_locked
+    def forget_media_file_id(self, name: str) -> bool:
+        return self._tables['media_assets'].pop(name, None) is not None
+
+    # Users and broadcasts
+
+    @_locked
+    def upsert_users(self, users: List[Tuple[int, Optional[str], Optional[str], str, str]]) -> None:
+        for user_id, username, first_name, first_seen, last_seen in users:
+            user = self._users.get(user_id)
+            if user is None:
+                user = self._users[user_id] = {'id': user_id, 'username': None, 'first_name': None,
+                                               'first_seen': first_seen, 'last_seen': last_seen,
+                                               'blocked': 0}
+            elif user['username'] and self._user_by_username.get(user['username'].lower()) == user_id:
+                del self._user_by_username[user['username'].lower()]
+            user.update(username=username, first_name=first_name,
+                        last_seen=max(user['last_seen'], last_seen), blocked=0)
+            if username:
+                self._user_by_username[username.lower()] = user_id
+
+    @_locked
+    def find_user_id_by_username(self, username: str) -> Optional[int]:
+        return self._user_by_username.get(username.lstrip('@').lower())
+
+    @_locked
+    def count_users(self, active_within_hours: int = 24) -> Tuple[int, int]:
+        since = _now(-int(active_within_hours) * 3600)
+        return len(self._users), sum(1 for user in self._users.values() if user['last_seen'] >= since)
+
+    def _segment_user_ids(self, segment: str, account_id: Optional[int]) -> List[int]:
+        """Recipient user ids of a broadcast segment in ascending order"""
+        blocked = {user['id'] for user in self._users.values() if user['blocked']}
+        if segment == 'all':
+            user_ids = set(self._users)
+        elif segment == 'buyers':
+            user_ids = {self._orders[order_id]['user_id'] for order_id in self._orders_by_lot.get(account_id, ())}
+        else:
+            user_ids = {entry['user_id'] for entry in map(self._purchase_queue.get,
+                                                           self._queue_by_lot.get(account_id, ()))
+                        if entry['payment_status'] in ('pending', 'paid')}
+        return sorted(user_ids - blocked)
+
+    @_locked
+    def create_broadcast(self, segment: str, account_id: Optional[int], source_chat_id: int,
+                         source_message_id: int, created_by: int) -> int:
+        if segment not in _BROADCAST_SEGMENTS:
+            raise ValueError(f"Unknown broadcast segment: {segment}")
+        return self._insert('broadcast_jobs', segment=segment, account_id=account_id,
+                            source_chat_id=source_chat_id, source_message_id=source_message_id,
+                            progress_chat_id=None, progress_message_id=None, status='running', cursor=0,
+                            total=len(self._segment_user_ids(segment, account_id)), sent=0, failed=0,
+                            blocked=0, created_by=created_by, created_at=_now(), finished_at=None)['id']
+
+    @_locked
+    def set_broadcast_progress_message(self, job_id: int, chat_id: int, message_id: int) -> None:
+        if job_id in self._broadcasts:
+            self._broadcasts[job_id].update(progress_chat_id=chat_id, progress_message_id=message_id)
+
+    @_locked
+    def get_broadcast(self, job_id: int) -> Optional[dict]:
+        job = self._broadcasts.get(job_id)
+        return dict(job) if job else None
+
+    @_locked
+    def get_broadcasts(self, status: str = None, limit: int = 10) -> List[dict]:
+        if status:
+            jobs = [job for job in self._broadcasts.values() if job['status'] == status]
+        else:
+            jobs = list(self._broadcasts.values())[::-1]
+        return [dict(job) for job in jobs[:limit]]
+
+    @_locked
+    def get_broadcast_recipients(self, job: dict, limit: int) -> List[int]:
+        user_ids = self._segment_user_ids(job['segment'], job['account_id'])
+        start = bisect_right(user_ids, job['cursor'])
+        return user_ids[start:start + limit]
+
+    @_locked
+    def checkpoint_broadcast(self, job_id: int, cursor: int, sent: int, failed: int,
+                             blocked_user_ids: List[int]) -> None:
+        job = self._broadcasts.get(job_id)
+        if job is not None:
+            job.update(cursor=cursor, sent=job['sent'] + sent, failed=job['failed'] + failed,
+                       blocked=job['blocked'] + len(blocked_user_ids))
+        for user_id in blocked_user_ids:
+            if user_id in self._users:
+                self._users[user_id]['blocked'] = 1
+
+    @_locked
+    def set_broadcast_status(self, job_id: int, status: str) -> bool:
+        job = self._broadcasts.get(job_id)
+        if job is None or job['status'] in ('done', 'cancelled'):
+            return False
+        job.update(status=status, finished_at=_now() if status in ('done', 'cancelled') else None)
+        return True
+
+    # Sales rollups
+
+    _ROLLUP_BUCKETS = {
+        'sales_rollup_hourly': lambda timestamp: timestamp[:13] + ':00:00',
+        'sales_rollup_daily': lambda timestamp: timestamp[:10],
+    }
+
+    @_locked
+    def refresh_sales_rollups(self) -> int:
+        # Orders are never deleted, so the ids after the high-water mark are contiguous
+        new_orders = [self._orders[order_id]
+                      for order_id in range(self._rollup_last_order_id + 1, self._next_ids['orders'])]
+        for table, bucket in self._ROLLUP_BUCKETS.items():
+            rollup = self._tables[table]
+            for order in new_orders:
+                key = (bucket(order['timestamp']), order['account_id'], order['payment_type'] or 'unknown')
+                totals = rollup.setdefault(key, {'orders': 0, 'units': 0, 'revenue': 0})
+                totals['orders'] += 1
+                totals['units'] += order['credential_id'] is not None
+                totals['revenue'] += order['price']
+        self._rollup_last_order_id = self._next_ids['orders'] - 1
+        return len(new_orders)
+
+    @_locked
+    def get_sales_summary(self, since: str, hourly: bool = False) -> dict:
+        rollup = self._tables['sales_rollup_hourly' if hourly else 'sales_rollup_daily']
+        lots: Dict[int, dict] = {}
+        payments: Dict[str, dict] = {}
+        for (bucket, account_id, payment_type), totals in rollup.items():
+            if bucket < since:
+                continue
+            account = self._accounts.get(account_id)
+            lot = lots.setdefault(account_id, {'account_id': account_id,
+                                               'name': account['details'] if account else None,
+                                               'orders': 0, 'units': 0, 'revenue': 0})
+            payment = payments.setdefault(payment_type, {'orders': 0, 'revenue': 0})
+            for key in ('orders', 'units', 'revenue'):
+                lot[key] += totals[key]
+            payment['orders'] += totals['orders']
+            payment['revenue'] += totals['revenue']
+        by_lot = sorted(lots.values(), key=lambda lot: lot['revenue'], reverse=True)
+        return {
+            'orders': sum(lot['orders'] for lot in by_lot),
+            'units': sum(lot['units'] for lot in by_lot),
+            'revenue': sum(lot['revenue'] for lot in by_lot),
+            'by_lot': by_lot,
+            'by_payment': dict(sorted(payments.items())),
+        }
+
+    # Exports and reports. Rows are copied while the lock is held and the returned iterator
+    # only walks the copy, so a report thread never reads tables that are being changed.
+
+    @_locked
+    def iter_export(self, kind: str, account_id: int = None, date_from: str = None, date_to: str = None,
+                    batch_size: int = 500) -> Iterator[tuple]:
+        """Column names, then matching rows; date_from/date_to are inclusive 'YYYY-MM-DD' dates"""
+        if kind not in _EXPORT_COLUMNS:
+            raise ValueError(f"Unknown export: {kind}")
+        table, date_column = {
+            'orders': (self._orders, 'timestamp'),
+            'credentials': (self._credentials, 'sold_at'),
+            'queue': (self._purchase_queue, 'created_at'),
+        }[kind]
+        date_until = (date.fromisoformat(date_to) + timedelta(days=1)).isoformat() if date_to else None
+        rows = []
+        for row in table.values():
+            value = row[date_column]
+            if ((account_id is not None and row['account_id'] != account_id)
+                    or (date_from and (value is None or value < date_from))
+                    or (date_until and (value is None or value >= date_until))):
+                continue
+            rows.append(row)
+        # NULL dates sort first, as in SQLite
+        rows.sort(key=lambda row: (row[date_column] is not None, row[date_column] or '', row['id']))
+        columns = _EXPORT_COLUMNS[kind]
+        result = [columns]
+        for row in rows:
+            account = self._accounts.get(row['account_id'])
+            values = dict(row, lot=account['details'] if account else None)
+            if kind == 'orders':
+                user = self._users.get(row['user_id'])
+                values['username'] = user['username'] if user else None
+            result.append(tuple(values[column] for column in columns))
+        return iter(result)
+
+    @_locked
+    def iter_lot_report(self, batch_size: int = 500) -> Iterator[tuple]:
+        """Per-lot totals for every lot, header first"""
+        result = [('id', 'lot', 'price', 'available', 'total_logs', 'sold_logs', 'available_logs',
+                   'orders', 'revenue', 'last_sale')]
+        for account_id in sorted(self._accounts):
+            account = self._accounts[account_id]
+            total = len(self._credentials_by_lot.get(account_id, ()))
+            available = len(self._unsold.get(account_id, ()))
+            orders = [self._orders[order_id] for order_id in self._orders_by_lot.get(account_id, ())]
+            result.append((account_id, account['details'], account['price'], account['available'],
+                           total, total - available, available, len(orders),
+                           sum(order['price'] for order in orders),
+                           max((order['timestamp'] for order in orders), default=None)))
+        return iter(result)
+
+    @_locked
+    def iter_link_audit(self, batch_size: int = 500) -> Iterator[tuple]:
+        """Gift links submitted again after their first use, most reused first (header first)"""
+        links = sorted((link for link in self._gift_links.values()
+                        if link['reuse_count'] > 0 and link['request_id'] in self._gift_requests),
+                       key=lambda link: (-link['reuse_count'], link['id']))
+        result = [('url', 'reuse_count', 'request_id', 'user_id', 'username', 'status', 'created_at',
+                   'check_status')]
+        for link in links:
+            request = self._gift_requests[link['request_id']]
+            result.append((link['url'], link['reuse_count'], link['request_id'], link['user_id'],
+                           request['username'], request['status'], link['created_at'], link['check_status']))
+        return iter(result)
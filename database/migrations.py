@@ -0,0 +1,346 @@
+"""Schema migrations, applied in order and tracked with PRAGMA user_version.
+
+Each migration's schema change runs in one transaction together with the user_version bump,
+so a failed migration leaves the database at the previous version. Data backfills run
+separately in small chunks (one transaction each) after startup, so a large database does
+not hold up the bot; pending backfills are recorded in schema_backfills and survive restarts.
+"""
+
+import sqlite3
+from typing import Callable, List, Optional, Tuple
+
+from database.connection import connect
+
+
+def count_links(links: str) -> int:
+    return len([link for link in links.split('\n') if 'tiktok.com' in link.lower()])
+
+
+def _baseline(c: sqlite3.Cursor) -> None:
+    """Schema as of the switch to versioned migrations.
+
+    Idempotent, so it also brings databases created by older releases (user_version 0,
+    any subset of these tables and columns) up to date.
+    """
+    # Create accounts table
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS accounts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            details TEXT NOT NULL,
+            price REAL NOT NULL,
+            available BOOLEAN DEFAULT TRUE
+        )
+    ''')
+    # Create credentials table (multiple credentials per account/lot)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS credentials (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            account_id INTEGER NOT NULL,
+            details TEXT NOT NULL,
+            sold BOOLEAN DEFAULT FALSE,
+            sold_at DATETIME,
+            sold_to INTEGER,
+            FOREIGN KEY (account_id) REFERENCES accounts (id)
+        )
+    ''')
+    
+    # Create orders table
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            account_id INTEGER NOT NULL,
+            credential_id INTEGER,
+            price REAL NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (account_id) REFERENCES accounts (id),
+            FOREIGN KEY (credential_id) REFERENCES credentials (id)
+        )
+    ''')
+    
+    # Create gift_requests table
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS gift_requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            username TEXT,
+            links TEXT NOT NULL,
+            status TEXT DEFAULT 'pending',
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            processed_at DATETIME,
+            processed_by INTEGER
+        )
+    ''')
+    
+    # Number of links is stored once at creation for cheap listing
+    # (filled for existing rows by _backfill_link_count)
+    c.execute('PRAGMA table_info(gift_requests)')
+    if 'link_count' not in [column[1] for column in c.fetchall()]:
+        c.execute('ALTER TABLE gift_requests ADD COLUMN link_count INTEGER')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_gift_requests_status ON gift_requests (status, id)')
+    # At most one pending request per user; older duplicates from before the index are rejected
+    c.execute('''
+        UPDATE gift_requests SET status = 'rejected', processed_at = CURRENT_TIMESTAMP
+        WHERE status = 'pending' AND id NOT IN (
+            SELECT MAX(id) FROM gift_requests WHERE status = 'pending' GROUP BY user_id
+        )
+    ''')
+    c.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_gift_requests_one_pending
+        ON gift_requests (user_id) WHERE status = 'pending'
+    ''')
+    
+    # Create gift_links table (normalized links of gift requests, each usable once)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS gift_links (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            request_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            link_hash TEXT NOT NULL,
+            url TEXT NOT NULL,
+            reuse_count INTEGER DEFAULT 0,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (request_id) REFERENCES gift_requests (id)
+        )
+    ''')
+    c.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_gift_links_hash ON gift_links (link_hash)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_gift_links_request ON gift_links (request_id)')
+    # Automatic link check results
+    c.execute('PRAGMA table_info(gift_links)')
+    existing = [column[1] for column in c.fetchall()]
+    for column, ddl in (('check_status', 'TEXT'), ('check_detail', 'TEXT'),
+                        ('final_url', 'TEXT'), ('checked_at', 'DATETIME')):
+        if column not in existing:
+            c.execute(f'ALTER TABLE gift_links ADD COLUMN {column} {ddl}')
+    
+    # Create gifts table
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS gifts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            gift_type TEXT NOT NULL,
+            content TEXT NOT NULL,
+            file_id TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Admin's original gift message, delivered with copy_message
+    c.execute('PRAGMA table_info(gifts)')
+    existing = [column[1] for column in c.fetchall()]
+    for column in ('source_chat_id', 'source_message_id'):
+        if column not in existing:
+            c.execute(f'ALTER TABLE gifts ADD COLUMN {column} INTEGER')
+    
+    # Create purchase_queue table
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS purchase_queue (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            account_id INTEGER NOT NULL,
+            payment_type TEXT NOT NULL,
+            price_usdt REAL NOT NULL,
+            price_rub INTEGER,
+            username TEXT,
+            invoice_id TEXT,
+            payment_status TEXT DEFAULT 'pending',
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (account_id) REFERENCES accounts (id)
+        )
+    ''')
+    
+    # Create users table (everyone who has interacted with the bot)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            first_seen DATETIME DEFAULT CURRENT_TIMESTAMP,
+            last_seen DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_users_username ON users (lower(username))')
+    c.execute('PRAGMA table_info(users)')
+    if 'blocked' not in [column[1] for column in c.fetchall()]:
+        c.execute('ALTER TABLE users ADD COLUMN blocked INTEGER DEFAULT 0')
+    
+    # Create broadcast_jobs table (announcements sent in batches, resumable from cursor)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS broadcast_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            segment TEXT NOT NULL,
+            account_id INTEGER,
+            source_chat_id INTEGER NOT NULL,
+            source_message_id INTEGER NOT NULL,
+            progress_chat_id INTEGER,
+            progress_message_id INTEGER,
+            status TEXT DEFAULT 'running',
+            cursor INTEGER DEFAULT 0,
+            total INTEGER DEFAULT 0,
+            sent INTEGER DEFAULT 0,
+            failed INTEGER DEFAULT 0,
+            blocked INTEGER DEFAULT 0,
+            created_by INTEGER,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            finished_at DATETIME
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_orders_account_user ON orders (account_id, user_id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_orders_user_time ON orders (user_id, timestamp)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_orders_time ON orders (timestamp)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_orders_account_time ON orders (account_id, timestamp)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_credentials_account ON credentials (account_id, sold)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_credentials_sold_at ON credentials (sold_at)')
+    c.execute('PRAGMA table_info(orders)')
+    if 'payment_type' not in [column[1] for column in c.fetchall()]:
+        c.execute('ALTER TABLE orders ADD COLUMN payment_type TEXT')
+    
+    # Sales rollups per hour and per day, filled from orders by refresh_sales_rollups()
+    for table in ('sales_rollup_hourly', 'sales_rollup_daily'):
+        c.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                bucket TEXT NOT NULL,
+                account_id INTEGER NOT NULL,
+                payment_type TEXT NOT NULL,
+                orders INTEGER DEFAULT 0,
+                units INTEGER DEFAULT 0,
+                revenue REAL DEFAULT 0,
+                PRIMARY KEY (bucket, account_id, payment_type)
+            )
+        ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS rollup_state (
+            name TEXT PRIMARY KEY,
+            last_order_id INTEGER NOT NULL
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_purchase_queue_account_user ON purchase_queue (account_id, user_id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_purchase_queue_created ON purchase_queue (created_at)')
+    
+    # Create delivery_outbox table (credentials sold but not yet confirmed delivered)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS delivery_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            account_id INTEGER NOT NULL,
+            credential_id INTEGER NOT NULL,
+            order_id INTEGER,
+            kind TEXT NOT NULL,
+            payload TEXT,
+            status TEXT DEFAULT 'pending',
+            attempts INTEGER DEFAULT 0,
+            next_attempt_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            last_error TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            delivered_at DATETIME,
+            FOREIGN KEY (credential_id) REFERENCES credentials (id),
+            FOREIGN KEY (order_id) REFERENCES orders (id)
+        )
+    ''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_delivery_outbox_due ON delivery_outbox (status, next_attempt_at)')
+    
+    # Create media_assets table (Telegram file_id of uploaded static files)
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS media_assets (
+            name TEXT PRIMARY KEY,
+            signature TEXT NOT NULL,
+            file_id TEXT NOT NULL,
+            uploaded_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def _backfill_link_count(c: sqlite3.Cursor, limit: int) -> int:
+    c.execute('SELECT id, links FROM gift_requests WHERE link_count IS NULL LIMIT ?', (limit,))
+    rows = c.fetchall()
+    c.executemany('UPDATE gift_requests SET link_count = ? WHERE id = ?',
+                  [(count_links(links), request_id) for request_id, links in rows])
+    return len(rows)
+
+
+# (version, description, schema change, chunked backfill or None). A backfill gets a cursor
+# and a chunk size and returns how many rows it updated; it is called until that is 0.
+# Append new migrations at the end; never edit or reorder applied ones.
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Cursor], None],
+                       Optional[Callable[[sqlite3.Cursor, int], int]]]] = [
+    (1, 'baseline schema', _baseline, _backfill_link_count),
+]
+
+
+def schema_version() -> int:
+    return MIGRATIONS[-1][0]
+
+
+def apply_migrations(db_file: str) -> List[int]:
+    """Apply pending migrations; return the versions applied.
+
+    When the schema is current this costs a single PRAGMA user_version read.
+    """
+    conn = connect(db_file, isolation_level=None)
+    try:
+        (version,) = conn.execute('PRAGMA user_version').fetchone()
+        if version >= schema_version():
+            return []
+        # Persistent setting that cannot be changed inside a transaction
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS schema_backfills (
+                version INTEGER PRIMARY KEY,
+                rows_done INTEGER DEFAULT 0
+            )
+        ''')
+        applied = []
+        for target, _, apply, backfill in MIGRATIONS:
+            if target <= version:
+                continue
+            c = conn.cursor()
+            c.execute('BEGIN IMMEDIATE')
+            try:
+                # Re-read under the write lock: another process may have migrated meanwhile
+                (version,) = c.execute('PRAGMA user_version').fetchone()
+                if target <= version:
+                    c.execute('ROLLBACK')
+                    continue
+                apply(c)
+                if backfill is not None:
+                    c.execute('INSERT OR IGNORE INTO schema_backfills (version) VALUES (?)', (target,))
+                c.execute(f'PRAGMA user_version = {int(target)}')
+                c.execute('COMMIT')
+            except BaseException:
+                c.execute('ROLLBACK')
+                raise
+            version = target
+            applied.append(target)
+        return applied
+    finally:
+        conn.close()
+
+
+def run_backfills(db_file: str, chunk_size: int = 500, max_chunks: Optional[int] = None) -> bool:
+    """Run up to max_chunks backfill chunks, each in its own transaction; True while work remains"""
+    backfills = {version: backfill for version, _, _, backfill in MIGRATIONS if backfill is not None}
+    conn = connect(db_file, isolation_level=None)
+    try:
+        pending = [row[0] for row in conn.execute('SELECT version FROM schema_backfills ORDER BY version')]
+        chunks = 0
+        for version in pending:
+            done = None
+            while done != 0:
+                if max_chunks is not None and chunks >= max_chunks:
+                    return True
+                c = conn.cursor()
+                c.execute('BEGIN IMMEDIATE')
+                try:
+                    done = backfills[version](c, chunk_size)
+                    if done:
+                        c.execute('UPDATE schema_backfills SET rows_done = rows_done + ? WHERE version = ?',
+                                  (done, version))
+                    else:
+                        c.execute('DELETE FROM schema_backfills WHERE version = ?', (version,))
+                    c.execute('COMMIT')
+                except BaseException:
+                    c.execute('ROLLBACK')
+                    raise
+                chunks += 1
+        return False
+    finally:
+        conn.close()
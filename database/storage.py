@@ -0,0 +1,123 @@
+"""Storage interface shared by the SQLite Database and the in-memory engine.
+
+bot.py and the services only use the methods listed in Storage, so either backend can be
+plugged in; create_storage() picks one by name (STORAGE_BACKEND in the bot's configuration).
+Besides these, both engines provide the _<name>_tx(c, ...) write hooks that
+services.db_writer batches; the in-memory engine ignores the cursor argument.
+"""
+
+from typing import Iterator, List, Optional, Protocol, Tuple, runtime_checkable
+
+from database.database import Database
+from database.memory import MemoryDatabase
+
+BACKENDS = ('sqlite', 'memory')
+
+
+@runtime_checkable
+class Storage(Protocol):
+    # Path of the SQLite file, None for storages that live in this process only
+    db_file: Optional[str]
+    # Where snapshot() writes; None when the storage persists on its own
+    snapshot_path: Optional[str]
+
+    def close(self) -> None: ...
+    def run_backfills(self, chunk_size: int = 500, max_chunks: int = None) -> bool: ...
+    def snapshot(self, path: str = None) -> int: ...
+    # Backend-specific counters for /metrics; 'backend' names the engine
+    def stats(self) -> dict: ...
+    # Writer for the hot-path write commands (services.db_writer)
+    def create_writer(self, max_batch: int = 256): ...
+
+    # Lots and credentials
+    def add_account(self, details: str, price: float) -> int: ...
+    def get_available_accounts(self) -> List[Tuple[int, str, float]]: ...
+    def get_account(self, account_id: int) -> Tuple[int, str, float, bool]: ...
+    def add_credential(self, account_id: int, details: str) -> int: ...
+    def count_available_credentials(self, account_id: int) -> int: ...
+    def pop_next_credential(self, account_id: int, user_id: int) -> Tuple[int, str]: ...
+    def update_account_price(self, account_id: int, new_price: float) -> bool: ...
+    def delete_account(self, account_id: int) -> bool: ...
+    def mark_account_sold(self, account_id: int, user_id: int, price: float,
+                          delivery_kind: str = None, delivery_payload: dict = None,
+                          payment_type: str = None) -> Tuple[bool, str, bool]: ...
+    def get_user_orders_page(self, user_id: int, before_order_id: int = None,
+                             limit: int = 5) -> Tuple[List[Tuple[int, str, float, str, Optional[str]]], bool]: ...
+    def get_lot_statistics(self, account_id: int) -> dict: ...
+    def get_all_lots_statistics(self) -> list: ...
+
+    # Gift requests and the current gift
+    def create_gift_request(self, user_id: int, username: str, links: str) -> int: ...
+    def create_gift_request_with_links(self, user_id: int, username: str, links: str,
+                                       normalized_links: List[Tuple[str, str]]) -> Tuple[Optional[int], List[str]]: ...
+    def get_gift_links(self, request_id: int) -> List[Tuple[int, str, Optional[str], Optional[str], int]]: ...
+    def save_gift_link_checks(self, results: List[Tuple[int, str, str, Optional[str]]]) -> None: ...
+    def get_pending_gift_requests(self) -> List[Tuple]: ...
+    def get_pending_gift_user_ids(self) -> List[int]: ...
+    def get_pending_gift_requests_page(self, after_id: int = None, before_id: int = None,
+                                       limit: int = 10) -> Tuple[List[Tuple[int, str, int]], bool, bool]: ...
+    def count_pending_gift_requests(self) -> int: ...
+    def get_gift_request(self, request_id: int) -> Tuple: ...
+    def process_gift_request(self, request_id: int, status: str, processed_by: int) -> bool: ...
+    def process_gift_requests_bulk(self, status: str, processed_by: int, first_id: int = None,
+                                   last_id: int = None, min_links: int = None,
+                                   max_links: int = None) -> List[Tuple[int, int, str]]: ...
+    def save_gift(self, gift_type: str, content: str, file_id: str = None,
+                  source_chat_id: int = None, source_message_id: int = None) -> int: ...
+    def get_current_gift(self) -> Tuple: ...
+
+    # Purchase queue
+    def add_to_purchase_queue(self, user_id: int, account_id: int, payment_type: str,
+                              price_usdt: float, price_rub: int = None, username: str = None,
+                              invoice_id: str = None, payment_status: str = 'pending') -> int: ...
+    def get_queue_size(self, account_id: int) -> int: ...
+    def get_next_from_queue(self, account_id: int) -> Tuple: ...
+    def mark_queue_entry_fulfilled(self, queue_id: int) -> bool: ...
+    def update_queue_payment_status(self, user_id: int, account_id: int, invoice_id: str, status: str) -> bool: ...
+    def process_queue_for_lot(self, account_id: int) -> List[Tuple]: ...
+
+    # Delivery outbox
+    def claim_due_deliveries(self, limit: int = 50, lease_seconds: int = 60) -> List[dict]: ...
+    def mark_delivery_sent(self, delivery_id: int) -> bool: ...
+    def reschedule_delivery(self, delivery_id: int, error: str, delay_seconds: int) -> bool: ...
+    def mark_delivery_failed(self, delivery_id: int, error: str) -> bool: ...
+    def get_stuck_deliveries(self, older_than_seconds: int = 300, limit: int = 20) -> List[dict]: ...
+    def count_deliveries_by_status(self) -> dict: ...
+    def retry_failed_deliveries(self) -> int: ...
+
+    # Media assets
+    def get_media_file_id(self, name: str, signature: str) -> Optional[str]: ...
+    def save_media_file_id(self, name: str, signature: str, file_id: str) -> None: ...
+    def forget_media_file_id(self, name: str) -> bool: ...
+
+    # Users and broadcasts
+    def upsert_users(self, users: List[Tuple[int, Optional[str], Optional[str], str, str]]) -> None: ...
+    def find_user_id_by_username(self, username: str) -> Optional[int]: ...
+    def count_users(self, active_within_hours: int = 24) -> Tuple[int, int]: ...
+    def create_broadcast(self, segment: str, account_id: Optional[int], source_chat_id: int,
+                         source_message_id: int, created_by: int) -> int: ...
+    def set_broadcast_progress_message(self, job_id: int, chat_id: int, message_id: int) -> None: ...
+    def get_broadcast(self, job_id: int) -> Optional[dict]: ...
+    def get_broadcasts(self, status: str = None, limit: int = 10) -> List[dict]: ...
+    def get_broadcast_recipients(self, job: dict, limit: int) -> List[int]: ...
+    def checkpoint_broadcast(self, job_id: int, cursor: int, sent: int, failed: int,
+                             blocked_user_ids: List[int]) -> None: ...
+    def set_broadcast_status(self, job_id: int, status: str) -> bool: ...
+
+    # Sales rollups, exports and reports
+    def refresh_sales_rollups(self) -> int: ...
+    def get_sales_summary(self, since: str, hourly: bool = False) -> dict: ...
+    def iter_export(self, kind: str, account_id: int = None, date_from: str = None, date_to: str = None,
+                    batch_size: int = 500) -> Iterator[tuple]: ...
+    def iter_lot_report(self, batch_size: int = 500) -> Iterator[tuple]: ...
+    def iter_link_audit(self, batch_size: int = 500) -> Iterator[tuple]: ...
+
+
+def create_storage(backend: str, db_file: str = 'accounts.db', read_pool_size: int = 4,
+                   snapshot_path: str = None) -> Storage:
+    """Open the configured backend: 'sqlite' (db_file) or 'memory' (restored from snapshot_path)"""
+    if backend == 'sqlite':
+        return Database(db_file, read_pool_size=read_pool_size)
+    if backend == 'memory':
+        return MemoryDatabase(snapshot_path)
+    raise ValueError(f"Unknown storage backend: {backend} (expected one of {', '.join(BACKENDS)})")
@@ -0,0 +1,75 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _now() -> str:
+    # Same format as SQLite's CURRENT_TIMESTAMP
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class ActivityTracker:
+    """Buffers user activity in memory and writes it to the users table in batches.
+
+    touch() is called for every update and only updates a dict; run() flushes the buffer
+    every flush_interval seconds with one batched upsert, so a busy chat costs one write
+    per user per interval instead of one per update.
+    """
+
+    def __init__(self, db, flush_interval: float = 5.0):
+        self.db = db
+        self.flush_interval = flush_interval
+        # user id -> (username, first_name, first_seen, last_seen) within the current window
+        self._buffer: Dict[int, tuple] = {}
+        self.touches = 0
+        self.flushes = 0
+        self.flushed_rows = 0
+
+    def touch(self, user) -> None:
+        if user is None:
+            return
+        self.touches += 1
+        now = _now()
+        previous = self._buffer.get(user.id)
+        first_seen = previous[2] if previous else now
+        self._buffer[user.id] = (user.username, user.first_name, first_seen, now)
+
+    def find_user_id(self, username: str) -> Optional[int]:
+        """User id by username (case-insensitive), including not yet flushed activity"""
+        username = username.lstrip('@').lower()
+        for user_id, (buffered_username, _, _, _) in self._buffer.items():
+            if buffered_username and buffered_username.lower() == username:
+                return user_id
+        return self.db.find_user_id_by_username(username)
+
+    def flush(self) -> int:
+        rows, self._buffer = self._buffer, {}
+        if not rows:
+            return 0
+        try:
+            self.db.upsert_users([(user_id,) + row for user_id, row in rows.items()])
+        except Exception as e:
+            logger.error(f"Failed to flush user activity: {e}")
+            # Keep the rows for the next attempt unless newer activity replaced them
+            for user_id, row in rows.items():
+                self._buffer.setdefault(user_id, row)
+            return 0
+        self.flushes += 1
+        self.flushed_rows += len(rows)
+        return len(rows)
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'buffered': len(self._buffer),
+            'touches': self.touches,
+            'flushes': self.flushes,
+            'flushed_rows': self.flushed_rows,
+        }
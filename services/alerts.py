@@ -0,0 +1,112 @@
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ALERT_DEPLETED = 'depleted'
+ALERT_QUEUE_GROWTH = 'queue_growth'
+ALERT_GIFT_REQUEST = 'gift_request'
+ALERT_QUEUE_PROCESSED = 'queue_processed'
+
+# lot id (None for events not tied to a lot) -> kind -> list of event data
+AlertBatch = Dict[Optional[int], Dict[str, List[dict]]]
+
+
+class AlertAggregator:
+    """Collects admin alerts and sends them as one digest per window.
+
+    record() only appends to memory. When the window closes, render_digest(batch) builds a
+    single message for everything collected. Critical events also go out immediately via
+    render_critical, at most once per (kind, lot) per window; repeats within the window of
+    the last immediate one land in the digest.
+    """
+
+    def __init__(self, send: Callable[[str], Awaitable[None]],
+                 render_digest: Callable[[AlertBatch], str],
+                 render_critical: Callable[[str, Optional[int], dict], str],
+                 window: float = 60.0):
+        self.send = send
+        self.render_digest = render_digest
+        self.render_critical = render_critical
+        self.window = window
+        self._batch: AlertBatch = {}
+        # (kind, lot) -> monotonic time of the last immediate alert
+        self._critical_sent: Dict[Tuple[str, Optional[int]], float] = {}
+        self._critical: List[Tuple[str, Optional[int], dict]] = []
+        self._recorded = asyncio.Event()
+        self._critical_ready = asyncio.Event()
+        self.recorded = 0
+        self.digests_sent = 0
+        self.critical_sent = 0
+
+    def record(self, kind: str, account_id: Optional[int] = None, critical: bool = False, **data) -> None:
+        self.recorded += 1
+        self._batch.setdefault(account_id, {}).setdefault(kind, []).append(data)
+        now = time.monotonic()
+        if critical and now - self._critical_sent.get((kind, account_id), float('-inf')) >= self.window:
+            self._critical_sent[(kind, account_id)] = now
+            self._critical.append((kind, account_id, data))
+            # Critical alerts are not delayed until the window closes
+            self._batch[account_id][kind].pop()
+            self._critical_ready.set()
+        self._recorded.set()
+
+    def _has_batch(self) -> bool:
+        return any(events for kinds in self._batch.values() for events in kinds.values())
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._recorded.wait()
+            self._recorded.clear()
+            await self._send_critical()
+            if not self._has_batch():
+                continue
+            deadline = loop.time() + self.window
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(self._critical_ready.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                await self._send_critical()
+            await self.flush()
+
+    async def _send_critical(self) -> None:
+        self._critical_ready.clear()
+        critical, self._critical = self._critical, []
+        for kind, account_id, data in critical:
+            try:
+                await self.send(self.render_critical(kind, account_id, data))
+                self.critical_sent += 1
+            except Exception as e:
+                logger.error(f"Failed to send critical alert: {e}")
+
+    async def flush(self) -> None:
+        """Send pending critical alerts and the digest of everything collected so far"""
+        await self._send_critical()
+        batch = {lot: {kind: events for kind, events in kinds.items() if events}
+                 for lot, kinds in self._batch.items() if any(kinds.values())}
+        self._batch = {}
+        now = time.monotonic()
+        self._critical_sent = {key: sent_at for key, sent_at in self._critical_sent.items()
+                               if now - sent_at < self.window}
+        if not batch:
+            return
+        try:
+            await self.send(self.render_digest(batch))
+            self.digests_sent += 1
+        except Exception as e:
+            logger.error(f"Failed to send alert digest: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'recorded': self.recorded,
+            'pending_lots': len(self._batch),
+            'digests_sent': self.digests_sent,
+            'critical_sent': self.critical_sent,
+        }
@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from telegram.error import Forbidden
+
+from services.dispatcher import OutboundDispatcher, PRIORITY_NOTIFICATION
+
+logger = logging.getLogger(__name__)
+
+
+class BroadcastRunner:
+    """Background worker sending broadcast_jobs to their segments.
+
+    Each job copies the admin's source message to its recipients in batches of
+    batch_size, ordered by user id. After a batch, the job's cursor moves past it and
+    the sent, failed and blocked counters are stored. After a restart, running jobs
+    continue from the cursor, so at most one batch is sent twice. Sends go through the
+    outbound dispatcher at the lowest priority: its global flood limits apply and
+    interactive traffic goes first. Users who blocked the bot are marked blocked and
+    skipped by later broadcasts. on_progress(job) is called at most every
+    progress_interval seconds and once when the job ends.
+    """
+
+    def __init__(self, db, dispatcher: OutboundDispatcher,
+                 on_progress: Optional[Callable[[dict], Awaitable[None]]] = None,
+                 batch_size: int = 50, poll_interval: float = 30.0, progress_interval: float = 5.0):
+        self.db = db
+        self.dispatcher = dispatcher
+        self.on_progress = on_progress
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.progress_interval = progress_interval
+        self._kick = asyncio.Event()
+        self.sent = 0
+        self.batches = 0
+
+    def kick(self) -> None:
+        """Wake the runner right away (called after a job is created)"""
+        self._kick.set()
+
+    async def run(self) -> None:
+        while True:
+            self._kick.clear()
+            try:
+                for job in self.db.get_broadcasts(status='running'):
+                    await self.run_job(job['id'])
+            except Exception as e:
+                logger.error(f"Broadcast runner error: {e}")
+            try:
+                await asyncio.wait_for(self._kick.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run_job(self, job_id: int) -> Optional[dict]:
+        """Send a job until its segment is exhausted or it is cancelled/paused"""
+        last_progress = 0.0
+        while True:
+            job = self.db.get_broadcast(job_id)
+            if job is None or job['status'] != 'running':
+                break
+            recipients = self.db.get_broadcast_recipients(job, self.batch_size)
+            if not recipients:
+                self.db.set_broadcast_status(job_id, 'done')
+                break
+            results = await asyncio.gather(
+                *(self.dispatcher.copy_message(user_id, job['source_chat_id'], job['source_message_id'],
+                                               priority=PRIORITY_NOTIFICATION)
+                  for user_id in recipients),
+                return_exceptions=True
+            )
+            blocked = [user_id for user_id, result in zip(recipients, results) if isinstance(result, Forbidden)]
+            failed = sum(1 for result in results if isinstance(result, Exception))
+            self.db.checkpoint_broadcast(job_id, recipients[-1], len(recipients) - failed, failed - len(blocked), blocked)
+            self.sent += len(recipients) - failed
+            self.batches += 1
+            if self.on_progress and time.monotonic() - last_progress >= self.progress_interval:
+                last_progress = time.monotonic()
+                await self._report(self.db.get_broadcast(job_id))
+
+        job = self.db.get_broadcast(job_id)
+        if job is not None:
+            await self._report(job)
+        return job
+
+    async def _report(self, job: dict) -> None:
+        if not self.on_progress:
+            return
+        try:
+            await self.on_progress(job)
+        except Exception as e:
+            logger.warning(f"Broadcast progress update failed: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'sent': self.sent,
+            'batches': self.batches,
+        }
@@ -0,0 +1,111 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from telegram.ext import BaseUpdateProcessor
+
+
+class KeyedLock:
+    """Registry of asyncio locks by key; a lock is dropped once nobody holds or waits for it"""
+
+    def __init__(self):
+        # key -> [lock, number of holders + waiters]
+        self._locks: Dict[Hashable, List[Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    def waiting(self) -> int:
+        """Number of coroutines queued behind a busy key"""
+        return sum(max(refs - 1, 0) for _, refs in self._locks.values())
+
+    def __call__(self, key: Hashable) -> "_KeyedLockContext":
+        return _KeyedLockContext(self, key)
+
+    async def acquire(self, key: Hashable) -> None:
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            await entry[0].acquire()
+        except BaseException:
+            self._release_ref(key)
+            raise
+
+    def release(self, key: Hashable) -> None:
+        self._locks[key][0].release()
+        self._release_ref(key)
+
+    def _release_ref(self, key: Hashable) -> None:
+        entry = self._locks[key]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._locks[key]
+
+
+class _KeyedLockContext:
+    __slots__ = ('_registry', '_key')
+
+    def __init__(self, registry: KeyedLock, key: Hashable):
+        self._registry = registry
+        self._key = key
+
+    async def __aenter__(self) -> None:
+        await self._registry.acquire(self._key)
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self._registry.release(self._key)
+
+
+class KeyedUpdateProcessor(BaseUpdateProcessor):
+    """Update processor that runs updates concurrently but keeps updates sharing a key in order.
+
+    Updates are first serialized per key (asyncio.Lock wakes waiters in FIFO order, and PTB
+    starts update tasks in arrival order), then run on one of `workers` slots. Queued updates
+    of a busy key therefore do not occupy worker slots. `max_pending` bounds the total number
+    of in-flight updates and should stay well above `workers`.
+    """
+
+    def __init__(self, workers: int, key_func: Callable[[object], Optional[Hashable]],
+                 max_pending: Optional[int] = None):
+        if workers < 1:
+            raise ValueError("workers must be a positive integer")
+        super().__init__(max_pending or workers * 64)
+        self.workers = workers
+        self._key_func = key_func
+        self._keys = KeyedLock()
+        self._slots = asyncio.Semaphore(workers)
+        self.active = 0
+        self.processed = 0
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = self._key_func(update)
+        if key is None:
+            await self._run(coroutine)
+            return
+        async with self._keys(key):
+            await self._run(coroutine)
+
+    async def _run(self, coroutine: Awaitable[Any]) -> None:
+        async with self._slots:
+            self.active += 1
+            try:
+                await coroutine
+            finally:
+                self.active -= 1
+                self.processed += 1
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'workers': self.workers,
+            'active': self.active,
+            'busy_keys': len(self._keys),
+            'waiting': self._keys.waiting(),
+            'processed': self.processed,
+        }
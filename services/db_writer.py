@@ -0,0 +1,244 @@
+import time
+import asyncio
+import logging
+import sqlite3
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from database.connection import connect
+
+logger = logging.getLogger(__name__)
+
+# (tx function, args, kwargs, future of the caller)
+_Command = Tuple[Callable[..., Any], tuple, dict, asyncio.Future]
+
+
+def _is_busy(error: sqlite3.OperationalError) -> bool:
+    """Another connection holds the lock ("database is locked", "database table is locked", ...)"""
+    message = str(error)
+    return 'locked' in message or 'busy' in message
+
+
+class _WriteCommands(ABC):
+    """Hot-path write commands, each queued as the storage's _<name>_tx hook via submit()"""
+
+    @abstractmethod
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> asyncio.Future:
+        """Run fn(cursor, *args, **kwargs); the future resolves with its result once it is stored"""
+
+    @abstractmethod
+    def start(self) -> None: ...
+
+    @abstractmethod
+    async def stop(self, drain_timeout: float = 5.0) -> None: ...
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]: ...
+
+    def add_credential(self, account_id: int, details: str) -> asyncio.Future:
+        return self.submit(self.db._add_credential_tx, account_id, details)
+
+    def create_gift_request_with_links(self, user_id: int, username: str, links: str,
+                                       normalized_links: List[Tuple[str, str]]) -> asyncio.Future:
+        return self.submit(self.db._create_gift_request_with_links_tx, user_id, username, links, normalized_links)
+
+    def add_to_purchase_queue(self, user_id: int, account_id: int, payment_type: str, price_usdt: float,
+                              **kwargs) -> asyncio.Future:
+        return self.submit(self.db._add_to_purchase_queue_tx, user_id, account_id, payment_type,
+                           price_usdt, **kwargs)
+
+    def update_queue_payment_status(self, user_id: int, account_id: int, invoice_id: str,
+                                    status: str) -> asyncio.Future:
+        return self.submit(self.db._update_queue_payment_status_tx, user_id, account_id, invoice_id, status)
+
+    def mark_account_sold(self, account_id: int, user_id: int, price: float, **kwargs) -> asyncio.Future:
+        return self.submit(self.db._mark_account_sold_tx, account_id, user_id, price, **kwargs)
+
+
+class DatabaseWriter(_WriteCommands):
+    """Single owner of the database write connection with group commit.
+
+    Write commands are queued and executed strictly in submission order by one worker
+    thread. Everything queued while the previous transaction was committing goes into the
+    next one, so a burst of writes costs one commit (and one fsync) instead of one each.
+    Every command runs in its own savepoint: a failing command is rolled back alone and its
+    caller gets the exception. Futures resolve only after COMMIT returns.
+
+    SQLite waits up to busy_timeout seconds for a lock held by another connection; if the
+    batch still fails with "database is locked/busy" it is rolled back and run again up to
+    busy_retries times, sleeping busy_backoff seconds and doubling, before its futures fail.
+    """
+
+    def __init__(self, db, max_batch: int = 256, busy_timeout: float = 5.0, busy_retries: int = 5,
+                 busy_backoff: float = 0.05):
+        self.db = db
+        self.max_batch = max_batch
+        self.busy_timeout = busy_timeout
+        self.busy_retries = busy_retries
+        self.busy_backoff = busy_backoff
+        self._queue: List[_Command] = []
+        self._wakeup = asyncio.Event()
+        # One thread, so the connection is only ever used from the thread that opened it
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+        self._conn: Optional[sqlite3.Connection] = None
+        self._task: Optional[asyncio.Task] = None
+        self._committing = False
+        self.writes = 0
+        self.commits = 0
+        self.failed = 0
+        self.largest_batch = 0
+        self.retried = 0
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> asyncio.Future:
+        """Queue fn(cursor, *args, **kwargs); the future resolves with its result after commit"""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((fn, args, kwargs, future))
+        self._wakeup.set()
+        return future
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self, drain_timeout: float = 5.0) -> None:
+        """Commit queued writes within drain_timeout, then stop the worker and close the connection"""
+        deadline = time.monotonic() + drain_timeout
+        while (self._queue or self._committing) and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._queue:
+            logger.warning(f"Database writer stopped with {len(self._queue)} uncommitted writes")
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._close)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            batch = self._queue[:self.max_batch]
+            del self._queue[:self.max_batch]
+            self._committing = True
+            try:
+                results = await loop.run_in_executor(self._executor, self._commit, batch)
+            except Exception as e:
+                logger.error(f"Database writer commit failed: {e}")
+                self.failed += len(batch)
+                for _, _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finally:
+                self._committing = False
+            for (_, _, _, future), (ok, value) in zip(batch, results):
+                if future.done():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    self.failed += 1
+                    future.set_exception(value)
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            # Transactions are managed explicitly below
+            self._conn = connect(self.db.db_file, isolation_level=None, timeout=self.busy_timeout)
+        return self._conn
+
+    def _commit(self, batch: List[_Command]) -> List[Tuple[bool, Any]]:
+        delay = self.busy_backoff
+        for attempt in range(self.busy_retries + 1):
+            try:
+                return self._commit_once(batch)
+            except sqlite3.OperationalError as e:
+                if attempt == self.busy_retries or not _is_busy(e):
+                    raise
+                logger.warning(f"Database busy ({e}), retrying {len(batch)} writes in {delay:.2f}s")
+                self.retried += 1
+                time.sleep(delay)
+                delay *= 2
+
+    def _commit_once(self, batch: List[_Command]) -> List[Tuple[bool, Any]]:
+        conn = self._connection()
+        c = conn.cursor()
+        results = []
+        c.execute('BEGIN IMMEDIATE')
+        try:
+            for fn, args, kwargs, _ in batch:
+                c.execute('SAVEPOINT command')
+                try:
+                    results.append((True, fn(c, *args, **kwargs)))
+                except Exception as e:
+                    c.execute('ROLLBACK TO command')
+                    results.append((False, e))
+                c.execute('RELEASE command')
+            c.execute('COMMIT')
+        except BaseException:
+            # BEGIN IMMEDIATE itself may have failed, leaving nothing to roll back
+            if conn.in_transaction:
+                c.execute('ROLLBACK')
+            raise
+        self.writes += len(batch)
+        self.commits += 1
+        self.largest_batch = max(self.largest_batch, len(batch))
+        return results
+
+    def _close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'queued': len(self._queue),
+            'writes': self.writes,
+            'commits': self.commits,
+            'failed': self.failed,
+            'retried': self.retried,
+            'largest_batch': self.largest_batch,
+            'writes_per_commit': self.writes / self.commits if self.commits else 0.0,
+        }
+
+
+class DirectWriter(_WriteCommands):
+    """DatabaseWriter stand-in for the in-memory storage, which has no transactions to group.
+
+    Commands are applied at once on the calling thread; the returned future is already done.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.writes = 0
+        self.failed = 0
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        try:
+            future.set_result(fn(None, *args, **kwargs))
+            self.writes += 1
+        except Exception as e:
+            self.failed += 1
+            future.set_exception(e)
+        return future
+
+    def start(self) -> None:
+        pass
+
+    async def stop(self, drain_timeout: float = 5.0) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'queued': 0,
+            'writes': self.writes,
+            'commits': self.writes,
+            'failed': self.failed,
+            'retried': 0,
+            'largest_batch': 1 if self.writes else 0,
+            'writes_per_commit': 1.0 if self.writes else 0.0,
+        }
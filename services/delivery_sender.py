@@ -0,0 +1,79 @@
+import asyncio
+import logging
+from typing import Callable
+
+from telegram.error import BadRequest, Forbidden
+
+from services.dispatcher import OutboundDispatcher, PRIORITY_DELIVERY
+
+logger = logging.getLogger(__name__)
+
+
+class DeliverySender:
+    """Background sender draining the delivery_outbox table.
+
+    Sales write an outbox row in the same transaction as the credential; this sender claims
+    due rows in batches, sends them through the outbound dispatcher and marks them delivered.
+    Failed sends are rescheduled with exponential backoff and, after max_attempts, marked
+    failed so they show up in the admin's stuck deliveries view.
+    """
+
+    def __init__(self, db, dispatcher: OutboundDispatcher, render: Callable[[dict], str],
+                 batch_size: int = 50, poll_interval: float = 30.0, base_backoff: float = 5.0,
+                 max_backoff: float = 3600.0, max_attempts: int = 10):
+        self.db = db
+        self.dispatcher = dispatcher
+        self.render = render
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+        self._kick = asyncio.Event()
+        self.delivered = 0
+        self.failed = 0
+
+    def kick(self) -> None:
+        """Wake the sender right away (called after a sale commits)"""
+        self._kick.set()
+
+    async def run(self) -> None:
+        while True:
+            try:
+                while await self.drain_once() == self.batch_size:
+                    pass
+            except Exception as e:
+                logger.error(f"Delivery sender error: {e}")
+            self._kick.clear()
+            try:
+                await asyncio.wait_for(self._kick.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def drain_once(self) -> int:
+        """Send one batch of due deliveries; return how many rows were claimed"""
+        # Claims and status updates take the write lock, so they run off the event loop
+        rows = await asyncio.to_thread(self.db.claim_due_deliveries, self.batch_size)
+        if rows:
+            await asyncio.gather(*(self._deliver(row) for row in rows))
+        return len(rows)
+
+    async def _deliver(self, row: dict) -> None:
+        try:
+            await self.dispatcher.send_message(row['user_id'], self.render(row), priority=PRIORITY_DELIVERY)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if row['attempts'] + 1 >= self.max_attempts:
+                self.failed += 1
+                await asyncio.to_thread(self.db.mark_delivery_failed, row['id'], error)
+                logger.error(f"Delivery #{row['id']} to {row['user_id']} failed permanently: {error}")
+                return
+            delay = min(self.base_backoff * 2 ** row['attempts'], self.max_backoff)
+            if isinstance(e, (Forbidden, BadRequest)):
+                # Blocked bot / deleted chat: no point in retrying soon
+                delay = self.max_backoff
+            await asyncio.to_thread(self.db.reschedule_delivery, row['id'], error, int(delay))
+            logger.warning(f"Delivery #{row['id']} to {row['user_id']} failed, retry in {int(delay)}s: {error}")
+            return
+        self.delivered += 1
+        await asyncio.to_thread(self.db.mark_delivery_sent, row['id'])
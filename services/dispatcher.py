@@ -0,0 +1,343 @@
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from typing import Any, Dict, List, Optional, Tuple
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Priority classes: lower value is sent first
+PRIORITY_DELIVERY = 0       # credentials and gifts the user paid for / was granted
+PRIORITY_INTERACTIVE = 1    # user-facing status messages
+PRIORITY_NOTIFICATION = 2   # admin notifications and alerts
+
+PRIORITY_NAMES = {
+    PRIORITY_DELIVERY: 'delivery',
+    PRIORITY_INTERACTIVE: 'interactive',
+    PRIORITY_NOTIFICATION: 'notification',
+}
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, at most `capacity` stored"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated_at', '_clock')
+
+    def __init__(self, rate: float, capacity: float, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._clock = clock
+        self.updated_at = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def delay(self) -> float:
+        """Seconds until one token is available (0 if available now)"""
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self) -> None:
+        self._refill()
+        self.tokens -= 1
+
+    def is_full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+class _Job:
+    __slots__ = ('priority', 'seq', 'method', 'chat_id', 'kwargs', 'future', 'attempts', 'enqueued_at')
+
+    def __init__(self, priority: int, seq: int, method: str, chat_id: int, kwargs: Dict[str, Any],
+                 future: Optional[asyncio.Future]):
+        self.priority = priority
+        self.seq = seq
+        self.method = method
+        self.chat_id = chat_id
+        self.kwargs = kwargs
+        self.future = future
+        self.attempts = 0
+        self.enqueued_at = time.monotonic()
+
+    def __lt__(self, other: "_Job") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class OutboundDispatcher:
+    """Central outbound queue for Bot API sends honoring Telegram flood limits.
+
+    Jobs are picked by priority class, then FIFO. A global token bucket caps the overall
+    send rate and per-chat buckets cap the rate to a single chat; at most one send per chat
+    is in flight, so messages to one chat keep their order. RetryAfter pauses the chat for
+    the requested time and re-queues the job; network errors are retried with backoff;
+    Forbidden/BadRequest fail the job immediately.
+
+    Each chat has its own queue. Chats that may send now sit on a ready heap keyed by their
+    first job; rate-limited or paused chats sit on a waiting heap keyed by the time they may
+    send again, so picking a job never walks past the backlog of a throttled chat.
+    """
+
+    def __init__(self, global_rate: float = 25.0, per_chat_rate: float = 1.0, per_chat_burst: float = 3.0,
+                 max_in_flight: int = 8, max_retries: int = 5):
+        self.global_bucket = TokenBucket(global_rate, max(global_rate, 1.0))
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self._bot = None
+        self._chat_queues: Dict[int, List[_Job]] = {}
+        # (priority, seq, chat_id) of each ready chat's first job; (ready_at, chat_id) of the rest
+        self._ready: List[Tuple[int, int, int]] = []
+        self._waiting: List[Tuple[float, int]] = []
+        # Chats on one of the heaps -> when they may send; heap entries that disagree are stale
+        self._chat_ready_at: Dict[int, float] = {}
+        self._queued = 0
+        self._seq = itertools.count()
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._chat_paused_until: Dict[int, float] = {}
+        self._chats_in_flight: set = set()
+        self._in_flight: set = set()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.flood_waits = 0
+        self.sent_by_priority = {name: 0 for name in PRIORITY_NAMES.values()}
+        self._latency_total = 0.0
+
+
+    def submit(self, method: str, chat_id: int, priority: int = PRIORITY_INTERACTIVE,
+               wait: bool = True, **kwargs) -> Optional[asyncio.Future]:
+        """Queue a Bot API call; return a future with its result if wait=True"""
+        future = asyncio.get_running_loop().create_future() if wait else None
+        self._enqueue(_Job(priority, next(self._seq), method, int(chat_id), kwargs, future))
+        self._wakeup.set()
+        return future
+
+    async def send_message(self, chat_id: int, text: str, priority: int = PRIORITY_INTERACTIVE,
+                           wait: bool = True, **kwargs):
+        return await self._call('send_message', chat_id, priority, wait, text=text, **kwargs)
+
+    async def send_photo(self, chat_id: int, photo, priority: int = PRIORITY_INTERACTIVE,
+                         wait: bool = True, **kwargs):
+        return await self._call('send_photo', chat_id, priority, wait, photo=photo, **kwargs)
+
+    async def send_document(self, chat_id: int, document, priority: int = PRIORITY_INTERACTIVE,
+                            wait: bool = True, **kwargs):
+        return await self._call('send_document', chat_id, priority, wait, document=document, **kwargs)
+
+    async def send_video(self, chat_id: int, video, priority: int = PRIORITY_INTERACTIVE,
+                         wait: bool = True, **kwargs):
+        return await self._call('send_video', chat_id, priority, wait, video=video, **kwargs)
+
+    async def send_audio(self, chat_id: int, audio, priority: int = PRIORITY_INTERACTIVE,
+                         wait: bool = True, **kwargs):
+        return await self._call('send_audio', chat_id, priority, wait, audio=audio, **kwargs)
+
+    async def copy_message(self, chat_id: int, from_chat_id: int, message_id: int,
+                           priority: int = PRIORITY_INTERACTIVE, wait: bool = True, **kwargs):
+        return await self._call('copy_message', chat_id, priority, wait,
+                                from_chat_id=from_chat_id, message_id=message_id, **kwargs)
+
+    async def edit_message_text(self, chat_id: int, message_id: int, text: str,
+                                priority: int = PRIORITY_INTERACTIVE, wait: bool = True, **kwargs):
+        return await self._call('edit_message_text', chat_id, priority, wait,
+                                message_id=message_id, text=text, **kwargs)
+
+    async def _call(self, method: str, chat_id: int, priority: int, wait: bool, **kwargs):
+        future = self.submit(method, chat_id, priority=priority, wait=wait, **kwargs)
+        if future is not None:
+            return await future
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'queued': self._queued,
+            'in_flight': len(self._in_flight),
+            'sent': self.sent,
+            'failed': self.failed,
+            'retried': self.retried,
+            'flood_waits': self.flood_waits,
+            'sent_by_priority': dict(self.sent_by_priority),
+            'avg_latency_ms': (self._latency_total / self.sent * 1000) if self.sent else 0.0,
+        }
+
+
+    def start(self, bot) -> None:
+        self._bot = bot
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self, drain_timeout: float = 5.0) -> None:
+        """Try to flush queued sends within drain_timeout, then stop the worker"""
+        deadline = time.monotonic() + drain_timeout
+        while (self._queued or self._in_flight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+        if self._queued:
+            logger.warning(f"Outbound dispatcher stopped with {self._queued} unsent messages")
+
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.per_chat_rate, self.per_chat_burst)
+        return bucket
+
+    def _chat_delay(self, chat_id: int, now: float) -> float:
+        if chat_id in self._chats_in_flight:
+            return float('inf')
+        paused = self._chat_paused_until.get(chat_id, 0.0) - now
+        return max(paused, self._chat_bucket(chat_id).delay(), 0.0)
+
+    def _enqueue(self, job: _Job) -> None:
+        """Add a new or re-queued job to its chat's queue and schedule the chat if needed"""
+        queue = self._chat_queues.setdefault(job.chat_id, [])
+        heapq.heappush(queue, job)
+        self._queued += 1
+        if job.chat_id in self._chats_in_flight:
+            # Scheduled again when the send in flight completes
+            return
+        now = time.monotonic()
+        ready_at = self._chat_ready_at.get(job.chat_id)
+        if ready_at is None:
+            self._schedule(job.chat_id, now)
+        elif ready_at <= now and queue[0] is job:
+            # A higher-priority job now leads a ready chat; the older entry goes stale
+            heapq.heappush(self._ready, (job.priority, job.seq, job.chat_id))
+
+    def _schedule(self, chat_id: int, now: float) -> None:
+        """Put a chat with queued jobs on the ready heap, or on the waiting heap until it may send"""
+        delay = self._chat_delay(chat_id, now)
+        self._chat_ready_at[chat_id] = now + delay
+        if delay == 0:
+            head = self._chat_queues[chat_id][0]
+            heapq.heappush(self._ready, (head.priority, head.seq, chat_id))
+        else:
+            heapq.heappush(self._waiting, (now + delay, chat_id))
+
+    def _pick(self) -> Tuple[Optional[_Job], float]:
+        """Pop the best job whose chat may send now; otherwise return the shortest wait"""
+        now = time.monotonic()
+        while self._waiting and self._waiting[0][0] <= now:
+            ready_at, chat_id = heapq.heappop(self._waiting)
+            if self._chat_ready_at.get(chat_id) == ready_at:
+                self._schedule(chat_id, now)
+        while self._ready:
+            _, seq, chat_id = heapq.heappop(self._ready)
+            ready_at = self._chat_ready_at.get(chat_id)
+            if ready_at is None or ready_at > now or self._chat_queues[chat_id][0].seq != seq:
+                continue
+            del self._chat_ready_at[chat_id]
+            queue = self._chat_queues[chat_id]
+            job = heapq.heappop(queue)
+            if not queue:
+                del self._chat_queues[chat_id]
+            self._queued -= 1
+            return job, 0.0
+        return None, self._waiting[0][0] - now if self._waiting else float('inf')
+
+    def _forget_idle_chats(self) -> None:
+        if len(self._chat_buckets) < 10000:
+            return
+        now = time.monotonic()
+        for chat_id in [c for c, b in self._chat_buckets.items() if b.is_full()]:
+            if self._chat_paused_until.get(chat_id, 0) <= now:
+                self._chat_buckets.pop(chat_id, None)
+                self._chat_paused_until.pop(chat_id, None)
+
+    async def _run(self) -> None:
+        while True:
+            if not self._queued or len(self._in_flight) >= self.max_in_flight:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            global_delay = self.global_bucket.delay()
+            if global_delay > 0:
+                await asyncio.sleep(global_delay)
+                continue
+
+            job, wait = self._pick()
+            if job is None:
+                self._wakeup.clear()
+                # A timer instead of wait_for: wait_for swallows a cancel that arrives just
+                # as the event is set, which would keep stop() waiting forever
+                timer = None
+                if wait != float('inf'):
+                    timer = asyncio.get_running_loop().call_later(wait, self._wakeup.set)
+                try:
+                    await self._wakeup.wait()
+                finally:
+                    if timer is not None:
+                        timer.cancel()
+                continue
+
+            self.global_bucket.consume()
+            self._chat_bucket(job.chat_id).consume()
+            self._chats_in_flight.add(job.chat_id)
+            task = asyncio.get_running_loop().create_task(self._send(job))
+            self._in_flight.add(task)
+            task.add_done_callback(self._on_send_done)
+            self._forget_idle_chats()
+
+    async def _send(self, job: _Job) -> None:
+        try:
+            job.attempts += 1
+            result = await getattr(self._bot, job.method)(chat_id=job.chat_id, **job.kwargs)
+        except RetryAfter as e:
+            self.flood_waits += 1
+            self.retried += 1
+            retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, 'total_seconds') else float(e.retry_after)
+            logger.warning(f"Flood wait {retry_after}s for chat {job.chat_id}, re-queueing")
+            self._chat_paused_until[job.chat_id] = time.monotonic() + retry_after
+            self._enqueue(job)
+        except (Forbidden, BadRequest) as e:
+            self._fail(job, e)
+        except NetworkError as e:
+            if job.attempts >= self.max_retries:
+                self._fail(job, e)
+            else:
+                self.retried += 1
+                self._chat_paused_until[job.chat_id] = time.monotonic() + min(2 ** job.attempts, 30)
+                self._enqueue(job)
+        except Exception as e:
+            self._fail(job, e)
+        else:
+            self.sent += 1
+            name = PRIORITY_NAMES.get(job.priority, str(job.priority))
+            self.sent_by_priority[name] = self.sent_by_priority.get(name, 0) + 1
+            self._latency_total += time.monotonic() - job.enqueued_at
+            if job.future is not None and not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self._chats_in_flight.discard(job.chat_id)
+            if job.chat_id in self._chat_queues:
+                self._schedule(job.chat_id, time.monotonic())
+
+    def _on_send_done(self, task: asyncio.Task) -> None:
+        self._in_flight.discard(task)
+        self._wakeup.set()
+
+    def _fail(self, job: _Job, error: Exception) -> None:
+        self.failed += 1
+        if job.future is not None:
+            if not job.future.done():
+                job.future.set_exception(error)
+        else:
+            logger.error(f"Failed to {job.method} to {job.chat_id}: {error}")
@@ -0,0 +1,16 @@
+import csv
+import gzip
+from typing import Iterable
+
+
+def write_csv_gz(rows: Iterable[tuple], path: str) -> int:
+    """Stream rows (header first) into a gzip-compressed CSV file; return the number of data rows.
+
+    Rows are written as they are produced, so memory use does not depend on the export size.
+    """
+    count = -1
+    with gzip.open(path, 'wt', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        for count, row in enumerate(rows):
+            writer.writerow(row)
+    return max(count, 0)
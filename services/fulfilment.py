@@ -0,0 +1,47 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Set
+
+logger = logging.getLogger(__name__)
+
+
+class RefillCoalescer:
+    """Background worker running queue fulfilment for refilled lots.
+
+    signal(account_id) is cheap and returns immediately. The first signal opens a window of
+    `window` seconds; every lot signalled within that window is processed once when it
+    closes, so a burst of fifty added logs results in a single fulfilment pass per lot.
+    """
+
+    def __init__(self, handler: Callable[[int], Awaitable[None]], window: float = 2.0):
+        self.handler = handler
+        self.window = window
+        self._pending: Set[int] = set()
+        self._signalled = asyncio.Event()
+        self.signals = 0
+        self.passes = 0
+
+    def signal(self, account_id: int) -> None:
+        self.signals += 1
+        self._pending.add(account_id)
+        self._signalled.set()
+
+    async def run(self) -> None:
+        while True:
+            await self._signalled.wait()
+            await asyncio.sleep(self.window)
+            self._signalled.clear()
+            lots, self._pending = self._pending, set()
+            for account_id in sorted(lots):
+                self.passes += 1
+                try:
+                    await self.handler(account_id)
+                except Exception as e:
+                    logger.error(f"Queue fulfilment for lot {account_id} failed: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'signals': self.signals,
+            'passes': self.passes,
+            'pending_lots': len(self._pending),
+        }
@@ -0,0 +1,124 @@
+import ssl
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urljoin, urlsplit
+
+import aiohttp
+import certifi
+
+from services.dispatcher import TokenBucket
+from services.state_store import StateStore
+from services.tiktok_links import normalize_tiktok_link
+
+logger = logging.getLogger(__name__)
+
+
+def _is_tiktok_link(url: str) -> bool:
+    return normalize_tiktok_link(url) is not None
+
+
+class LinkVerifier:
+    """Checks submitted links concurrently: format, redirect chain and reachability.
+
+    At most max_concurrency requests run at once and each host gets its own token bucket
+    (per_host_rate requests per second, per_host_burst at once). Redirects are followed
+    by hand so every hop is rate limited. Results are cached by URL for cache_ttl seconds,
+    so a link resubmitted after a rejection is not fetched again.
+
+    check() returns a dict: url, ok, status (last HTTP status or None), final_url, detail.
+    """
+
+    def __init__(self, max_concurrency: int = 5, per_host_rate: float = 2.0, per_host_burst: float = 2.0,
+                 timeout: float = 10.0, max_redirects: int = 5, cache_ttl: float = 3600.0,
+                 validate: Callable[[str], bool] = _is_tiktok_link):
+        self.per_host_rate = per_host_rate
+        self.per_host_burst = per_host_burst
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.max_redirects = max_redirects
+        self.validate = validate
+        self.cache = StateStore('link_checks', max_entries=5000, default_ttl=cache_ttl)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._host_buckets: Dict[str, TokenBucket] = {}
+        self._host_locks: Dict[str, asyncio.Lock] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.requests = 0
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            ssl_context = ssl.create_default_context(cafile=certifi.where())
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(ssl=ssl_context),
+                timeout=self.timeout,
+                headers={'User-Agent': 'Mozilla/5.0 (compatible; link-check)'}
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _wait_for_host(self, host: str) -> None:
+        bucket = self._host_buckets.setdefault(host, TokenBucket(self.per_host_rate, self.per_host_burst))
+        async with self._host_locks.setdefault(host, asyncio.Lock()):
+            delay = bucket.delay()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            bucket.consume()
+
+    async def check(self, url: str) -> dict:
+        url = url.strip()
+        cached = self.cache.get(url)
+        if cached is not None:
+            return cached
+        if not self.validate(url):
+            return {'url': url, 'ok': False, 'status': None, 'final_url': None, 'detail': 'неверный формат'}
+
+        target = url if '://' in url else 'https://' + url
+        async with self._semaphore:
+            result = await self._fetch(url, target)
+        # Network errors are transient; only cache answers from the server
+        if result['status'] is not None:
+            self.cache.set(url, result)
+        return result
+
+    async def _fetch(self, url: str, target: str) -> dict:
+        session = self._get_session()
+        status = None
+        try:
+            for _ in range(self.max_redirects + 1):
+                await self._wait_for_host(urlsplit(target).hostname or '')
+                self.requests += 1
+                async with session.get(target, allow_redirects=False) as response:
+                    status = response.status
+                    location = response.headers.get('Location')
+                if status in (301, 302, 303, 307, 308) and location:
+                    target = urljoin(target, location)
+                    continue
+                break
+            else:
+                return {'url': url, 'ok': False, 'status': status, 'final_url': target,
+                        'detail': 'слишком много перенаправлений'}
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            return {'url': url, 'ok': False, 'status': None, 'final_url': target,
+                    'detail': f"недоступна: {type(e).__name__}"}
+
+        if status >= 400:
+            return {'url': url, 'ok': False, 'status': status, 'final_url': target, 'detail': f"HTTP {status}"}
+        if urlsplit(target).path.strip('/') == '':
+            # Removed videos and broken short links redirect to the home page
+            return {'url': url, 'ok': False, 'status': status, 'final_url': target,
+                    'detail': 'перенаправляет на главную'}
+        return {'url': url, 'ok': True, 'status': status, 'final_url': target, 'detail': 'ok'}
+
+    async def check_many(self, urls: List[str]) -> List[dict]:
+        return await asyncio.gather(*(self.check(url) for url in urls))
+
+    def stats(self) -> Dict[str, int]:
+        cache = self.cache.stats()
+        return {
+            'requests': self.requests,
+            'cache_hits': cache['hits'],
+            'cached': cache['size'],
+        }
@@ -0,0 +1,94 @@
+import asyncio
+import hashlib
+import logging
+import os
+from typing import Dict, Optional
+
+from telegram.error import BadRequest
+
+from services.dispatcher import OutboundDispatcher, PRIORITY_INTERACTIVE
+
+logger = logging.getLogger(__name__)
+
+
+class MediaRegistry:
+    """Sends static files from a directory by their cached Telegram file_id.
+
+    The first send of an asset uploads its bytes and stores the returned file_id in the
+    media_assets table (keyed by file name, with a hash of the content as a signature, so
+    an edited file is uploaded again but a fresh checkout or deploy is not). The hash is
+    computed once per process. Later sends reuse the id; if Telegram rejects it the cached
+    id is dropped and the file is uploaded once more.
+    """
+
+    def __init__(self, db, dispatcher: OutboundDispatcher, base_dir: str):
+        self.db = db
+        self.dispatcher = dispatcher
+        self.base_dir = base_dir
+        self._file_ids: Dict[str, str] = {}
+        self._upload_locks: Dict[str, asyncio.Lock] = {}
+        self._signatures: Dict[str, str] = {}
+        self.uploads = 0
+        self.cached_sends = 0
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.base_dir, name)
+
+    def exists(self, name: str) -> bool:
+        return os.path.exists(self.path(name))
+
+    def _signature(self, name: str) -> str:
+        if name not in self._signatures:
+            with open(self.path(name), 'rb') as f:
+                self._signatures[name] = hashlib.sha256(f.read()).hexdigest()
+        return self._signatures[name]
+
+    def _cached_file_id(self, name: str, signature: str) -> Optional[str]:
+        key = f"{name}@{signature}"
+        if key not in self._file_ids:
+            file_id = self.db.get_media_file_id(name, signature)
+            if file_id is None:
+                return None
+            self._file_ids[key] = file_id
+        return self._file_ids[key]
+
+    def _forget(self, name: str, signature: str) -> None:
+        self._file_ids.pop(f"{name}@{signature}", None)
+        self.db.forget_media_file_id(name)
+
+    async def send_photo(self, chat_id: int, name: str, priority: int = PRIORITY_INTERACTIVE, **kwargs):
+        """Send pic `name` to chat_id; raises FileNotFoundError if the file is missing"""
+        signature = self._signature(name)
+        file_id = self._cached_file_id(name, signature)
+        if file_id is not None:
+            try:
+                message = await self.dispatcher.send_photo(chat_id, file_id, priority=priority, **kwargs)
+                self.cached_sends += 1
+                return message
+            except BadRequest as e:
+                logger.warning(f"Cached file_id for {name} rejected, uploading again: {e}")
+                self._forget(name, signature)
+
+        # Concurrent first sends of the same asset upload it only once
+        lock = self._upload_locks.setdefault(name, asyncio.Lock())
+        async with lock:
+            file_id = self._cached_file_id(name, signature)
+            if file_id is not None:
+                self.cached_sends += 1
+                return await self.dispatcher.send_photo(chat_id, file_id, priority=priority, **kwargs)
+            with open(self.path(name), 'rb') as f:
+                data = f.read()
+            message = await self.dispatcher.send_photo(chat_id, data, priority=priority, **kwargs)
+            self.uploads += 1
+            if message is not None and message.photo:
+                file_id = message.photo[-1].file_id
+                self._file_ids[f"{name}@{signature}"] = file_id
+                self.db.save_media_file_id(name, signature, file_id)
+            return message
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'assets': len(self._file_ids),
+            'uploads': self.uploads,
+            'cached_sends': self.cached_sends,
+        }
@@ -0,0 +1,203 @@
+import asyncio
+import multiprocessing
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Optional
+
+from database.connection import is_memory_uri
+from database.database import Database
+from services.export import write_csv_gz
+
+# Seconds between checks of the cancel flag (each check is a round trip to the manager process)
+_CANCEL_POLL_INTERVAL = 0.5
+
+# Rows written between cancel/deadline checks when a report runs on a thread
+_CANCEL_CHECK_ROWS = 1000
+
+# Workers start from a clean interpreter rather than a fork of the bot, which would copy
+# its event loop, open connections and threads (forkserver is POSIX-only). The fork server
+# imports the bot's main module once; main() itself is behind the __name__ guard.
+_MP_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+class ReportCancelled(Exception):
+    """The report was cancelled by an admin or ran past its deadline"""
+
+
+def _report_rows(db, name: str, params: dict):
+    if name == 'export':
+        return db.iter_export(**params)
+    if name == 'lots':
+        return db.iter_lot_report()
+    if name == 'links':
+        return db.iter_link_audit()
+    raise ValueError(f"Unknown report: {name}")
+
+
+def run_report(db_file: str, name: str, out_path: str, params: dict, deadline: float, cancel) -> int:
+    """Build a report into out_path as gzip CSV; runs in a worker process.
+
+    The database is opened read-only. SQLite polls the interrupt hook while the query runs,
+    so both the deadline (wall clock) and the cancel event stop the job mid-query.
+    """
+    db = Database(db_file, read_only=True)
+    state = {'polled': 0.0, 'reason': None}
+
+    def interrupt() -> bool:
+        now = time.time()
+        if now > deadline:
+            state['reason'] = 'timeout'
+        elif now - state['polled'] >= _CANCEL_POLL_INTERVAL:
+            state['polled'] = now
+            if cancel.is_set():
+                state['reason'] = 'cancelled'
+        return state['reason'] is not None
+
+    db.interrupt = interrupt
+    try:
+        return write_csv_gz(_report_rows(db, name, params), out_path)
+    except sqlite3.OperationalError:
+        if state['reason']:
+            raise ReportCancelled(state['reason'])
+        raise
+
+
+def write_report_rows(storage, name: str, out_path: str, params: dict, deadline: float, cancel) -> int:
+    """Build a report from an in-process storage as gzip CSV; runs on a worker thread.
+
+    The rows are read on the thread too, so a large in-memory copy does not hold up the
+    event loop. The deadline and cancel flag are checked every _CANCEL_CHECK_ROWS rows.
+    """
+    def checked():
+        for count, row in enumerate(_report_rows(storage, name, params)):
+            if count % _CANCEL_CHECK_ROWS == 0:
+                if time.time() > deadline:
+                    raise ReportCancelled('timeout')
+                if cancel.is_set():
+                    raise ReportCancelled('cancelled')
+            yield row
+    return write_csv_gz(checked(), out_path)
+
+
+class ReportRunner:
+    """Runs heavy admin reports in a process pool so the bot's event loop stays responsive.
+
+    Every job gets a deadline and a cancel event shared with the worker. Workers and the
+    manager process backing the events are started on the first report. A storage that
+    lives in this process (the in-memory engine, or a shared in-memory SQLite URI) cannot be
+    opened from another one: its reports run on a thread pool instead, which reads the rows
+    and writes the file.
+    """
+
+    def __init__(self, db_file: Optional[str], max_workers: int = 1, timeout: float = 300.0,
+                 storage=None):
+        self._threaded = db_file is None or is_memory_uri(db_file)
+        if self._threaded and storage is None:
+            raise ValueError("Reports on an in-process storage need the storage object")
+        self.db_file = db_file
+        self.storage = storage
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._manager = None
+        self._jobs: Dict[int, dict] = {}
+        self._next_id = 1
+        self.completed = 0
+        self.cancelled = 0
+        self.failed = 0
+
+    def _start(self) -> None:
+        if self._pool is None and self._threaded:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='report')
+        elif self._pool is None:
+            context = multiprocessing.get_context(_MP_START_METHOD)
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+            self._manager = context.Manager()
+
+    def submit(self, name: str, out_path: str, **params) -> int:
+        """Queue a report; returns the job id to pass to wait() and cancel()"""
+        self._start()
+        job_id = self._next_id
+        self._next_id += 1
+        deadline = time.time() + self.timeout
+        if self._threaded:
+            cancel = threading.Event()
+            future = self._pool.submit(write_report_rows, self.storage, name, out_path, params, deadline, cancel)
+        else:
+            cancel = self._manager.Event()
+            future = self._pool.submit(run_report, self.db_file, name, out_path, params, deadline, cancel)
+        self._jobs[job_id] = {
+            'id': job_id,
+            'name': name,
+            'started': time.time(),
+            'deadline': deadline,
+            'cancel': cancel,
+            'pool_future': future,
+            'future': asyncio.wrap_future(future),
+        }
+        return job_id
+
+    async def wait(self, job_id: int) -> int:
+        """Wait for a job; returns the number of rows or raises ReportCancelled"""
+        job = self._jobs[job_id]
+        try:
+            # The worker enforces the deadline itself; the grace period covers a stuck worker
+            remaining = job['deadline'] - time.time() + 10
+            rows = await asyncio.wait_for(asyncio.shield(job['future']), max(remaining, 0))
+        except asyncio.TimeoutError:
+            job['cancel'].set()
+            self.cancelled += 1
+            raise ReportCancelled('timeout')
+        except ReportCancelled:
+            self.cancelled += 1
+            raise
+        except asyncio.CancelledError:
+            if job['future'].cancelled():
+                # Cancelled while still queued in the pool
+                self.cancelled += 1
+                raise ReportCancelled('cancelled')
+            job['cancel'].set()
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self._jobs.pop(job_id, None)
+        self.completed += 1
+        return rows
+
+    async def run(self, name: str, out_path: str, **params) -> int:
+        return await self.wait(self.submit(name, out_path, **params))
+
+    def cancel(self, job_id: int) -> bool:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return False
+        if not job['pool_future'].cancel():
+            # Already running: the worker notices the flag on its next poll
+            job['cancel'].set()
+        return True
+
+    def jobs(self) -> list:
+        return [{'id': job['id'], 'name': job['name'], 'started': job['started']}
+                for job in self._jobs.values()]
+
+    def close(self) -> None:
+        for job in list(self._jobs.values()):
+            job['cancel'].set()
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            if self._manager is not None:
+                self._manager.shutdown()
+            self._pool = None
+            self._manager = None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'running': len(self._jobs),
+            'completed': self.completed,
+            'cancelled': self.cancelled,
+            'failed': self.failed,
+        }
@@ -0,0 +1,175 @@
+import sys
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+def _approx_size(value: Any) -> int:
+    """Rough memory footprint of a stored value (one level deep for containers)"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for k, v in value.items():
+            size += sys.getsizeof(k) + sys.getsizeof(v)
+    elif isinstance(value, (list, tuple, set)):
+        for item in value:
+            size += sys.getsizeof(item)
+    return size
+
+
+class StateStore:
+    """In-memory key/value store for ephemeral state with per-entry TTL and an LRU capacity limit.
+
+    Entries expire lazily on access and eagerly on sweep(); once max_entries is reached
+    the least recently used entry is evicted. stats() reports size and eviction counters.
+    """
+
+    def __init__(self, name: str, max_entries: int = 10000, default_ttl: Optional[float] = 3600.0,
+                 clock: Callable[[], float] = time.monotonic):
+        if max_entries < 1:
+            raise ValueError("max_entries must be a positive integer")
+        self.name = name
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._clock = clock
+        # key -> (value, expires_at, approx_bytes); order = least recently used first
+        self._entries: "OrderedDict[Hashable, Tuple[Any, Optional[float], int]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self._lookup(key, touch=False) is not _MISSING
+
+    def _drop(self, key: Hashable) -> Any:
+        value, _, size = self._entries.pop(key)
+        self._bytes -= size
+        return value
+
+    def _lookup(self, key: Hashable, touch: bool = True) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        value, expires_at, _ = entry
+        if expires_at is not None and expires_at <= self._clock():
+            self._drop(key)
+            self.expired += 1
+            return _MISSING
+        if touch:
+            self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = _MISSING) -> None:
+        """Store a value; ttl=None keeps it until evicted, omitted uses default_ttl"""
+        if ttl is _MISSING:
+            ttl = self.default_ttl
+        if key in self._entries:
+            self._drop(key)
+        expires_at = self._clock() + ttl if ttl is not None else None
+        size = _approx_size(key) + _approx_size(value)
+        self._entries[key] = (value, expires_at, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evicted += 1
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        value = self._lookup(key)
+        if value is _MISSING:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        if self._lookup(key, touch=False) is _MISSING:
+            return default
+        return self._drop(key)
+
+    def items(self, prefix: Optional[str] = None) -> List[Tuple[Hashable, Any]]:
+        """Snapshot of live entries, optionally limited to string keys starting with prefix"""
+        now = self._clock()
+        result = []
+        for key, (value, expires_at, _) in self._entries.items():
+            if expires_at is not None and expires_at <= now:
+                continue
+            if prefix is not None and not (isinstance(key, str) and key.startswith(prefix)):
+                continue
+            result.append((key, value))
+        return result
+
+    def sweep(self) -> int:
+        """Remove all expired entries; return how many were removed"""
+        now = self._clock()
+        stale = [key for key, (_, expires_at, _) in self._entries.items()
+                 if expires_at is not None and expires_at <= now]
+        for key in stale:
+            self._drop(key)
+        self.expired += len(stale)
+        return len(stale)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'size': len(self._entries),
+            'max_entries': self.max_entries,
+            'approx_bytes': self._bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'expired': self.expired,
+            'evicted': self.evicted,
+        }
+
+    def scope(self, owner: Hashable) -> "ScopedState":
+        return ScopedState(self, owner)
+
+    async def run_sweeper(self, interval: float) -> None:
+        """Periodically sweep expired entries until cancelled"""
+        while True:
+            await asyncio.sleep(interval)
+            removed = self.sweep()
+            if removed:
+                logger.info(f"StateStore[{self.name}] swept {removed} expired entries, size={len(self)}")
+
+
+class ScopedState:
+    """Dict-like view over a StateStore restricted to one owner (e.g. a Telegram user id)"""
+
+    __slots__ = ('_store', '_owner')
+
+    def __init__(self, store: StateStore, owner: Hashable):
+        self._store = store
+        self._owner = owner
+
+    def get(self, name: str, default: Any = None) -> Any:
+        return self._store.get((self._owner, name), default)
+
+    def pop(self, name: str, default: Any = None) -> Any:
+        return self._store.pop((self._owner, name), default)
+
+    def __getitem__(self, name: str) -> Any:
+        value = self._store.get((self._owner, name), _MISSING)
+        if value is _MISSING:
+            raise KeyError(name)
+        return value
+
+    def __setitem__(self, name: str, value: Any) -> None:
+        self._store.set((self._owner, name), value)
+
+    def __contains__(self, name: str) -> bool:
+        return (self._owner, name) in self._store
@@ -0,0 +1,68 @@
+import hashlib
+import re
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+# Short share links: vm.tiktok.com/CODE, vt.tiktok.com/CODE, tiktok.com/t/CODE
+_SHORT_HOSTS = {'vm.tiktok.com', 'vt.tiktok.com'}
+_SHORT_CODE = re.compile(r'^[A-Za-z0-9_-]+$')
+
+# Query parameters that identify a comment; everything else is tracking noise
+_KEPT_PARAMS = ('comment_id', 'cid')
+
+# A URL anywhere in a line ("1) https://...", "link: tiktok.com/..."): optional scheme,
+# a dotted host and the rest up to whitespace; not inside a longer URL or an e-mail
+_URL = re.compile(r'(?<![\w.@/:=?&%-])(?:https?://)?(?:[a-z0-9-]+\.)+[a-z]{2,}(?::\d+)?(?:[/?#]\S*)?', re.IGNORECASE)
+# Punctuation that ends a sentence or wraps a link rather than belonging to it
+_TRAILING = '.,;:!?)]}>»"\''
+
+
+def extract_tiktok_link(text: str) -> Optional[str]:
+    """First TikTok URL in a line of user text, as written, or None"""
+    for match in _URL.finditer(text):
+        url = match.group(0).rstrip(_TRAILING)
+        if _normalize(url):
+            return url
+    return None
+
+
+def normalize_tiktok_link(link: str) -> Optional[str]:
+    """Canonical form of the TikTok link in a line of text, or None if there is none.
+
+    The URL is picked out of the line first, so numbering and labels around it are ignored.
+    Host and long paths are lowercased, www./m. prefixes, fragments, trailing slashes
+    and tracking parameters are dropped, and all short-link forms map to tiktok.com/t/CODE.
+    Short codes keep their case since TikTok treats them as case-sensitive.
+    """
+    link = extract_tiktok_link(link)
+    return _normalize(link) if link else None
+
+
+def _normalize(link: str) -> Optional[str]:
+    if '://' not in link:
+        link = 'https://' + link
+    parts = urlsplit(link)
+    host = (parts.hostname or '').lower()
+    for prefix in ('www.', 'm.'):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    if host != 'tiktok.com' and not host.endswith('.tiktok.com'):
+        return None
+
+    segments = [segment for segment in parts.path.split('/') if segment]
+    if host in _SHORT_HOSTS and len(segments) == 1 and _SHORT_CODE.match(segments[0]):
+        return f"tiktok.com/t/{segments[0]}"
+    if host == 'tiktok.com' and len(segments) == 2 and segments[0] == 't' and _SHORT_CODE.match(segments[1]):
+        return f"tiktok.com/t/{segments[1]}"
+    if not segments:
+        return None
+
+    path = '/'.join(segments).lower()
+    params = sorted((key, value) for key, value in parse_qsl(parts.query) if key in _KEPT_PARAMS)
+    query = f"?{urlencode(params)}" if params else ''
+    return f"{host}/{path}{query}"
+
+
+def link_hash(normalized: str) -> str:
+    """Stable key of a normalized link for the unique gift_links index"""
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
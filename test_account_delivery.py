@@ -8,7 +8,7 @@ import sys
 import os
 sys.path.append('.')
 
-from database.database import Database
+from database.fixtures import memory_database
 
 def test_account_delivery():
     """Тестируем систему выдачи аккаунтов"""
@@ -16,8 +16,8 @@ def test_account_delivery():
     print("🧪 ТЕСТ СИСТЕМЫ ВЫДАЧИ АККАУНТОВ")
     print("=" * 50)
     
-    # Создаем тестовую базу данных
-    db = Database('test_accounts.db')
+    # Тестовая база в памяти: без файлов и fsync на каждый commit
+    db = memory_database()
     
     # 1. Создаем тестовый лот
     print("\n1️⃣ Создание тестового лота...")
@@ -73,7 +73,7 @@ def test_account_delivery():
             break
             
         # Выдаем лог
-        success, delivered_details = db.mark_account_sold(account_id, user_id, 10.0)
+        success, delivered_details, _ = db.mark_account_sold(account_id, user_id, 10.0)
         
         if success:
             print(f"      ✅ Лог выдан: {delivered_details}")
@@ -120,7 +120,7 @@ def test_account_delivery():
     # 9. Попытка купить когда нет логов
     if remaining == 0:
         print("\n9️⃣ Тест: покупка когда логи закончились:")
-        success, details = db.mark_account_sold(account_id, 99999, 10.0)
+        success, details, _ = db.mark_account_sold(account_id, 99999, 10.0)
         if not success:
             print("   ✅ Система корректно отклонила покупку - логи закончились")
         else:
@@ -137,12 +137,9 @@ def test_account_delivery():
     else:
         print("❌ НАЙДЕНЫ ПРОБЛЕМЫ В СИСТЕМЕ!")
     
-    print("\n🗑️ Удаляем тестовую базу данных...")
-    try:
-        os.remove('test_accounts.db')
-        print("✅ Тестовая база данных удалена")
-    except:
-        pass
+    db.close()
+    assert len(delivered_logs) == len(test_logs) and len(unique_logs) == len(delivered_logs)
+    assert remaining == 0 and not success
 
 if __name__ == "__main__":
     test_account_delivery()
\ No newline at end of file
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки учёта пользователей с записью пачками.
+"""
+
+import os
+import sys
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.database import Database
+from services.activity import ActivityTracker
+
+
+def test_activity_tracker():
+    db_file = 'test_activity.db'
+    db = Database(db_file)
+    try:
+        print("🧪 Тестирование учёта пользователей...")
+        tracker = ActivityTracker(db)
+
+        alice = SimpleNamespace(id=1, username="Alice_Buyer", first_name="Alice")
+        bob = SimpleNamespace(id=2, username=None, first_name="Bob")
+
+        # 1. Сотня обновлений — только запись в память
+        for _ in range(100):
+            tracker.touch(alice)
+        tracker.touch(bob)
+        assert db.count_users() == (0, 0)
+        assert tracker.find_user_id("@alice_buyer") == 1
+        print("✅ Активность копится в памяти и уже доступна для поиска")
+
+        # 2. Одна пачка — по строке на пользователя
+        assert tracker.flush() == 2
+        assert db.count_users() == (2, 2)
+        assert db.find_user_id_by_username("ALICE_BUYER") == 1
+        print("✅ Запись пачкой в таблицу users")
+
+        # 3. Смена username обновляет запись
+        tracker.touch(SimpleNamespace(id=1, username="alice_new", first_name="Alice"))
+        tracker.flush()
+        assert db.find_user_id_by_username("alice_buyer") is None
+        assert db.find_user_id_by_username("alice_new") == 1
+        assert db.count_users() == (2, 2)
+        print("✅ Повторная запись обновляет пользователя")
+
+        print("\n✅ Тест учёта пользователей завершен!")
+    finally:
+        db.close()
+        os.remove(db_file)
+
+
+if __name__ == "__main__":
+    test_activity_tracker()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки сводок уведомлений админу.
+"""
+
+import os
+import sys
+import asyncio
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.alerts import (
+    AlertAggregator, ALERT_DEPLETED, ALERT_QUEUE_GROWTH, ALERT_GIFT_REQUEST
+)
+
+
+async def run_burst():
+    sent = []
+
+    async def send(text):
+        sent.append(text)
+
+    def render_digest(batch):
+        return "digest " + ", ".join(
+            f"{lot}:{kind}x{len(events)}"
+            for lot, kinds in sorted(batch.items(), key=lambda item: str(item[0]))
+            for kind, events in sorted(kinds.items())
+        )
+
+    alerts = AlertAggregator(send, render_digest, lambda kind, lot, data: f"critical {kind} {lot}", window=0.1)
+    task = asyncio.create_task(alerts.run())
+
+    # Лот 1 закончился, пять оплативших встали в очередь, пришло три заявки на подарок
+    alerts.record(ALERT_DEPLETED, 1)
+    for _ in range(5):
+        alerts.record(ALERT_QUEUE_GROWTH, 1, critical=True)
+    for request_id in range(3):
+        alerts.record(ALERT_GIFT_REQUEST, None, request_id=request_id, username="user", links=1)
+    await asyncio.sleep(0.2)
+
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    return sent, alerts.stats()
+
+
+def test_alerts_are_aggregated():
+    print("🧪 Тестирование сводок уведомлений...")
+    sent, stats = asyncio.run(run_burst())
+    for text in sent:
+        print(f"📨 {text}")
+    assert sent == [
+        "critical queue_growth 1",
+        "digest 1:depletedx1, 1:queue_growthx4, None:gift_requestx3",
+    ]
+    assert stats['recorded'] == 9 and stats['digests_sent'] == 1 and stats['critical_sent'] == 1
+    print("✅ 9 событий → одно срочное уведомление и одна сводка")
+
+
+async def run_repeated_critical():
+    sent = []
+
+    async def send(text):
+        sent.append(text)
+
+    alerts = AlertAggregator(send, lambda batch: "digest", lambda kind, lot, data: f"critical {kind} {lot}",
+                             window=0.1)
+    task = asyncio.create_task(alerts.run())
+    # Срочное событие без сводки, затем повтор уже после окна
+    alerts.record(ALERT_QUEUE_GROWTH, 1, critical=True)
+    await asyncio.sleep(0.15)
+    alerts.record(ALERT_QUEUE_GROWTH, 1, critical=True)
+    await asyncio.sleep(0.01)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    return sent
+
+
+def test_critical_alert_repeats_after_window():
+    print("🧪 Повтор срочного уведомления после окна...")
+    sent = asyncio.run(run_repeated_critical())
+    assert sent == ["critical queue_growth 1", "critical queue_growth 1"]
+    print("✅ Второе срочное уведомление ушло сразу, без ожидания сводки")
+
+
+def test_digest_escapes_markdown():
+    print("🧪 Экранирование Markdown в сводке...")
+    # Бот с хранилищем в памяти без снимков: импорт не трогает файлы на диске
+    os.environ['STORAGE_BACKEND'] = 'memory'
+    os.environ['STORAGE_SNAPSHOT_PATH'] = ''
+    import bot
+
+    account_id = bot.db.add_account("VEO3_pro *промо*", 5.0)
+    text = bot.render_alert_digest({
+        account_id: {ALERT_DEPLETED: [{}]},
+        None: {ALERT_GIFT_REQUEST: [{'request_id': 1, 'username': 'john_doe', 'links': 2}]},
+    })
+    print(text)
+    assert "@john\\_doe" in text
+    assert "VEO3\\_pro \\*промо\\*" in text
+    assert "\\_" in bot.render_critical_alert(ALERT_DEPLETED, account_id, {})
+    print("✅ Имена с _ и * не ломают разметку")
+
+
+if __name__ == "__main__":
+    test_alerts_are_aggregated()
+    test_critical_alert_repeats_after_window()
+    test_digest_escapes_markdown()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки возобновляемых рассылок.
+"""
+
+import os
+import sys
+import asyncio
+from collections import Counter
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from telegram.error import Forbidden
+
+from database.database import Database
+from services.activity import ActivityTracker
+from services.broadcast import BroadcastRunner
+
+
+class FakeDispatcher:
+    def __init__(self, blocked=()):
+        self.received = Counter()
+        self.blocked = set(blocked)
+
+    async def copy_message(self, chat_id, from_chat_id, message_id, **kwargs):
+        if chat_id in self.blocked:
+            raise Forbidden("bot was blocked by the user")
+        self.received[chat_id] += 1
+
+
+def test_broadcast_resume():
+    db_file = 'test_broadcast.db'
+    db = Database(db_file)
+    try:
+        print("🧪 Тестирование рассылки...")
+        tracker = ActivityTracker(db)
+        for user_id in range(1, 121):
+            tracker.touch(SimpleNamespace(id=user_id, username=f"user{user_id}", first_name="U"))
+        tracker.flush()
+
+        job_id = db.create_broadcast('all', None, 999, 1, 999)
+        assert db.get_broadcast(job_id)['total'] == 120
+
+        # 1. Первый запуск "падает" после двух пачек
+        dispatcher = FakeDispatcher(blocked={5, 77})
+        progress = []
+
+        async def stop_after_two_batches(job):
+            progress.append(job['sent'])
+            if len(progress) == 2:
+                db.set_broadcast_status(job_id, 'paused')
+
+        runner = BroadcastRunner(db, dispatcher, on_progress=stop_after_two_batches,
+                                 batch_size=25, progress_interval=0)
+        job = asyncio.run(runner.run_job(job_id))
+        assert job['status'] == 'paused' and job['cursor'] == 50
+        assert job['sent'] == 49 and job['blocked'] == 1
+        print("✅ Прогресс сохраняется после каждой пачки")
+
+        # 2. После "перезапуска" рассылка продолжается с курсора
+        db.set_broadcast_status(job_id, 'running')
+        runner = BroadcastRunner(db, dispatcher, batch_size=25)
+        job = asyncio.run(runner.run_job(job_id))
+        assert job['status'] == 'done'
+        assert job['sent'] == 118 and job['blocked'] == 2 and job['failed'] == 0
+        assert set(dispatcher.received.values()) == {1} and len(dispatcher.received) == 118
+        print("✅ Каждый пользователь получил сообщение ровно один раз")
+
+        # 3. Заблокировавшие бота исключаются из следующих рассылок
+        job_id = db.create_broadcast('all', None, 999, 2, 999)
+        assert db.get_broadcast(job_id)['total'] == 118
+        print("✅ Заблокировавшие бота исключены")
+
+        print("\n✅ Тест рассылки завершен!")
+    finally:
+        db.close()
+        os.remove(db_file)
+
+
+if __name__ == "__main__":
+    test_broadcast_resume()
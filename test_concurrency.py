@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест параллельной обработки обновлений.
+
+Проверяет, что KeyedUpdateProcessor обрабатывает обновления разных пользователей
+параллельно (быстрее последовательной обработки), не превышает число воркеров
+и сохраняет порядок обновлений каждого пользователя.
+"""
+
+import os
+import sys
+import time
+import asyncio
+import random
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.concurrency import KeyedUpdateProcessor
+
+USERS = 20
+UPDATES_PER_USER = 10
+HANDLER_DELAY = 0.01
+WORKERS = 8
+
+
+async def run_load(processor: KeyedUpdateProcessor):
+    processed = {user_id: [] for user_id in range(USERS)}
+    running = 0
+    max_running = 0
+
+    async def handler(user_id: int, seq: int):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        # Разная длительность, чтобы поздние обновления могли «обогнать» ранние
+        await asyncio.sleep(HANDLER_DELAY * random.uniform(0.5, 1.5))
+        processed[user_id].append(seq)
+        running -= 1
+
+    # Как и Application, создаём по задаче на обновление в порядке поступления
+    tasks = []
+    started = time.perf_counter()
+    for seq in range(UPDATES_PER_USER):
+        for user_id in range(USERS):
+            update = SimpleNamespace(effective_user=SimpleNamespace(id=user_id))
+            tasks.append(asyncio.create_task(processor.process_update(update, handler(user_id, seq))))
+    await asyncio.gather(*tasks)
+    return time.perf_counter() - started, processed, max_running
+
+
+def test_concurrent_updates_keep_per_user_order():
+    print("🧪 Нагрузочный тест параллельной обработки обновлений...")
+    random.seed(1)
+
+    processor = KeyedUpdateProcessor(WORKERS, key_func=lambda u: u.effective_user.id)
+    elapsed, processed, max_running = asyncio.run(run_load(processor))
+
+    sequential = USERS * UPDATES_PER_USER * HANDLER_DELAY
+    print(f"⏱ Параллельно: {elapsed:.3f} с, последовательно было бы ≈ {sequential:.3f} с")
+    print(f"⚙️ Максимум одновременных обработчиков: {max_running} (лимит {WORKERS})")
+
+    assert max_running <= WORKERS
+    assert elapsed < sequential / 3, "Нет выигрыша от параллельной обработки"
+    for user_id, sequence in processed.items():
+        assert sequence == list(range(UPDATES_PER_USER)), f"Порядок нарушен для {user_id}: {sequence}"
+    assert processor.stats()['busy_keys'] == 0
+    print("✅ Порядок обновлений каждого пользователя сохранён")
+
+    # Обновления без ключа (нет пользователя) тоже обрабатываются
+    processor = KeyedUpdateProcessor(2, key_func=lambda u: None)
+
+    async def no_key():
+        done = []
+
+        async def handler():
+            done.append(True)
+
+        await asyncio.gather(*(processor.process_update(object(), handler()) for _ in range(5)))
+        return done
+
+    assert len(asyncio.run(no_key())) == 5
+    print("\n✅ Нагрузочный тест завершен!")
+
+
+if __name__ == "__main__":
+    test_concurrent_updates_keep_per_user_order()
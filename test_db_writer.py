@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки записи в БД через один писатель с групповым коммитом.
+"""
+
+import os
+import sys
+import sqlite3
+import asyncio
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.database import Database
+from services.db_writer import DatabaseWriter
+
+
+def failing_command(c):
+    c.execute("INSERT INTO accounts (details, price) VALUES ('rolled back', 1.0)")
+    raise ValueError("broken command")
+
+
+async def run_writes(db):
+    writer = DatabaseWriter(db)
+    writer.start()
+    try:
+        account_id = db.add_account("Writer lot", 5.0)
+
+        # 1. Пачка логов: всё уходит в несколько транзакций, порядок сохраняется
+        ids = await asyncio.gather(*[writer.add_credential(account_id, f"login{i}:pass") for i in range(50)])
+
+        # 2. Продажи в порядке поступления, последняя не получает лог
+        sales = await asyncio.gather(*[writer.mark_account_sold(account_id, 100 + i, 5.0, payment_type="crypto")
+                                       for i in range(51)])
+
+        # 3. Ошибка одной команды не откатывает соседние
+        queued = writer.add_to_purchase_queue(user_id=1, account_id=account_id, payment_type="rub", price_usdt=5.0)
+        broken = writer.submit(failing_command)
+        status = writer.update_queue_payment_status(1, account_id, None, "paid")
+        results = await asyncio.gather(queued, broken, status, return_exceptions=True)
+
+        # 4. Заявка на подарок со ссылками: вторая от того же пользователя не создаётся
+        links = [(f"hash{i}", f"url{i}") for i in range(10)]
+        gifts = await asyncio.gather(
+            writer.create_gift_request_with_links(7, "gifter", "links", links),
+            writer.create_gift_request_with_links(7, "gifter", "links", [("other", "other-url")]))
+        return account_id, ids, sales, results, gifts, writer.stats()
+    finally:
+        await writer.stop()
+
+
+async def run_busy_write(db):
+    writer = DatabaseWriter(db, busy_timeout=0.05, busy_backoff=0.05)
+    writer.start()
+    account_id = db.add_account("Busy lot", 5.0)
+    # Другой процесс держит блокировку записи дольше busy_timeout
+    holder = sqlite3.connect(db.db_file, isolation_level=None)
+    holder.execute('BEGIN IMMEDIATE')
+    try:
+        pending = writer.add_credential(account_id, "busy:pass")
+        await asyncio.sleep(0.3)
+        holder.execute('COMMIT')
+        credential_id = await pending
+        return account_id, credential_id, writer.stats()
+    finally:
+        holder.close()
+        await writer.stop()
+
+
+def test_db_writer():
+    db_file = 'test_db_writer.db'
+    db = Database(db_file)
+    try:
+        print("🧪 Тестирование группового коммита...")
+        account_id, ids, sales, results, gifts, stats = asyncio.run(run_writes(db))
+
+        assert ids == sorted(ids) and len(set(ids)) == 50
+        assert db.count_available_credentials(account_id) == 0
+        print(f"✅ 50 логов записаны по порядку, транзакций: {stats['commits']}")
+
+        assert [details for _, details, _ in sales[:50]] == [f"login{i}:pass" for i in range(50)]
+        assert sales[49][2] is True and sales[50] == (False, '', False)
+        assert stats['writes_per_commit'] > 1
+        print("✅ Продажи выданы строго в порядке очереди")
+
+        queue_id, error, updated = results
+        assert isinstance(queue_id, int) and isinstance(error, ValueError)
+        # invoice_id NULL не совпадает с условием, но сама команда выполнена
+        assert updated is False
+        assert db.get_queue_size(account_id) == 1
+        assert db.get_account(account_id + 1) is None
+        assert stats['failed'] == 1
+        print("✅ Ошибочная команда откатывается отдельно")
+
+        assert gifts[0][0] is not None and gifts[0][1] == [] and gifts[1] == (None, [])
+        assert len(db.get_gift_links(gifts[0][0])) == 10 and db.count_pending_gift_requests() == 1
+        print("✅ Заявка на подарок записывается через писателя")
+
+        account_id, credential_id, stats = asyncio.run(run_busy_write(db))
+        assert isinstance(credential_id, int) and db.count_available_credentials(account_id) == 1
+        assert stats['retried'] >= 1 and stats['failed'] == 0
+        print(f"✅ Занятая база: пачка повторена {stats['retried']} раз и записана")
+
+        print("\n✅ Тест группового коммита завершен!")
+    finally:
+        db.close()
+        os.remove(db_file)
+
+
+if __name__ == "__main__":
+    test_db_writer()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки надёжной выдачи логов через delivery_outbox.
+"""
+
+import os
+import sys
+import asyncio
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from telegram.error import Forbidden
+
+from database.database import Database
+from services.delivery_sender import DeliverySender
+
+
+class FakeDispatcher:
+    def __init__(self):
+        self.sent = []
+        self.blocked = set()
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if chat_id in self.blocked:
+            raise Forbidden("bot was blocked by the user")
+        self.sent.append((chat_id, text))
+
+
+def test_delivery_outbox():
+    db_file = 'test_outbox.db'
+    db = Database(db_file)
+    try:
+        print("🧪 Тестирование delivery_outbox...")
+
+        account_id = db.add_account("Outbox lot", 5.0)
+        db.add_credential(account_id, "login1:pass1")
+        db.add_credential(account_id, "login2:pass2")
+
+        # 1. Продажа записывает строку outbox в той же транзакции
+        success, details, _ = db.mark_account_sold(account_id, 111, 5.0, delivery_kind="crypto",
+                                                   delivery_payload={"price": 5.0})
+        assert success and details == "login1:pass1"
+        success, _, depleted = db.mark_account_sold(account_id, 222, 5.0, delivery_kind="queue",
+                                                    delivery_payload={"price": 5.0})
+        assert success and depleted
+        assert db.count_deliveries_by_status() == {'pending': 2}
+        print("✅ Продажи записаны в outbox")
+
+        # 2. Отправитель доставляет строки и повторяет неудачные
+        dispatcher = FakeDispatcher()
+        dispatcher.blocked.add(222)
+        sender = DeliverySender(db, dispatcher, render=lambda row: row['details'], max_attempts=2)
+
+        assert asyncio.run(sender.drain_once()) == 2
+        assert dispatcher.sent == [(111, "login1:pass1")]
+        assert db.count_deliveries_by_status() == {'delivered': 1, 'pending': 1}
+        stuck = db.get_stuck_deliveries()
+        assert len(stuck) == 1 and stuck[0]['user_id'] == 222 and 'Forbidden' in stuck[0]['last_error']
+        print("✅ Доставленные отмечены, неудачные видны как зависшие")
+
+        # 3. Повтор ещё не наступил — строка не берётся повторно
+        assert asyncio.run(sender.drain_once()) == 0
+
+        # 4. После исчерпания попыток строка помечается failed и может быть перезапущена
+        db.reschedule_delivery(stuck[0]['id'], stuck[0]['last_error'], 0)
+        asyncio.run(sender.drain_once())
+        assert db.count_deliveries_by_status() == {'delivered': 1, 'failed': 1}
+        assert db.retry_failed_deliveries() == 1
+        dispatcher.blocked.clear()
+        asyncio.run(sender.drain_once())
+        assert db.count_deliveries_by_status() == {'delivered': 2}
+        assert dispatcher.sent[-1] == (222, "login2:pass2")
+        print("✅ Повторная выдача после ошибки работает")
+
+        print("\n✅ Тест delivery_outbox завершен!")
+    finally:
+        db.close()
+        os.remove(db_file)
+
+
+if __name__ == "__main__":
+    test_delivery_outbox()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки очереди исходящих сообщений.
+
+Проверяет приоритеты (выдачи раньше уведомлений), повтор после RetryAfter
+и то, что ошибки Forbidden не повторяются.
+"""
+
+import os
+import sys
+import asyncio
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from telegram.error import Forbidden, RetryAfter
+
+from services.dispatcher import OutboundDispatcher, PRIORITY_DELIVERY, PRIORITY_NOTIFICATION
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+        self.flood_once = {777}
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if chat_id in self.flood_once:
+            self.flood_once.discard(chat_id)
+            raise RetryAfter(0.05)
+        if chat_id == 666:
+            raise Forbidden("bot was blocked by the user")
+        self.sent.append((chat_id, text))
+        return text
+
+
+async def run_scenario():
+    bot = FakeBot()
+    dispatcher = OutboundDispatcher(global_rate=1000, per_chat_rate=1000, per_chat_burst=1000, max_in_flight=1)
+
+    # Заполняем очередь до запуска воркера: уведомления поставлены раньше выдач
+    notifications = [dispatcher.submit('send_message', 1, priority=PRIORITY_NOTIFICATION, text=f"notify {i}")
+                     for i in range(3)]
+    deliveries = [dispatcher.submit('send_message', 100 + i, priority=PRIORITY_DELIVERY, text=f"delivery {i}")
+                  for i in range(3)]
+    flooded = dispatcher.submit('send_message', 777, priority=PRIORITY_DELIVERY, text="after flood")
+    blocked = dispatcher.submit('send_message', 666, priority=PRIORITY_DELIVERY, text="blocked")
+
+    dispatcher.start(bot)
+    await asyncio.gather(*notifications, *deliveries, flooded, return_exceptions=True)
+    blocked_error = await asyncio.gather(blocked, return_exceptions=True)
+    await dispatcher.stop()
+    return bot, dispatcher, blocked_error[0]
+
+
+async def run_throttled_chat_scenario():
+    bot = FakeBot()
+    dispatcher = OutboundDispatcher(global_rate=1000, per_chat_rate=1, per_chat_burst=1, max_in_flight=4)
+    # Длинная очередь в один чат, который может отправлять раз в секунду
+    backlog = [dispatcher.submit('send_message', 1, priority=PRIORITY_DELIVERY, wait=False, text=f"spam {i}")
+               for i in range(500)]
+    others = [dispatcher.submit('send_message', 200 + i, priority=PRIORITY_NOTIFICATION, text=f"other {i}")
+              for i in range(5)]
+    dispatcher.start(bot)
+    await asyncio.wait_for(asyncio.gather(*others), timeout=1)
+    # Чат с очередью ждёт на отдельной куче, его сообщения не перебираются при выборе
+    heaps = (len(dispatcher._ready), len(dispatcher._waiting))
+    await dispatcher.stop(drain_timeout=0)
+    return bot, heaps, backlog
+
+
+def test_dispatcher_priorities_and_retries():
+    print("🧪 Тестирование очереди исходящих сообщений...")
+    bot, dispatcher, blocked_error = asyncio.run(run_scenario())
+
+    texts = [text for _, text in bot.sent]
+    first_notification = texts.index("notify 0")
+    assert all(texts.index(f"delivery {i}") < first_notification for i in range(3))
+    print("✅ Выдачи отправлены раньше уведомлений")
+
+    assert [t for t in texts if t.startswith("notify")] == ["notify 0", "notify 1", "notify 2"]
+    print("✅ Порядок сообщений в одном чате сохранён")
+
+    assert "after flood" in texts
+    assert isinstance(blocked_error, Forbidden)
+    stats = dispatcher.stats()
+    assert stats['flood_waits'] == 1 and stats['failed'] == 1
+    assert stats['sent'] == 7 and stats['queued'] == 0
+    print("✅ RetryAfter повторяется, Forbidden — нет")
+
+    print("\n✅ Тест очереди исходящих сообщений завершен!")
+
+
+def test_throttled_chat_does_not_block_others():
+    print("🧪 Тестирование чата с длинной очередью...")
+    bot, heaps, backlog = asyncio.run(run_throttled_chat_scenario())
+
+    texts = [text for _, text in bot.sent]
+    assert all(f"other {i}" in texts for i in range(5))
+    assert [t for t in texts if t.startswith("spam")] == ["spam 0"]
+    assert heaps == (0, 1) and backlog == [None] * 500
+    print("✅ Другие чаты не ждут чат с ограничением скорости")
+
+
+if __name__ == "__main__":
+    test_dispatcher_priorities_and_retries()
+    test_throttled_chat_does_not_block_others()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки потоковой выгрузки в CSV.gz.
+"""
+
+import os
+import sys
+import csv
+import gzip
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.database import Database
+from services.export import write_csv_gz
+
+
+def read_csv_gz(path):
+    with gzip.open(path, 'rt', encoding='utf-8', newline='') as f:
+        return list(csv.reader(f))
+
+
+def test_streaming_export():
+    db_file = 'test_export.db'
+    out_file = 'test_export.csv.gz'
+    db = Database(db_file)
+    try:
+        print("🧪 Тестирование выгрузки CSV...")
+
+        lot_a = db.add_account("Export lot A", 5.0)
+        lot_b = db.add_account("Export lot B", 7.0)
+        for i in range(3):
+            db.add_credential(lot_a, f"a{i}:pass")
+        db.add_credential(lot_b, "b0:pass")
+        for user_id in (111, 222, 333):
+            db.mark_account_sold(lot_a, user_id, 5.0, payment_type="crypto")
+        db.mark_account_sold(lot_b, 444, 7.0, payment_type="rub")
+
+        # 1. Весь список заказов с заголовком
+        count = write_csv_gz(db.iter_export('orders', batch_size=2), out_file)
+        rows = read_csv_gz(out_file)
+        assert count == 4 and len(rows) == 5
+        assert 'user_id' in rows[0]
+        print(f"✅ Выгружено заказов: {count}")
+
+        # 2. Фильтр по лоту
+        count = write_csv_gz(db.iter_export('credentials', account_id=lot_b), out_file)
+        rows = read_csv_gz(out_file)
+        assert count == 1 and any("b0:pass" in cell for cell in rows[1])
+        print("✅ Фильтр по лоту работает")
+
+        # 3. Фильтр по датам: сегодняшние продажи входят, прошлый период пуст
+        today = db.iter_export('orders', date_from='2000-01-01', date_to='2999-12-31')
+        assert write_csv_gz(today, out_file) == 4
+        assert write_csv_gz(db.iter_export('orders', date_to='2000-01-01'), out_file) == 0
+        assert len(read_csv_gz(out_file)) == 1
+        print("✅ Фильтр по датам работает, пустая выгрузка содержит только заголовок")
+
+        # 4. Неизвестный тип выгрузки
+        try:
+            next(db.iter_export('passwords'))
+            assert False, "ожидалась ошибка"
+        except ValueError:
+            pass
+
+        print("\n✅ Тест выгрузки завершен!")
+    finally:
+        db.close()
+        for path in (db_file, out_file):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+if __name__ == "__main__":
+    test_streaming_export()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки объединения сигналов пополнения лота.
+"""
+
+import os
+import sys
+import asyncio
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.fulfilment import RefillCoalescer
+
+
+async def run_burst():
+    passes = []
+
+    async def handler(account_id):
+        passes.append(account_id)
+
+    worker = RefillCoalescer(handler, window=0.1)
+    task = asyncio.create_task(worker.run())
+
+    # 50 логов в лот 1 и пара в лот 2 за время одного окна
+    for _ in range(50):
+        worker.signal(1)
+        await asyncio.sleep(0.001)
+    worker.signal(2)
+    await asyncio.sleep(0.2)
+
+    # Новое пополнение после окна — ещё один проход
+    worker.signal(1)
+    await asyncio.sleep(0.2)
+
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    return passes, worker.stats()
+
+
+def test_refill_signals_are_coalesced():
+    print("🧪 Тестирование объединения пополнений...")
+    passes, stats = asyncio.run(run_burst())
+    print(f"🔄 Проходы по очереди: {passes}")
+    assert passes == [1, 2, 1]
+    assert stats['signals'] == 52 and stats['passes'] == 3
+    print("✅ 50 пополнений за окно → один проход по очереди лота")
+
+
+if __name__ == "__main__":
+    test_refill_signals_are_coalesced()
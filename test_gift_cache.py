@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки кэша текущего подарка.
+"""
+
+import os
+import sys
+import sqlite3
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.database import Database
+
+
+def test_gift_cache():
+    db_file = 'test_gift_cache.db'
+    db = Database(db_file)
+    try:
+        print("🧪 Тестирование кэша подарка...")
+        assert db.get_current_gift() is None
+
+        db.save_gift('photo', 'Подпись', 'file-1', source_chat_id=1, source_message_id=10)
+        assert db.get_current_gift() == ('photo', 'Подпись', 'file-1', 1, 10)
+
+        # Подарок читается из памяти, пока его не заменит save_gift
+        conn = sqlite3.connect(db_file)
+        conn.execute('DELETE FROM gifts')
+        conn.commit()
+        conn.close()
+        assert db.get_current_gift() == ('photo', 'Подпись', 'file-1', 1, 10)
+        db.save_gift('text', 'Новый подарок', source_chat_id=1, source_message_id=11)
+        assert db.get_current_gift() == ('text', 'Новый подарок', None, 1, 11)
+        fresh = Database(db_file)
+        assert fresh.get_current_gift() == ('text', 'Новый подарок', None, 1, 11)
+        fresh.close()
+        print("✅ Кэш обновляется при сохранении подарка")
+    finally:
+        db.close()
+        os.remove(db_file)
+
+
+if __name__ == "__main__":
+    test_gift_cache()
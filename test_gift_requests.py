@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки постраничного списка заявок на подарки.
+"""
+
+import os
+import sys
+import sqlite3
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.database import Database
+from database.storage import create_storage
+from services.tiktok_links import extract_tiktok_link, normalize_tiktok_link, link_hash
+
+
+def test_gift_requests_pagination():
+    db_file = 'test_gift_requests.db'
+    db = Database(db_file)
+    try:
+        print("🧪 Тестирование страниц заявок...")
+
+        links = "\n".join(f"https://www.tiktok.com/@user/video/{i}" for i in range(10))
+        ids = [db.create_gift_request(1000 + i, f"user{i}", links) for i in range(25)]
+        db.process_gift_request(ids[3], "approved", 1)
+        pending = [request_id for request_id in ids if request_id != ids[3]]
+        assert db.count_pending_gift_requests() == 24
+
+        # 1. Первая страница: без "назад", с "далее", число ссылок сохранено при создании
+        page, has_prev, has_next = db.get_pending_gift_requests_page(limit=10)
+        assert [row[0] for row in page] == pending[:10]
+        assert page[0][1:] == ("user0", 10)
+        assert not has_prev and has_next
+
+        # 2. Вперёд по последнему id и обратно по первому
+        page2, has_prev, has_next = db.get_pending_gift_requests_page(after_id=page[-1][0], limit=10)
+        assert [row[0] for row in page2] == pending[10:20] and has_prev and has_next
+        page3, has_prev, has_next = db.get_pending_gift_requests_page(after_id=page2[-1][0], limit=10)
+        assert [row[0] for row in page3] == pending[20:] and has_prev and not has_next
+        back, has_prev, has_next = db.get_pending_gift_requests_page(before_id=page3[0][0], limit=10)
+        assert back == page2 and has_prev and has_next
+        print("✅ Навигация вперёд/назад работает")
+
+        # 3. Старая база (user_version 0) без link_count получает колонку при запуске,
+        # а значения дозаполняются порциями
+        conn = sqlite3.connect(db_file)
+        conn.execute('DROP INDEX idx_gift_requests_status')
+        conn.execute('ALTER TABLE gift_requests DROP COLUMN link_count')
+        conn.execute('PRAGMA user_version = 0')
+        conn.commit()
+        conn.close()
+        db.close()
+        db = Database(db_file)
+        assert db.run_backfills(chunk_size=10, max_chunks=1)
+        assert not db.run_backfills(chunk_size=10)
+        page, _, _ = db.get_pending_gift_requests_page(limit=1)
+        assert page[0][2] == 10
+        print("✅ link_count заполнен для старых заявок")
+
+        print("\n✅ Тест списка заявок завершен!")
+    finally:
+        db.close()
+        os.remove(db_file)
+
+
+def test_gift_requests_bulk():
+    db_file = 'test_gift_requests_bulk.db'
+    db = Database(db_file)
+    try:
+        print("🧪 Тестирование решения по заявкам пачкой...")
+
+        ids = [db.create_gift_request(2000 + i, f"user{i}", "https://vm.tiktok.com/x\n" * (5 + i)) for i in range(10)]
+
+        # 1. Одобряем заявки с 10+ ссылками
+        approved = db.process_gift_requests_bulk("approved", 1, min_links=10)
+        assert [request[0] for request in approved] == ids[5:]
+        assert approved[0][1:] == (2005, "user5")
+
+        # 2. Повторно уже обработанные не затрагиваются
+        assert db.process_gift_requests_bulk("rejected", 1, first_id=ids[4], last_id=ids[9]) == [(ids[4], 2004, "user4")]
+        assert db.count_pending_gift_requests() == 4
+        print("✅ Одна транзакция на пачку, только ожидающие заявки")
+
+        print("\n✅ Тест решения пачкой завершен!")
+    finally:
+        db.close()
+        os.remove(db_file)
+
+
+def test_duplicate_links_rejected():
+    db_file = 'test_gift_links.db'
+    db = Database(db_file)
+    try:
+        print("🧪 Тестирование повторных ссылок...")
+
+        # 1. Разные записи одной ссылки приводятся к одному виду
+        assert normalize_tiktok_link("https://vm.tiktok.com/ZMabC12/") == "tiktok.com/t/ZMabC12"
+        assert normalize_tiktok_link("WWW.TikTok.com/t/ZMabC12?_r=1") == "tiktok.com/t/ZMabC12"
+        assert (normalize_tiktok_link("https://m.tiktok.com/@User/video/1/?comment_id=7&is_from_webapp=1")
+                == normalize_tiktok_link("tiktok.com/@user/video/1?comment_id=7"))
+        assert normalize_tiktok_link("https://example.com/?u=tiktok.com") is None
+        # Ссылка внутри строки с нумерацией или подписью
+        assert normalize_tiktok_link("1) https://www.tiktok.com/@u/video/123") == "tiktok.com/@u/video/123"
+        assert normalize_tiktok_link("link: https://vt.tiktok.com/ZSabc12/") == "tiktok.com/t/ZSabc12"
+        assert extract_tiktok_link("2. (https://www.tiktok.com/@u/video/5).") == "https://www.tiktok.com/@u/video/5"
+        assert normalize_tiktok_link("user@tiktok.com") is None
+        print("✅ Нормализация ссылок")
+
+        def submit(user_id, urls):
+            pairs = [(link_hash(normalize_tiktok_link(url)), url) for url in urls]
+            return db.create_gift_request_with_links(user_id, f"user{user_id}", "\n".join(urls), pairs)
+
+        urls = [f"https://www.tiktok.com/@a/video/{i}?comment_id={i}" for i in range(10)]
+        request_id, used = submit(1, urls)
+        assert request_id and used == []
+
+        # 2. Та же ссылка в другой записи от другого пользователя отклоняется
+        resubmitted = [f"https://www.tiktok.com/@b/video/{i}" for i in range(9)] + ["tiktok.com/@A/video/3?comment_id=3"]
+        request_id2, used = submit(2, resubmitted)
+        assert request_id2 is None and used == [urls[3]]
+        assert sum(link[4] for link in db.get_gift_links(request_id)) == 1
+        assert db.count_pending_gift_requests() == 1
+        print("✅ Повторно отправленные ссылки отклоняются и учитываются")
+
+        print("\n✅ Тест повторных ссылок завершен!")
+    finally:
+        db.close()
+        os.remove(db_file)
+
+
+def test_one_pending_request_per_user():
+    db_file = 'test_gift_pending.db'
+    db = Database(db_file)
+    try:
+        print("🧪 Тестирование одной ожидающей заявки на пользователя...")
+
+        def submit(user_id, start):
+            urls = [f"https://www.tiktok.com/@a/video/{i}" for i in range(start, start + 10)]
+            pairs = [(link_hash(normalize_tiktok_link(url)), url) for url in urls]
+            return db.create_gift_request_with_links(user_id, "user", "\n".join(urls), pairs)
+
+        request_id, _ = submit(1, 0)
+        assert request_id
+        assert submit(1, 100) == (None, [])
+        assert db.get_pending_gift_user_ids() == [1]
+
+        # После решения по заявке можно отправить новую
+        db.process_gift_request(request_id, "rejected", 99)
+        assert submit(1, 200)[0]
+        print("✅ Вторая ожидающая заявка отклоняется индексом")
+
+        # Дубликаты из старой базы закрываются при запуске, остаётся последняя заявка
+        conn = sqlite3.connect(db_file)
+        conn.execute('DROP INDEX idx_gift_requests_one_pending')
+        conn.execute("INSERT INTO gift_requests (user_id, username, links, link_count) VALUES (2, 'u', '', 0)")
+        conn.execute("INSERT INTO gift_requests (user_id, username, links, link_count) VALUES (2, 'u', '', 0)")
+        conn.execute('PRAGMA user_version = 0')
+        conn.commit()
+        conn.close()
+        db.close()
+        db = Database(db_file)
+        assert sorted(db.get_pending_gift_user_ids()) == [1, 2]
+        assert db.count_pending_gift_requests() == 2
+        print("✅ Старые дубликаты закрыты при миграции")
+
+        print("\n✅ Тест одной заявки завершен!")
+    finally:
+        db.close()
+        os.remove(db_file)
+
+
+def test_rejected_links_can_be_resubmitted():
+    db_file = 'test_gift_resubmit.db'
+    for backend in ('sqlite', 'memory'):
+        db = create_storage(backend, db_file)
+        try:
+            print(f"🧪 Повторная отправка после отказа ({backend})...")
+
+            def submit(user_id, urls):
+                pairs = [(link_hash(normalize_tiktok_link(url)), url) for url in urls]
+                return db.create_gift_request_with_links(user_id, "user", "\n".join(urls), pairs)
+
+            urls = [f"https://www.tiktok.com/@a/video/{i}" for i in range(10)]
+            request_id, _ = submit(1, urls)
+            db.process_gift_request(request_id, "rejected", 99)
+            # Исправлена одна ссылка из десяти, остальные отправлены снова
+            fixed = urls[:9] + ["https://www.tiktok.com/@a/video/99"]
+            retry_id, used = submit(1, fixed)
+            assert retry_id and used == []
+            assert all(link[4] == 0 for link in db.get_gift_links(retry_id))
+
+            # Массовый отказ тоже освобождает ссылки, одобренные остаются занятыми
+            db.process_gift_requests_bulk("rejected", 99)
+            retry_id, _ = submit(1, fixed)
+            db.process_gift_request(retry_id, "approved", 99)
+            request_id, used = submit(2, fixed)
+            assert request_id is None and sorted(used) == sorted(fixed)
+            print("✅ Ссылки отклонённой заявки можно отправить снова")
+        finally:
+            db.close()
+            if os.path.exists(db_file):
+                os.remove(db_file)
+
+
+if __name__ == "__main__":
+    test_gift_requests_pagination()
+    test_gift_requests_bulk()
+    test_duplicate_links_rejected()
+    test_one_pending_request_per_user()
+    test_rejected_links_can_be_resubmitted()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки автоматической проверки ссылок на локальном HTTP-стабе.
+"""
+
+import os
+import sys
+import asyncio
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from aiohttp import web
+
+from services.link_verifier import LinkVerifier
+
+
+async def run_checks():
+    hits = {'count': 0, 'active': 0, 'max_active': 0}
+
+    async def video(request):
+        hits['count'] += 1
+        hits['active'] += 1
+        hits['max_active'] = max(hits['max_active'], hits['active'])
+        await asyncio.sleep(0.05)
+        hits['active'] -= 1
+        return web.Response(text="video")
+
+    async def short(request):
+        hits['count'] += 1
+        raise web.HTTPFound(f"/@user/video/{request.match_info['code']}")
+
+    async def removed(request):
+        hits['count'] += 1
+        raise web.HTTPFound("/")
+
+    async def home(request):
+        return web.Response(text="home")
+
+    async def missing(request):
+        hits['count'] += 1
+        return web.Response(status=404)
+
+    app = web.Application()
+    app.router.add_get('/', home)
+    app.router.add_get('/@user/video/{id}', video)
+    app.router.add_get('/t/{code}', short)
+    app.router.add_get('/removed', removed)
+    app.router.add_get('/missing', missing)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    base = f"http://127.0.0.1:{port}"
+
+    verifier = LinkVerifier(max_concurrency=3, per_host_rate=1000, per_host_burst=1000,
+                            validate=lambda url: url.startswith(base))
+    try:
+        urls = [f"{base}/@user/video/{i}" for i in range(6)] + [
+            f"{base}/t/42", f"{base}/removed", f"{base}/missing", "https://example.com/not-a-stub"
+        ]
+        results = await verifier.check_many(urls)
+        first_pass_hits = hits['count']
+        again = await verifier.check_many(urls[:6])
+        return results, again, hits, first_pass_hits, verifier.stats()
+    finally:
+        await verifier.close()
+        await runner.cleanup()
+
+
+def test_link_verifier():
+    print("🧪 Тестирование проверки ссылок...")
+    results, again, hits, first_pass_hits, stats = asyncio.run(run_checks())
+    for result in results:
+        print(f"   {'✅' if result['ok'] else '❌'} {result['url']} → {result['detail']}")
+
+    assert [result['ok'] for result in results] == [True] * 7 + [False] * 3
+    assert results[6]['final_url'].endswith("/@user/video/42")
+    assert results[7]['detail'] == 'перенаправляет на главную'
+    assert results[8]['detail'] == 'HTTP 404'
+    assert results[9]['detail'] == 'неверный формат'
+    print("✅ Формат, перенаправления и доступность проверяются")
+
+    assert hits['max_active'] <= 3
+    print(f"✅ Одновременных запросов не больше 3 (было {hits['max_active']})")
+
+    assert again == results[:6] and hits['count'] == first_pass_hits
+    assert stats['cache_hits'] == 6
+    print("✅ Повторная проверка берётся из кэша")
+
+
+if __name__ == "__main__":
+    test_link_verifier()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки кэширования file_id картинок из pic/.
+"""
+
+import os
+import sys
+import asyncio
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from telegram.error import BadRequest
+
+from database.database import Database
+from services.media import MediaRegistry
+
+
+class FakeDispatcher:
+    def __init__(self):
+        self.uploads = 0
+        self.sent_ids = []
+        self.rejected = set()
+
+    async def send_photo(self, chat_id, photo, **kwargs):
+        if isinstance(photo, bytes):
+            self.uploads += 1
+            file_id = f"file-{self.uploads}"
+        else:
+            if photo in self.rejected:
+                raise BadRequest("Wrong file identifier/http url specified")
+            file_id = photo
+            self.sent_ids.append(photo)
+        return SimpleNamespace(photo=[SimpleNamespace(file_id=f"{file_id}-thumb"), SimpleNamespace(file_id=file_id)])
+
+
+async def send_many(registry, count):
+    await asyncio.gather(*(registry.send_photo(chat_id, '1.jpeg', caption="hi") for chat_id in range(count)))
+
+
+def test_media_registry():
+    db_file = 'test_media.db'
+    db = Database(db_file)
+    pic_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pic')
+    try:
+        print("🧪 Тестирование кэша file_id...")
+
+        # 1. Одновременные первые отправки загружают файл один раз
+        dispatcher = FakeDispatcher()
+        registry = MediaRegistry(db, dispatcher, pic_dir)
+        asyncio.run(send_many(registry, 10))
+        assert dispatcher.uploads == 1 and dispatcher.sent_ids == ["file-1"] * 9
+        print("✅ 10 отправок → 1 загрузка")
+
+        # 2. После перезапуска file_id берётся из БД
+        registry = MediaRegistry(db, dispatcher, pic_dir)
+        asyncio.run(send_many(registry, 3))
+        assert dispatcher.uploads == 1
+        print("✅ file_id сохраняется в БД")
+
+        # 2a. Новое mtime (свежий checkout, деплой) не вызывает повторной загрузки
+        path = os.path.join(pic_dir, '1.jpeg')
+        stat = os.stat(path)
+        try:
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+            registry = MediaRegistry(db, dispatcher, pic_dir)
+            asyncio.run(send_many(registry, 3))
+        finally:
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        assert dispatcher.uploads == 1
+        print("✅ Подпись зависит только от содержимого файла")
+
+        # 3. Отклонённый file_id заменяется повторной загрузкой
+        dispatcher.rejected.add("file-1")
+        asyncio.run(send_many(registry, 1))
+        assert dispatcher.uploads == 2
+        assert db.get_media_file_id('1.jpeg', registry._signature('1.jpeg')) == "file-2"
+        print("✅ Отклонённый file_id загружается заново")
+
+        print("\n✅ Тест кэша file_id завершен!")
+    finally:
+        db.close()
+        os.remove(db_file)
+
+
+if __name__ == "__main__":
+    test_media_registry()
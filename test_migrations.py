@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки версионных миграций схемы.
+"""
+
+import os
+import sys
+import sqlite3
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database import migrations
+from database.database import Database
+
+
+def traced_statements(action):
+    """SQL, выполненный внутри action()"""
+    statements = []
+    real_connect = sqlite3.connect
+
+    def connect(*args, **kwargs):
+        conn = real_connect(*args, **kwargs)
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    sqlite3.connect = connect
+    try:
+        action()
+    finally:
+        sqlite3.connect = real_connect
+    return statements
+
+
+def test_migrations():
+    db_file = 'test_migrations.db'
+    db = Database(db_file)
+    try:
+        print("🧪 Тестирование миграций...")
+
+        # 1. Новая база сразу получает последнюю версию схемы
+        conn = sqlite3.connect(db_file)
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == migrations.schema_version()
+        conn.close()
+        print(f"✅ Версия схемы: {migrations.schema_version()}")
+
+        # 2. Повторный запуск с актуальной схемой — одно чтение PRAGMA
+        statements = traced_statements(lambda: Database(db_file, read_pool_size=0))
+        assert statements == ['PRAGMA user_version']
+        print("✅ Запуск с актуальной схемой: только PRAGMA user_version")
+
+        # 3. Ошибка в миграции откатывает её целиком, версия не меняется
+        def broken(c):
+            c.execute('CREATE TABLE half_done (id INTEGER)')
+            raise RuntimeError("broken migration")
+
+        version = migrations.schema_version()
+        migrations.MIGRATIONS.append((version + 1, 'broken', broken, None))
+        try:
+            migrations.apply_migrations(db_file)
+            assert False, "ожидалась ошибка"
+        except RuntimeError:
+            pass
+        finally:
+            migrations.MIGRATIONS.pop()
+        conn = sqlite3.connect(db_file)
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == version
+        assert not conn.execute("SELECT name FROM sqlite_master WHERE name = 'half_done'").fetchall()
+        conn.close()
+        print("✅ Неудачная миграция откатывается")
+
+        # 4. Новая миграция применяется один раз, дозаполнение идёт порциями
+        def add_note(c):
+            c.execute('ALTER TABLE accounts ADD COLUMN note TEXT')
+
+        def fill_note(c, limit):
+            c.execute("UPDATE accounts SET note = 'lot ' || id WHERE id IN "
+                      "(SELECT id FROM accounts WHERE note IS NULL LIMIT ?)", (limit,))
+            return c.rowcount
+
+        for i in range(5):
+            db.add_account(f"Lot {i}", 1.0)
+        migrations.MIGRATIONS.append((version + 1, 'account notes', add_note, fill_note))
+        try:
+            assert migrations.apply_migrations(db_file) == [version + 1]
+            assert migrations.apply_migrations(db_file) == []
+            assert db.run_backfills(chunk_size=2, max_chunks=2)
+            assert not db.run_backfills(chunk_size=2)
+        finally:
+            migrations.MIGRATIONS.pop()
+        conn = sqlite3.connect(db_file)
+        assert conn.execute('SELECT COUNT(*) FROM accounts WHERE note IS NULL').fetchone()[0] == 0
+        assert conn.execute('SELECT COUNT(*) FROM schema_backfills').fetchone()[0] == 0
+        conn.close()
+        print("✅ Миграция применена один раз, данные дозаполнены порциями")
+
+        print("\n✅ Тест миграций завершен!")
+    finally:
+        db.close()
+        os.remove(db_file)
+
+
+if __name__ == "__main__":
+    test_migrations()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки истории покупок /myorders.
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.database import Database
+
+
+def test_user_orders_pages():
+    db_file = 'test_orders.db'
+    db = Database(db_file)
+    try:
+        print("🧪 Тестирование истории покупок...")
+        account_id = db.add_account("Orders lot", 5.0)
+        for i in range(12):
+            db.add_credential(account_id, f"login{i}:pass{i}")
+            db.mark_account_sold(account_id, 42 if i % 3 else 7, 5.0)
+
+        # Страницы идут от новых к старым и содержат только свои заказы
+        seen = []
+        cursor = None
+        while True:
+            orders, has_more = db.get_user_orders_page(42, before_order_id=cursor, limit=3)
+            seen.extend(orders)
+            if not has_more:
+                break
+            cursor = orders[-1][0]
+        assert [order[4] for order in seen] == [f"login{i}:pass{i}" for i in reversed(range(12)) if i % 3]
+        assert seen[0][1:3] == ("Orders lot", 5.0)
+        print(f"✅ {len(seen)} покупок на страницах по 3, без чужих заказов")
+
+        # Курсор из чужого заказа не открывает страницу
+        foreign_order = db.get_user_orders_page(7, limit=1)[0][0][0]
+        assert db.get_user_orders_page(42, before_order_id=foreign_order) == ([], False)
+        print("✅ Чужой курсор не работает")
+
+        print("\n✅ Тест истории покупок завершен!")
+    finally:
+        db.close()
+        os.remove(db_file)
+
+
+if __name__ == "__main__":
+    test_user_orders_pages()
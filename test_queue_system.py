@@ -5,110 +5,153 @@
 
 import os
 import sys
+import time
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from database.database import Database
+from database.fixtures import memory_database, seed_database
 
 def test_queue_system():
-    # Создаем тестовую базу данных
-    db = Database('test_queue.db')
-    
-    print("🧪 Тестирование системы очереди...")
-    
-    # 1. Создаем тестовый лот
-    account_id = db.add_account("Test VEO3 Account", 50.0)
-    print(f"✅ Создан тестовый лот #{account_id}")
-    
-    # 2. Проверяем что лот пустой
-    available = db.count_available_credentials(account_id)
-    print(f"📦 Доступных аккаунтов в лоте: {available}")
-    
-    # 3. Добавляем пользователей в очередь
-    queue_id1 = db.add_to_purchase_queue(
-        user_id=12345,
-        account_id=account_id,
-        payment_type="crypto",
-        price_usdt=50.0,
-        username="user1",
-        invoice_id="inv123",
-        payment_status="paid"
-    )
-    print(f"👤 Добавлен пользователь 1 в очередь (ID: {queue_id1})")
-    
-    queue_id2 = db.add_to_purchase_queue(
-        user_id=67890,
-        account_id=account_id,
-        payment_type="rub",
-        price_usdt=50.0,
-        price_rub=4750,
-        username="user2",
-        payment_status="paid"
-    )
-    print(f"👤 Добавлен пользователь 2 в очередь (ID: {queue_id2})")
-    
-    # 4. Проверяем размер очереди
-    queue_size = db.get_queue_size(account_id)
-    print(f"👥 Размер очереди: {queue_size}")
-    
-    # 5. Добавляем логи и проверяем обработку очереди
-    print("\n📋 Добавляем логи в лот...")
-    db.add_credential(account_id, "login1:password1:email1@test.com")
-    db.add_credential(account_id, "login2:password2:email2@test.com")
-    
-    available_after = db.count_available_credentials(account_id)
-    print(f"📦 Доступных аккаунтов после добавления: {available_after}")
-    
-    # 6. Обрабатываем очередь
-    queue_entries = db.process_queue_for_lot(account_id)
-    print(f"🔄 Найдено записей в очереди для обработки: {len(queue_entries)}")
-    
-    for entry in queue_entries:
-        queue_id, user_id, payment_type, price_usdt, price_rub, username, invoice_id, payment_status = entry
-        print(f"   - Пользователь {user_id} (@{username}), тип: {payment_type}, статус: {payment_status}")
-    
-    # 7. Симулируем продажу
-    print("\n💰 Симулируем продажи...")
-    success1, details1, depleted1 = db.mark_account_sold(account_id, 12345, 50.0)
-    if success1:
-        print(f"✅ Продажа пользователю 12345: {details1}")
-        db.mark_queue_entry_fulfilled(queue_id1)
-        print("✅ Запись в очереди помечена как выполненная")
-    
-    success2, details2, depleted2 = db.mark_account_sold(account_id, 67890, 50.0)
-    if success2:
-        print(f"✅ Продажа пользователю 67890: {details2}")
-        db.mark_queue_entry_fulfilled(queue_id2)
-        print("✅ Запись в очереди помечена как выполненная")
-    
-    # 8. Проверяем финальное состояние
-    final_available = db.count_available_credentials(account_id)
-    final_queue_size = db.get_queue_size(account_id)
-    print(f"\n📊 Финальное состояние:")
-    print(f"   - Доступных аккаунтов: {final_available}")
-    print(f"   - Размер очереди: {final_queue_size}")
-    print(f"   - Лот истощен: {depleted2}")
-    
-    # 9. Добавляем еще одного пользователя в очередь для истощенного лота
-    queue_id3 = db.add_to_purchase_queue(
-        user_id=11111,
-        account_id=account_id,
-        payment_type="crypto",
-        price_usdt=50.0,
-        username="user3",
-        invoice_id="inv456",
-        payment_status="paid"
-    )
-    
-    final_queue_size2 = db.get_queue_size(account_id)
-    print(f"\n🔄 После добавления пользователя в очередь для истощенного лота:")
-    print(f"   - Размер очереди: {final_queue_size2}")
-    
-    print("\n✅ Тест системы очереди завершен!")
-    
-    # Удаляем тестовую базу
-    import os
-    os.remove('test_queue.db')
-    print("🗑️ Тестовая база данных удалена")
+    # Тестовая база в памяти: без файлов и fsync на каждый commit
+    db = memory_database()
+    try:
+        print("🧪 Тестирование системы очереди...")
+        
+        # 1. Создаем тестовый лот
+        account_id = db.add_account("Test VEO3 Account", 50.0)
+        print(f"✅ Создан тестовый лот #{account_id}")
+        
+        # 2. Проверяем что лот пустой
+        available = db.count_available_credentials(account_id)
+        print(f"📦 Доступных аккаунтов в лоте: {available}")
+        
+        # 3. Добавляем пользователей в очередь
+        queue_id1 = db.add_to_purchase_queue(
+            user_id=12345,
+            account_id=account_id,
+            payment_type="crypto",
+            price_usdt=50.0,
+            username="user1",
+            invoice_id="inv123",
+            payment_status="paid"
+        )
+        print(f"👤 Добавлен пользователь 1 в очередь (ID: {queue_id1})")
+        
+        queue_id2 = db.add_to_purchase_queue(
+            user_id=67890,
+            account_id=account_id,
+            payment_type="rub",
+            price_usdt=50.0,
+            price_rub=4750,
+            username="user2",
+            payment_status="paid"
+        )
+        print(f"👤 Добавлен пользователь 2 в очередь (ID: {queue_id2})")
+        
+        # 4. Проверяем размер очереди
+        queue_size = db.get_queue_size(account_id)
+        print(f"👥 Размер очереди: {queue_size}")
+        
+        # 5. Добавляем логи и проверяем обработку очереди
+        print("\n📋 Добавляем логи в лот...")
+        db.add_credential(account_id, "login1:password1:email1@test.com")
+        db.add_credential(account_id, "login2:password2:email2@test.com")
+        
+        available_after = db.count_available_credentials(account_id)
+        print(f"📦 Доступных аккаунтов после добавления: {available_after}")
+        
+        # 6. Обрабатываем очередь
+        queue_entries = db.process_queue_for_lot(account_id)
+        print(f"🔄 Найдено записей в очереди для обработки: {len(queue_entries)}")
+        
+        for entry in queue_entries:
+            queue_id, user_id, payment_type, price_usdt, price_rub, username, invoice_id, payment_status = entry
+            print(f"   - Пользователь {user_id} (@{username}), тип: {payment_type}, статус: {payment_status}")
+        
+        # 7. Симулируем продажу
+        print("\n💰 Симулируем продажи...")
+        success1, details1, depleted1 = db.mark_account_sold(account_id, 12345, 50.0)
+        if success1:
+            print(f"✅ Продажа пользователю 12345: {details1}")
+            db.mark_queue_entry_fulfilled(queue_id1)
+            print("✅ Запись в очереди помечена как выполненная")
+        
+        success2, details2, depleted2 = db.mark_account_sold(account_id, 67890, 50.0)
+        if success2:
+            print(f"✅ Продажа пользователю 67890: {details2}")
+            db.mark_queue_entry_fulfilled(queue_id2)
+            print("✅ Запись в очереди помечена как выполненная")
+        
+        # 8. Проверяем финальное состояние
+        final_available = db.count_available_credentials(account_id)
+        final_queue_size = db.get_queue_size(account_id)
+        print(f"\n📊 Финальное состояние:")
+        print(f"   - Доступных аккаунтов: {final_available}")
+        print(f"   - Размер очереди: {final_queue_size}")
+        print(f"   - Лот истощен: {depleted2}")
+        
+        # 9. Добавляем еще одного пользователя в очередь для истощенного лота
+        queue_id3 = db.add_to_purchase_queue(
+            user_id=11111,
+            account_id=account_id,
+            payment_type="crypto",
+            price_usdt=50.0,
+            username="user3",
+            invoice_id="inv456",
+            payment_status="paid"
+        )
+        
+        final_queue_size2 = db.get_queue_size(account_id)
+        print(f"\n🔄 После добавления пользователя в очередь для истощенного лота:")
+        print(f"   - Размер очереди: {final_queue_size2}")
+        
+        assert [entry[0] for entry in queue_entries] == [queue_id1, queue_id2]
+        assert success1 and success2 and depleted2
+        assert final_available == 0 and final_queue_size == 0 and final_queue_size2 == 1
+        print("\n✅ Тест системы очереди завершен!")
+    finally:
+        db.close()
+
+def test_queue_system_at_scale():
+    print("🧪 Тестирование очереди на тысячах лотов...")
+    db = memory_database()
+    try:
+        started = time.perf_counter()
+        lot_ids = seed_database(db, lots=2000, credentials_per_lot=5, queue_per_lot=3)
+        seeded = time.perf_counter()
+        print(f"📦 Создано {len(lot_ids)} лотов, 10000 логов, 6000 записей в очереди "
+              f"за {(seeded - started) * 1000:.0f} мс")
+
+        # Оплаченная запись обгоняет ожидающие
+        account_id = lot_ids[-1]
+        db.update_queue_payment_status(100002, account_id, f'inv-{account_id}-2', 'paid')
+        total = 0
+        for lot in lot_ids:
+            entries = db.process_queue_for_lot(lot)
+            assert len(entries) == 3
+            total += len(entries)
+        assert db.process_queue_for_lot(account_id)[0][1] == 100002
+        print(f"🔄 Обработано {total} записей очереди за {(time.perf_counter() - seeded) * 1000:.0f} мс")
+
+        assert db.mark_account_sold(lot_ids[0], 1, 1.0) == (True, f'lot{lot_ids[0]}-login0:pass', False)
+        assert db.count_available_credentials(lot_ids[0]) == 4
+        assert len(db.get_available_accounts()) == 2000
+        print("✅ Очередь и продажи работают на большом наборе данных")
+    finally:
+        db.close()
+
+def test_private_memory_database_rejected():
+    print("🧪 Проверка базы в памяти без cache=shared...")
+    # У каждого соединения была бы своя пустая база
+    for db_file in (':memory:', 'file::memory:', 'file:private?mode=memory'):
+        try:
+            Database(db_file)
+        except ValueError:
+            continue
+        raise AssertionError(f"{db_file} должен быть отклонён")
+    print("✅ Частные базы в памяти отклоняются")
 
 if __name__ == "__main__":
-    test_queue_system()
\ No newline at end of file
+    test_queue_system()
+    test_queue_system_at_scale()
+    test_private_memory_database_rejected()
\ No newline at end of file
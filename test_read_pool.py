@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки пула соединений только для чтения.
+"""
+
+import os
+import sys
+import sqlite3
+import threading
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.database import Database
+
+
+def test_read_pool():
+    db_file = 'test_read_pool.db'
+    db = Database(db_file, read_pool_size=2)
+    try:
+        print("🧪 Тестирование пула чтения...")
+
+        account_id = db.add_account("Pool lot", 5.0)
+        db.add_credential(account_id, "login1:pass")
+
+        # 1. Соединения переиспользуются и видят свежие записи
+        assert db.count_available_credentials(account_id) == 1
+        db.add_credential(account_id, "login2:pass")
+        assert db.count_available_credentials(account_id) == 2
+        stats = db.read_pool_stats()
+        assert stats['opened'] == 1 and stats['reused'] >= 1
+        print("✅ Соединение переиспользуется, новые записи видны сразу")
+
+        # 2. Соединения пула не могут писать; после ошибки соединение возвращается в пул
+        idle = db.read_pool_stats()['idle']
+        try:
+            with db._read_pool.connection() as conn:
+                conn.execute('BEGIN')
+                conn.execute('SELECT COUNT(*) FROM accounts').fetchone()
+                conn.execute('DELETE FROM accounts')
+            assert False, "ожидалась ошибка"
+        except sqlite3.OperationalError:
+            pass
+        assert db.read_pool_stats()['idle'] == idle and not conn.in_transaction
+        print("✅ Соединения пула только для чтения и возвращаются после ошибки")
+
+        # 3. Параллельное чтение из потоков во время записи
+        errors = []
+
+        def reader():
+            try:
+                for _ in range(50):
+                    assert db.get_account(account_id)[0] == account_id
+                    db.get_available_accounts()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=reader) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for i in range(20):
+            db.add_credential(account_id, f"extra{i}:pass")
+        for thread in threads:
+            thread.join()
+        assert not errors
+        assert db.count_available_credentials(account_id) == 22
+        assert db.read_pool_stats()['idle'] <= 2
+        print("✅ Потоки читают параллельно с записью")
+
+        print("\n✅ Тест пула чтения завершен!")
+    finally:
+        db.close()
+        os.remove(db_file)
+
+
+if __name__ == "__main__":
+    test_read_pool()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки отчётов в пуле процессов.
+"""
+
+import os
+import sys
+import csv
+import gzip
+import sqlite3
+import asyncio
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.database import Database
+from services.reports import ReportCancelled, ReportRunner
+
+
+def read_csv_gz(path):
+    with gzip.open(path, 'rt', encoding='utf-8', newline='') as f:
+        return list(csv.reader(f))
+
+
+async def run_reports(db_file, out_file):
+    runner = ReportRunner(db_file, timeout=30)
+    try:
+        lots = await runner.run('lots', out_file)
+        lots_rows = read_csv_gz(out_file)
+        links = await runner.run('links', out_file)
+        links_rows = read_csv_gz(out_file)
+
+        # Отмена запущенного отчёта
+        job_id = runner.submit('export', out_file, kind='orders')
+        assert runner.cancel(job_id)
+        try:
+            await runner.wait(job_id)
+            cancelled = None
+        except ReportCancelled as e:
+            cancelled = str(e)
+
+        # Отчёт, не уложившийся в отведённое время
+        runner.timeout = 0
+        try:
+            await runner.run('export', out_file, kind='orders')
+            timed_out = None
+        except ReportCancelled as e:
+            timed_out = str(e)
+        return lots, lots_rows, links, links_rows, cancelled, timed_out, runner.stats()
+    finally:
+        runner.close()
+
+
+def test_reports():
+    db_file = 'test_reports.db'
+    out_file = 'test_reports.csv.gz'
+    db = Database(db_file)
+    try:
+        print("🧪 Тестирование отчётов...")
+
+        lot_a = db.add_account("Report lot A", 5.0)
+        lot_b = db.add_account("Report lot B", 7.0)
+        db.add_credential(lot_a, "a0:pass")
+        db.add_credential(lot_a, "a1:pass")
+        db.add_credential(lot_b, "b0:pass")
+        db.mark_account_sold(lot_a, 111, 5.0, payment_type="crypto")
+        link = [("hash1", "https://www.tiktok.com/@u/video/1")]
+        db.create_gift_request_with_links(111, "buyer", link[0][1], link)
+        db.create_gift_request_with_links(222, "other", link[0][1], link)
+
+        # Много заказов, чтобы выгрузка шла достаточно долго для отмены
+        conn = sqlite3.connect(db_file)
+        conn.executemany('INSERT INTO orders (user_id, account_id, price) VALUES (?, ?, ?)',
+                         [(1000 + i, lot_b, 7.0) for i in range(5000)])
+        conn.commit()
+        conn.close()
+
+        lots, lots_rows, links, links_rows, cancelled, timed_out, stats = asyncio.run(run_reports(db_file, out_file))
+
+        # 1. Статистика по всем лотам
+        assert lots == 2
+        header = lots_rows[0]
+        row_a = dict(zip(header, lots_rows[1]))
+        assert row_a['total_logs'] == '2' and row_a['sold_logs'] == '1' and row_a['available_logs'] == '1'
+        assert dict(zip(header, lots_rows[2]))['orders'] == '5000'
+        print("✅ Отчёт по лотам построен в отдельном процессе")
+
+        # 2. Аудит повторных ссылок
+        assert links == 1 and links_rows[1][0] == link[0][1] and links_rows[1][1] == '1'
+        print("✅ Аудит повторных ссылок построен")
+
+        # 3. Отмена и ограничение времени
+        assert cancelled == 'cancelled' and timed_out == 'timeout'
+        assert stats == {'running': 0, 'completed': 2, 'cancelled': 2, 'failed': 0}
+        print("✅ Отмена и таймаут прерывают отчёт")
+
+        # 4. Соединения отчётов только на чтение
+        reader = Database(db_file, read_only=True)
+        conn = reader._connect()
+        try:
+            conn.execute('DELETE FROM orders')
+            assert False, "ожидалась ошибка"
+        except sqlite3.OperationalError:
+            pass
+        finally:
+            conn.close()
+        print("✅ Отчёты не могут изменить базу")
+
+        print("\n✅ Тест отчётов завершен!")
+    finally:
+        db.close()
+        for path in (db_file, out_file):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+if __name__ == "__main__":
+    test_reports()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки агрегатов продаж по часам и дням.
+"""
+
+import os
+import sys
+import sqlite3
+from datetime import datetime, timezone
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.database import Database
+
+
+def test_sales_rollups():
+    db_file = 'test_rollups.db'
+    db = Database(db_file)
+    try:
+        print("🧪 Тестирование агрегатов продаж...")
+        lot_a = db.add_account("Lot A", 5.0)
+        lot_b = db.add_account("Lot B", 2.0)
+        for i in range(6):
+            db.add_credential(lot_a, f"a{i}:p")
+            db.add_credential(lot_b, f"b{i}:p")
+
+        for _ in range(3):
+            db.mark_account_sold(lot_a, 1, 5.0, payment_type="crypto")
+        db.mark_account_sold(lot_a, 2, 5.0, payment_type="rub")
+        db.mark_account_sold(lot_b, 3, 2.0)
+
+        # Вчерашний заказ попадает в свой день
+        conn = sqlite3.connect(db_file)
+        conn.execute("UPDATE orders SET timestamp = datetime('now', '-1 day') WHERE id = 1")
+        conn.commit()
+        conn.close()
+
+        assert db.refresh_sales_rollups() == 5
+        assert db.refresh_sales_rollups() == 0
+        print("✅ Заказы учитываются один раз по отметке последнего заказа")
+
+        today = db.get_sales_summary(datetime.now(timezone.utc).strftime('%Y-%m-%d'))
+        assert today['orders'] == 4 and today['revenue'] == 17.0
+        assert today['by_payment'] == {'crypto': {'orders': 2, 'revenue': 10.0},
+                                       'rub': {'orders': 1, 'revenue': 5.0},
+                                       'unknown': {'orders': 1, 'revenue': 2.0}}
+        assert [lot['name'] for lot in today['by_lot']] == ["Lot A", "Lot B"]
+
+        week = db.get_sales_summary('0000-00-00')
+        assert week['orders'] == 5 and week['units'] == 5 and week['revenue'] == 22.0
+        print("✅ Сводка за период читается из агрегатов")
+
+        # Новые продажи добавляются к существующим строкам
+        db.mark_account_sold(lot_b, 4, 2.0, payment_type="crypto")
+        assert db.refresh_sales_rollups() == 1
+        hourly = db.get_sales_summary('0000-00-00', hourly=True)
+        assert hourly['orders'] == 6 and hourly['by_payment']['crypto'] == {'orders': 4, 'revenue': 17.0}
+        print("✅ Инкрементальное обновление почасовых и дневных агрегатов")
+
+        print("\n✅ Тест агрегатов продаж завершен!")
+    finally:
+        db.close()
+        os.remove(db_file)
+
+
+if __name__ == "__main__":
+    test_sales_rollups()
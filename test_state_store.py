@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки хранилища эфемерного состояния (TTL + LRU).
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from services.state_store import StateStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_state_store_ttl_and_lru():
+    clock = FakeClock()
+    store = StateStore('test', max_entries=3, default_ttl=10, clock=clock)
+
+    print("🧪 Тестирование StateStore...")
+
+    # 1. Записи истекают по TTL
+    store.set("payment_1_1", {"invoice_id": "inv1"})
+    assert store.get("payment_1_1") == {"invoice_id": "inv1"}
+    clock.now = 11
+    assert store.get("payment_1_1") is None
+    assert store.stats()['expired'] == 1
+    print("✅ Записи истекают по TTL")
+
+    # 2. При превышении лимита вытесняется самая старая по использованию запись
+    store.set("a", 1)
+    store.set("b", 2)
+    store.set("c", 3)
+    store.get("a")
+    store.set("d", 4)
+    assert "b" not in store
+    assert "a" in store and "c" in store and "d" in store
+    assert store.stats()['evicted'] == 1
+    print("✅ LRU-вытеснение работает")
+
+    # 3. sweep() удаляет все истекшие записи и освобождает учтённую память
+    store.set("forever", 5, ttl=None)
+    clock.now = 100
+    assert store.sweep() == 2  # "c" был вытеснен при добавлении "forever"
+    assert len(store) == 1
+    stats = store.stats()
+    assert stats['size'] == 1 and stats['approx_bytes'] > 0
+    store.pop("forever")
+    assert store.stats()['approx_bytes'] == 0
+    print("✅ sweep() и учёт памяти работают")
+
+    # 4. Выборка по префиксу и пользовательские флаги
+    store.set("rub_order_1_2", {"username": "buyer"})
+    store.set("payment_1_2", {"invoice_id": "x"})
+    assert [k for k, _ in store.items(prefix="rub_order_")] == ["rub_order_1_2"]
+
+    flags = store.scope(42)
+    flags["awaiting_lot_data"] = True
+    assert flags.get("awaiting_lot_data") is True
+    assert store.scope(43).get("awaiting_lot_data") is None
+    assert flags.pop("awaiting_lot_data") is True
+    assert "awaiting_lot_data" not in flags
+    print("✅ Префиксы и флаги пользователей работают")
+
+    print("\n✅ Тест StateStore завершен!")
+
+
+if __name__ == "__main__":
+    test_state_store_ttl_and_lru()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки хранилищ: SQLite и движок в памяти должны вести себя одинаково.
+"""
+
+import os
+import re
+import sys
+import gzip
+import asyncio
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from database.memory import MemoryDatabase
+from database.storage import Storage, create_storage
+from services.db_writer import DatabaseWriter, DirectWriter
+from services.reports import ReportRunner
+
+_TIMESTAMP = re.compile(r'^\d{4}-\d{2}-\d{2}( \d{2}:\d{2}:\d{2})?$')
+
+
+def _mask_timestamps(value):
+    """Время записи у движков расходится на доли секунды — сравниваем без него"""
+    if isinstance(value, str) and _TIMESTAMP.match(value):
+        return '<ts>'
+    if isinstance(value, (list, tuple)):
+        return type(value)(_mask_timestamps(item) for item in value)
+    if isinstance(value, dict):
+        return {key: _mask_timestamps(item) for key, item in value.items()}
+    return value
+
+
+def run_scenario(db) -> list:
+    """Одинаковые операции для любого хранилища; возвращает все ответы по порядку"""
+    results = []
+    lot = db.add_account("Lot A", 10.0)
+    other = db.add_account("Lot B", 3.0)
+    for i in range(3):
+        db.add_credential(lot, f"a{i}:pass")
+    db.add_credential(other, "b0:pass")
+    results.append(db.get_available_accounts())
+
+    # Очередь: оплаченные раньше ожидающих, внутри — по времени постановки
+    db.add_to_purchase_queue(501, lot, 'crypto', 10.0, invoice_id='inv1')
+    db.add_to_purchase_queue(502, lot, 'rub', 10.0, price_rub=950, username='u502', invoice_id='inv2')
+    db.add_to_purchase_queue(503, lot, 'crypto', 10.0, invoice_id='inv3')
+    results.append(db.update_queue_payment_status(503, lot, 'inv3', 'paid'))
+    results.append(db.process_queue_for_lot(lot))
+    results.append(db.get_next_from_queue(lot))
+    results.append(db.get_queue_size(lot))
+    results.append(db.mark_queue_entry_fulfilled(1))
+    results.append(db.get_next_from_queue(lot))
+
+    # Продажи забирают логи по порядку, последний лог снимает лот с витрины
+    results.append(db.mark_account_sold(lot, 501, 10.0, delivery_kind='purchase',
+                                        delivery_payload={'n': 1}, payment_type='crypto'))
+    results.append(db.pop_next_credential(lot, 502))
+    results.append(db.mark_account_sold(lot, 503, 10.0, payment_type='rub'))
+    results.append(db.mark_account_sold(lot, 504, 10.0))
+    results.append(db.get_available_accounts())
+    results.append(db.count_available_credentials(lot))
+    results.append(db.get_lot_statistics(lot))
+    results.append(db.get_all_lots_statistics())
+    results.append(db.get_user_orders_page(501))
+    results.append(db.get_user_orders_page(501, before_order_id=1))
+
+    # Доставка из outbox
+    claimed = db.claim_due_deliveries()
+    results.append(claimed)
+    results.append(db.claim_due_deliveries())
+    results.append(db.reschedule_delivery(claimed[0]['id'], 'timeout', 0))
+    results.append(db.mark_delivery_failed(claimed[0]['id'], 'blocked'))
+    results.append(db.count_deliveries_by_status())
+    results.append(db.get_stuck_deliveries())
+    results.append(db.retry_failed_deliveries())
+    results.append(db.mark_delivery_sent(claimed[0]['id']))
+    results.append(db.count_deliveries_by_status())
+
+    # Заявки на подарки и повторные ссылки
+    results.append(db.create_gift_request_with_links(601, 'alice', 'l1\nl2', [('h1', 'u1'), ('h2', 'u2')]))
+    results.append(db.create_gift_request_with_links(601, 'alice', 'l3', [('h3', 'u3')]))
+    results.append(db.create_gift_request_with_links(602, 'bob', 'l1', [('h1', 'u1')]))
+    for user_id in range(603, 610):
+        db.create_gift_request_with_links(user_id, f'user{user_id}', 'x', [(f'h{user_id}', f'u{user_id}')])
+    results.append(db.get_gift_links(1))
+    db.save_gift_link_checks([(1, 'ok', None, 'https://final')])
+    results.append(db.get_gift_links(1))
+    results.append(db.get_pending_gift_requests_page(limit=3))
+    results.append(db.get_pending_gift_requests_page(after_id=3, limit=3))
+    results.append(db.get_pending_gift_requests_page(before_id=4, limit=3))
+    results.append(db.count_pending_gift_requests())
+    results.append(db.process_gift_request(2, 'approved', 1))
+    results.append(db.process_gift_requests_bulk('rejected', 1, first_id=5, last_id=6))
+    results.append(sorted(db.get_pending_gift_user_ids()))
+    results.append(db.get_pending_gift_requests())
+    results.append(db.get_gift_request(1))
+    results.append(list(db.iter_link_audit()))
+    results.append(db.save_gift('text', 'hello'))
+    results.append(db.save_gift('photo', 'pic', file_id='f1'))
+    results.append(db.get_current_gift())
+
+    # Пользователи и рассылки
+    db.upsert_users([(501, 'Buyer', 'B', '2024-01-01 00:00:00', '2024-01-01 00:00:00'),
+                     (502, None, 'C', '2024-01-01 00:00:00', '2099-01-01 00:00:00'),
+                     (700, 'idle', None, '2024-01-01 00:00:00', '2024-01-01 00:00:00')])
+    results.append(db.find_user_id_by_username('@buyer'))
+    results.append(db.count_users())
+    job = db.create_broadcast('buyers', lot, 1, 2, 99)
+    results.append(db.get_broadcast(job))
+    results.append(db.get_broadcast_recipients(db.get_broadcast(job), 2))
+    db.checkpoint_broadcast(job, 502, 1, 0, [502])
+    results.append(db.get_broadcast_recipients(db.get_broadcast(job), 10))
+    results.append(db.create_broadcast('all', None, 1, 3, 99))
+    results.append(db.set_broadcast_status(job, 'done'))
+    results.append(db.set_broadcast_status(job, 'running'))
+    results.append(db.get_broadcasts())
+    results.append(db.get_broadcasts(status='running'))
+
+    # Агрегаты продаж, выгрузки, медиа
+    results.append(db.refresh_sales_rollups())
+    results.append(db.refresh_sales_rollups())
+    results.append(db.get_sales_summary('2000-01-01'))
+    results.append(list(db.iter_export('orders', account_id=lot)))
+    results.append(list(db.iter_export('credentials', date_from='2000-01-01')))
+    results.append(list(db.iter_export('queue')))
+    results.append(list(db.iter_lot_report()))
+    db.save_media_file_id('logo', 'sig1', 'file1')
+    results.append(db.get_media_file_id('logo', 'sig1'))
+    results.append(db.get_media_file_id('logo', 'sig2'))
+    results.append(db.forget_media_file_id('logo'))
+    results.append(db.update_account_price(other, 4.0))
+    results.append(db.delete_account(other))
+    results.append(db.get_account(other))
+    return results
+
+
+def test_backends_behave_the_same():
+    print("🧪 Сравнение SQLite и хранилища в памяти...")
+    db_file = 'test_storage_backends.db'
+    sqlite_db = create_storage('sqlite', db_file)
+    memory_db = create_storage('memory')
+    try:
+        assert isinstance(sqlite_db, Storage) and isinstance(memory_db, Storage)
+        expected = _mask_timestamps(run_scenario(sqlite_db))
+        actual = _mask_timestamps(run_scenario(memory_db))
+        for step, (want, got) in enumerate(zip(expected, actual)):
+            assert want == got, f"шаг {step}: {want!r} != {got!r}"
+        assert len(expected) == len(actual)
+        print(f"✅ {len(expected)} ответов совпадают")
+
+        # Общие методы обслуживания: писатель, счётчики, снимок (для SQLite — пустая операция)
+        assert isinstance(sqlite_db.create_writer(), DatabaseWriter)
+        assert sqlite_db.stats()['backend'] == 'sqlite' and 'opened' in sqlite_db.stats()
+        assert sqlite_db.snapshot_path is None and sqlite_db.snapshot() == 0
+        print("✅ Писатель, счётчики и снимки доступны через общий интерфейс")
+    finally:
+        sqlite_db.close()
+        if os.path.exists(db_file):
+            os.remove(db_file)
+
+
+def test_memory_snapshot_and_writer():
+    print("🧪 Снимок хранилища в памяти и запись без транзакций...")
+    snapshot_path = 'test_storage.snapshot'
+    try:
+        db = MemoryDatabase(snapshot_path)
+        lot = db.add_account("Snap lot", 1.0)
+        writer = db.create_writer()
+        assert isinstance(writer, DirectWriter)
+
+        async def write():
+            for i in range(3):
+                await writer.add_credential(lot, f"s{i}:pass")
+            await writer.add_to_purchase_queue(1, lot, 'crypto', 1.0, invoice_id='i1')
+            return await writer.mark_account_sold(lot, 1, 1.0)
+
+        assert asyncio.run(write()) == (True, 's0:pass', False)
+        assert writer.stats()['writes'] == 5
+        assert db.stats()['backend'] == 'memory' and db.stats()['rows'] > 0
+        db.close()
+        assert db.stats()['snapshots'] == 1
+        assert os.path.exists(snapshot_path)
+
+        # После загрузки снимка индексы восстановлены
+        restored = MemoryDatabase(snapshot_path)
+        assert restored.count_available_credentials(lot) == 2
+        assert restored.get_next_from_queue(lot)[0] == 1
+        assert restored.mark_account_sold(lot, 2, 1.0) == (True, 's1:pass', False)
+        assert restored.add_account("Next lot", 1.0) == lot + 1
+        print("✅ Снимок сохраняет данные и счётчики id")
+    finally:
+        if os.path.exists(snapshot_path):
+            os.remove(snapshot_path)
+
+
+def test_memory_reports_run_on_threads():
+    print("🧪 Отчёты по хранилищу в памяти...")
+    db = MemoryDatabase()
+    lot = db.add_account("Report lot", 2.0)
+    for i in range(5):
+        db.add_credential(lot, f"r{i}:pass")
+        db.mark_account_sold(lot, 100 + i, 2.0)
+    runner = ReportRunner(db.db_file, storage=db)
+    out_path = 'test_storage_report.csv.gz'
+    try:
+        rows = asyncio.run(runner.run('export', out_path, kind='orders'))
+        assert rows == 5
+        with gzip.open(out_path, 'rt', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        assert lines[0].startswith('id,timestamp,user_id')
+        assert len(lines) == 6
+        assert runner.stats()['completed'] == 1
+        print("✅ Выгрузка построена в потоке по копии строк")
+    finally:
+        runner.close()
+        if os.path.exists(out_path):
+            os.remove(out_path)
+
+
+if __name__ == "__main__":
+    test_backends_behave_the_same()
+    test_memory_snapshot_and_writer()
+    test_memory_reports_run_on_threads()